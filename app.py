@@ -3,18 +3,39 @@
 
 import os
 import re
-import hashlib
+import base64
 import json
+import threading
+import time
+import click
+from concurrent.futures import TimeoutError as AppendTimeoutError
 from datetime import datetime, timedelta
-from decimal import Decimal
+from types import MappingProxyType
+from decimal import Decimal, ROUND_HALF_UP
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, bindparam, case, event, func, inspect, null, or_, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import selectinload
+from sqlalchemy.exc import IntegrityError
 from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
 from marshmallow import Schema, fields, validate, ValidationError
 from email_validator import validate_email, EmailNotValidError
 from dotenv import load_dotenv
+from append_queue import GroupCommitQueue, AppendQueueFullError
+from block_hashing import calculate_block_hash, verify_block_hash, CURRENT_HASH_VERSION, HASH_VERSION_JSON, GENESIS_PREVIOUS_HASH
+from chain_head import ChainHeadCache, ChainHeadConflictError
+from iva_plan import compile_iva_plan, distribute_with_plan, plan_distribution_rows_batch, distribute_batch_cents, to_cents, CENTS
+from response_cache import ResponseCache, create_backend
+from search_index import InvoiceSearchIndex
+from merkle import merkle_root, merkle_proof
+from metrics import registry, timed, COUNT_BUCKETS
+from password_policy import PasswordPolicy, PasswordHasher, PasswordHasherBusyError, DEFAULT_PASSWORD_HASH_METHOD
+from login_activity import LoginActivityBuffer
+from identity_cache import IdentityCache
+from rate_limit import RateLimiter, create_rate_limit_backend, parse_rate
+from job_runner import JobRunner
 
 # Cargar variables de entorno
 load_dotenv()
@@ -28,12 +49,117 @@ app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'jwt-secret-change-in
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///xlerion_blockchain.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['RESPONSE_CACHE_BACKEND'] = os.getenv('RESPONSE_CACHE_BACKEND', 'memory')
+app.config['RESPONSE_CACHE_DIR'] = os.getenv('RESPONSE_CACHE_DIR')
+app.config['RESPONSE_CACHE_TTL'] = int(os.getenv('RESPONSE_CACHE_TTL', 30))
+app.config['APPEND_QUEUE_MAX_BATCH'] = int(os.getenv('APPEND_QUEUE_MAX_BATCH', 256))
+app.config['APPEND_QUEUE_MAX_LINGER_MS'] = float(os.getenv('APPEND_QUEUE_MAX_LINGER_MS', 2))
+app.config['APPEND_QUEUE_MAX_DEPTH'] = int(os.getenv('APPEND_QUEUE_MAX_DEPTH', 10000))
+app.config['APPEND_QUEUE_TIMEOUT'] = float(os.getenv('APPEND_QUEUE_TIMEOUT', 30))
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')  # Si se define, /metrics exige "Authorization: Bearer <token>"
+app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', DEFAULT_PASSWORD_HASH_METHOD)  # p. ej. pbkdf2:sha256:600000
+app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 32))
+app.config['PASSWORD_HASH_TIMEOUT'] = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+app.config['LOGIN_ACTIVITY_FLUSH_INTERVAL'] = float(os.getenv('LOGIN_ACTIVITY_FLUSH_INTERVAL', 1))  # Segundos entre escrituras por lote
+app.config['LOGIN_ACTIVITY_MAX_PENDING'] = int(os.getenv('LOGIN_ACTIVITY_MAX_PENDING', 500))
+app.config['LAST_LOGIN_RESOLUTION'] = int(os.getenv('LAST_LOGIN_RESOLUTION', 60))  # Segundos; más seguido no se reescribe last_login
+app.config['IDENTITY_CACHE_TTL'] = int(os.getenv('IDENTITY_CACHE_TTL', 30))  # Segundos que otros procesos tardan en ver un cambio de rol
+app.config['RATE_LIMIT_ENABLED'] = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() != 'false'
+app.config['RATE_LIMIT_BACKEND'] = os.getenv('RATE_LIMIT_BACKEND', 'memory')  # 'sqlite' comparte las cubetas entre workers
+app.config['RATE_LIMIT_DB'] = os.getenv('RATE_LIMIT_DB')
+# Presupuestos por usuario y ruta en formato capacidad/segundos
+app.config['RATE_LIMIT_WRITE'] = parse_rate(os.getenv('RATE_LIMIT_WRITE', '120/60'))
+app.config['RATE_LIMIT_SEARCH'] = parse_rate(os.getenv('RATE_LIMIT_SEARCH', '30/60'))
+app.config['RATE_LIMIT_VALIDATE'] = parse_rate(os.getenv('RATE_LIMIT_VALIDATE', '6/60'))
+app.config['VALIDATION_MAX_CONCURRENT'] = int(os.getenv('VALIDATION_MAX_CONCURRENT', 2))  # Validaciones completas simultáneas en todos los workers
+app.config['AUDIT_MAX_WORKERS'] = int(os.getenv('AUDIT_MAX_WORKERS', 8))  # Procesos de una auditoría paralela (además, uno por CPU)
+app.config['AUDIT_MAX_PARTITIONS'] = int(os.getenv('AUDIT_MAX_PARTITIONS', 256))  # Rangos de id de una auditoría paralela
+app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 2))  # Hilos que ejecutan trabajos de fondo en cada proceso
+app.config['JOB_PROGRESS_INTERVAL'] = float(os.getenv('JOB_PROGRESS_INTERVAL', 0.5))  # Segundos entre escrituras del avance
+app.config['JOB_RETENTION_HOURS'] = int(os.getenv('JOB_RETENTION_HOURS', 24))
+app.config['JOB_HEARTBEAT_INTERVAL'] = float(os.getenv('JOB_HEARTBEAT_INTERVAL', 10))  # Un trabajo sin latido en 3 intervalos se da por interrumpido
 
 # Inicializar extensiones
 db = SQLAlchemy(app)
 jwt = JWTManager(app)
 CORS(app, origins=['http://localhost:3000', 'http://127.0.0.1:5500', 'http://localhost:5500'])
 
+# Métricas de las rutas calientes (exportadas en /metrics; ver la sección INSTRUMENTACIÓN)
+http_request_seconds = registry.histogram(
+    'xlerion_http_request_seconds', 'Latencia de las solicitudes HTTP por ruta', ('method', 'route', 'status')
+)
+db_queries_per_request = registry.histogram(
+    'xlerion_db_queries_per_request', 'Consultas SQL por solicitud HTTP', ('route',), buckets=COUNT_BUCKETS
+)
+db_query_seconds_per_request = registry.histogram(
+    'xlerion_db_query_seconds_per_request', 'Tiempo en consultas SQL por solicitud HTTP', ('route',)
+)
+db_queries_total = registry.counter('xlerion_db_queries_total', 'Consultas SQL ejecutadas por el proceso')
+db_query_seconds_total = registry.counter('xlerion_db_query_seconds_total', 'Tiempo total en consultas SQL')
+function_seconds = registry.histogram(
+    'xlerion_function_seconds', 'Latencia de las funciones instrumentadas', ('function',)
+)
+
+# Hash de contraseñas en un pool acotado: un exceso de inicios de sesión responde 503 en lugar de
+# ocupar los workers que atienden las demás rutas
+password_hasher = PasswordHasher(
+    PasswordPolicy(app.config['PASSWORD_HASH_METHOD']),
+    max_workers=app.config['PASSWORD_HASH_WORKERS'],
+    max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+    timeout=app.config['PASSWORD_HASH_TIMEOUT']
+)
+
+def write_login_activity(rows):
+    """Aplica en una transacción los intentos fallidos, bloqueos y últimos accesos acumulados
+
+    Cada fila se actualiza en forma relativa, como LoginActivityBuffer.apply(): los intentos se
+    suman a los de la fila y el bloqueo y el último acceso solo avanzan, así que los lotes de
+    varios workers se acumulan en lugar de sobrescribirse.
+    """
+    users = User.__table__
+    reset = bindparam('reset', type_=db.Boolean)
+    failed_delta = bindparam('failed_delta', type_=db.Integer)
+    lock_at = bindparam('lock_at', type_=db.DateTime)
+    new_last_login = bindparam('new_last_login', type_=db.DateTime)
+    
+    failed_attempts = case((reset, 0), else_=func.coalesce(users.c.failed_login_attempts, 0)) + failed_delta
+    locked_until = case((reset, null()), else_=users.c.locked_until)
+    # Orden explícito: MySQL evalúa cada asignación con los valores ya asignados a su izquierda
+    statement = users.update().where(users.c.id == bindparam('user_id')).ordered_values(
+        ('locked_until', case(
+            (and_(failed_delta > 0, failed_attempts >= login_activity.max_failed_attempts,
+                  or_(locked_until.is_(None), locked_until < lock_at)), lock_at),
+            else_=locked_until
+        )),
+        ('failed_login_attempts', failed_attempts),
+        ('last_login', case(
+            (or_(users.c.last_login.is_(None), users.c.last_login < new_last_login), new_last_login),
+            else_=users.c.last_login
+        ))
+    )
+    with app.app_context():
+        db.session.execute(statement, [
+            {
+                'user_id': user_id,
+                'reset': changes.reset,
+                'failed_delta': changes.failed_delta,
+                'lock_at': changes.lock_at,
+                'new_last_login': changes.last_login
+            }
+            for user_id, changes in rows
+        ])
+        db.session.commit()
+
+# Actividad de inicio de sesión con escritura diferida: el bloqueo se decide con la fila más los
+# cambios pendientes y la base de datos recibe un lote por intervalo en lugar de un commit por intento
+login_activity = LoginActivityBuffer(
+    write_login_activity,
+    last_login_resolution=timedelta(seconds=app.config['LAST_LOGIN_RESOLUTION']),
+    flush_interval=app.config['LOGIN_ACTIVITY_FLUSH_INTERVAL'],
+    max_pending=app.config['LOGIN_ACTIVITY_MAX_PENDING']
+)
+
 # =========================================================
 # MODELOS DE BASE DE DATOS
 # =========================================================
@@ -57,36 +183,44 @@ class User(db.Model):
     # Relación con facturas
     invoices = db.relationship('Invoice', backref='user', lazy=True)
     
+    @timed(function_seconds.labels('set_password'))
     def set_password(self, password):
-        """Genera hash seguro de la contraseña"""
-        self.password_hash = generate_password_hash(password)
+        """Genera hash seguro de la contraseña con la política vigente"""
+        self.password_hash = password_hasher.hash(password)
     
+    @timed(function_seconds.labels('check_password'))
     def check_password(self, password):
         """Verifica la contraseña contra el hash"""
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+    
+    def upgrade_password_hash(self, password):
+        """Rehace el hash si fue generado con parámetros anteriores (sin confirmar la sesión)"""
+        if not password_hasher.needs_rehash(self.password_hash):
+            return False
+        try:
+            self.set_password(password)
+        except PasswordHasherBusyError:
+            return False  # Se reintenta en el próximo inicio de sesión
+        return True
+    
+    def _persisted_login_state(self):
+        return (self.failed_login_attempts, self.locked_until, self.last_login)
     
     def is_locked(self):
-        """Verifica si la cuenta está bloqueada"""
-        if self.locked_until and self.locked_until > datetime.utcnow():
-            return True
-        return False
+        """Verifica si la cuenta está bloqueada (la fila más los intentos aún no escritos)"""
+        return login_activity.is_locked(self.id, self._persisted_login_state())
     
     def increment_failed_attempts(self):
-        """Incrementa intentos fallidos y bloquea si es necesario"""
-        self.failed_login_attempts += 1
-        if self.failed_login_attempts >= 5:
-            self.locked_until = datetime.utcnow() + timedelta(minutes=30)
-        db.session.commit()
+        """Incrementa intentos fallidos y bloquea si es necesario (se escribe en el próximo lote)"""
+        login_activity.record_failure(self.id, self._persisted_login_state())
     
     def reset_failed_attempts(self):
-        """Resetea intentos fallidos después de login exitoso"""
-        self.failed_login_attempts = 0
-        self.locked_until = None
-        self.last_login = datetime.utcnow()
-        db.session.commit()
+        """Resetea intentos fallidos después de login exitoso (se escribe en el próximo lote)"""
+        login_activity.record_success(self.id, self._persisted_login_state())
     
     def to_dict(self):
         """Convierte el usuario a diccionario (sin contraseña)"""
+        last_login = login_activity.state(self.id, self._persisted_login_state()).last_login
         return {
             'id': self.id,
             'username': self.username,
@@ -95,12 +229,17 @@ class User(db.Model):
             'role': self.role,
             'is_active': self.is_active,
             'created_at': self.created_at.isoformat(),
-            'last_login': self.last_login.isoformat() if self.last_login else None
+            'last_login': last_login.isoformat() if last_login else None
         }
 
 class Invoice(db.Model):
     """Modelo de factura para el blockchain"""
     __tablename__ = 'invoices'
+    __table_args__ = (
+        # Paginación keyset del ledger y de los listados por usuario (más recientes primero)
+        db.Index('ix_invoices_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_invoices_user_timestamp_id', 'user_id', 'timestamp', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     invoice_number = db.Column(db.String(100), unique=True, nullable=False, index=True)
@@ -113,13 +252,20 @@ class Invoice(db.Model):
     previous_hash = db.Column(db.String(64))
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # Esquema con el que se calculó block_hash (1 = JSON heredado, 2 = binario canónico)
+    hash_version = db.Column(db.SmallInteger, nullable=False, default=CURRENT_HASH_VERSION,
+                             server_default=str(HASH_VERSION_JSON))
     
     # Distribución del IVA
     distribution_data = db.relationship('IVADistribution', backref='invoice', lazy=True, cascade='all, delete-orphan')
     
-    def to_dict(self):
-        """Convierte la factura a diccionario"""
-        return {
+    def to_dict(self, fields=None, include_distribution=True):
+        """Convierte la factura a diccionario
+
+        fields limita los campos del encabezado (None = todos) e include_distribution indica si
+        se agrega la distribución del IVA, lo único que requiere cargar la relación.
+        """
+        data = {
             'id': self.id,
             'invoice_number': self.invoice_number,
             'company_name': self.company_name,
@@ -131,8 +277,16 @@ class Invoice(db.Model):
             'previous_hash': self.previous_hash,
             'timestamp': self.timestamp.isoformat(),
             'user_id': self.user_id,
-            'distribution': [dist.to_dict() for dist in self.distribution_data]
+            'hash_version': self.hash_version
         }
+        
+        if fields is not None:
+            data = {name: data[name] for name in fields}
+        
+        if include_distribution:
+            data['distribution'] = [dist.to_dict() for dist in self.distribution_data]
+        
+        return data
 
 class IVADistribution(db.Model):
     """Modelo para la distribución del IVA por sectores"""
@@ -158,6 +312,70 @@ class IVADistribution(db.Model):
             'subsector_amount': float(self.subsector_amount) if self.subsector_amount else None
         }
 
+class ChainCheckpoint(db.Model):
+    """Punto de control de la última validación exitosa del blockchain"""
+    __tablename__ = 'chain_checkpoints'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    block_id = db.Column(db.Integer, nullable=False)
+    block_hash = db.Column(db.String(64), nullable=False)
+    verified_blocks = db.Column(db.Integer, nullable=False, default=0)
+    verified_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def to_dict(self):
+        """Convierte el punto de control a diccionario"""
+        return {
+            'block_id': self.block_id,
+            'block_hash': self.block_hash,
+            'verified_blocks': self.verified_blocks,
+            'verified_at': self.verified_at.isoformat()
+        }
+
+class ChainHead(db.Model):
+    """Cabeza de la cadena: fila única con el último bloque anexado (compare-and-swap)"""
+    __tablename__ = 'chain_head'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    block_id = db.Column(db.Integer, nullable=False)
+    block_hash = db.Column(db.String(64), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class LedgerTotal(db.Model):
+    """Totales acumulados del ledger (global, por sector y por subsector) en centavos enteros"""
+    __tablename__ = 'ledger_totals'
+    __table_args__ = (db.UniqueConstraint('scope', 'sector', 'subsector', name='uq_ledger_totals_key'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(20), nullable=False)
+    sector = db.Column(db.String(100), nullable=False, default='')
+    subsector = db.Column(db.String(200), nullable=False, default='')
+    row_count = db.Column(db.BigInteger, nullable=False, default=0)
+    amount_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    iva_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class MerkleRange(db.Model):
+    """Raíz de Merkle sellada de un rango fijo de ids de factura (ver MERKLE_RANGE_SIZE)"""
+    __tablename__ = 'merkle_ranges'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # Número de rango
+    first_block_id = db.Column(db.Integer, nullable=False)
+    last_block_id = db.Column(db.Integer, nullable=False)
+    leaf_count = db.Column(db.Integer, nullable=False)
+    root_hash = db.Column(db.String(64), nullable=False)
+    sealed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def to_dict(self):
+        """Convierte el rango sellado a diccionario"""
+        return {
+            'range': self.id,
+            'first_block_id': self.first_block_id,
+            'last_block_id': self.last_block_id,
+            'leaf_count': self.leaf_count,
+            'root_hash': self.root_hash,
+            'sealed_at': self.sealed_at.isoformat()
+        }
+
 # =========================================================
 # CONFIGURACIÓN DE DISTRIBUCIÓN DEL IVA
 # =========================================================
@@ -220,6 +438,29 @@ IVA_DISTRIBUTION_CONFIG = {
     }
 }
 
+# Plan precompilado de la distribución (ver refresh_iva_plan)
+IVA_PLAN = compile_iva_plan(IVA_DISTRIBUTION_CONFIG)
+
+# Identificador de la fila de cabeza de la cadena
+CHAIN_HEAD_ID = 1
+
+# Facturas por rango del árbol de Merkle (el rango r cubre los ids r * tamaño + 1 .. (r + 1) * tamaño)
+MERKLE_RANGE_SIZE = 1024
+
+# Alcances de los totales acumulados del ledger
+TOTALS_GLOBAL = 'global'
+TOTALS_SECTOR = 'sector'
+TOTALS_SUBSECTOR = 'subsector'
+
+# Campos del encabezado de una factura que se pueden proyectar con ?fields=
+INVOICE_FIELDS = (
+    'id', 'invoice_number', 'company_name', 'company_nit', 'subtotal', 'iva_amount',
+    'total_amount', 'block_hash', 'previous_hash', 'timestamp', 'user_id', 'hash_version'
+)
+
+# Relaciones que se pueden agregar a los listados de facturas con ?include=
+INVOICE_INCLUDES = ('distribution',)
+
 # =========================================================
 # ESQUEMAS DE VALIDACIÓN
 # =========================================================
@@ -281,62 +522,769 @@ def sanitize_input(text):
     
     return text.strip()
 
-def calculate_hash(data):
-    """Calcula el hash SHA-256 de los datos"""
-    json_string = json.dumps(data, sort_keys=True, default=str)
-    return hashlib.sha256(json_string.encode()).hexdigest()
+def parse_invoice_projection():
+    """Lee ?fields= e ?include= de la solicitud y retorna (campos, incluir_distribución)
+
+    Sin parámetros se retorna la factura completa con su distribución. Con ?fields= solo se
+    retornan los campos pedidos, y la distribución solo si se pide en fields o en ?include=.
+    """
+    fields_arg = request.args.get('fields')
+    include_arg = request.args.get('include')
+    
+    if fields_arg is None and include_arg is None:
+        return None, True
+    
+    fields = None
+    include_distribution = False
+    
+    if fields_arg is not None:
+        fields = [name.strip() for name in fields_arg.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in INVOICE_FIELDS + INVOICE_INCLUDES]
+        if unknown:
+            raise ValueError(f'Campos desconocidos: {", ".join(unknown)}')
+        include_distribution = 'distribution' in fields
+        fields = [name for name in fields if name in INVOICE_FIELDS]
+    
+    if include_arg is not None:
+        includes = [name.strip() for name in include_arg.split(',') if name.strip()]
+        unknown = [name for name in includes if name not in INVOICE_INCLUDES]
+        if unknown:
+            raise ValueError(f'Relaciones desconocidas: {", ".join(unknown)}')
+        include_distribution = include_distribution or 'distribution' in includes
+    
+    return fields, include_distribution
 
-def get_previous_hash():
-    """Obtiene el hash del último bloque"""
+def with_distributions(query, include_distribution=True):
+    """Carga las distribuciones de todas las facturas de la consulta en una sola consulta extra"""
+    if include_distribution:
+        return query.options(selectinload(Invoice.distribution_data))
+    return query
+
+def encode_cursor(invoice):
+    """Codifica la posición (timestamp, id) de una factura como cursor opaco"""
+    raw = json.dumps([invoice.timestamp.isoformat(), invoice.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decodifica un cursor opaco y retorna (timestamp, id)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, invoice_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(invoice_id)
+    except (ValueError, TypeError):
+        raise ValueError('Cursor de paginación inválido')
+
+def paginate_invoices(query, per_page, count_total=None):
+    """Pagina una consulta de facturas, de la más reciente a la más antigua
+
+    Con ?page= se conserva la paginación por OFFSET; en otro caso se pagina por keyset sobre
+    (timestamp, id) a partir de ?cursor=, sin OFFSET y con costo constante en páginas profundas.
+    ?with_total=false omite el COUNT(*) de la consulta filtrada. count_total, si se indica,
+    calcula el total sin contar filas (por ejemplo, desde los totales del ledger).
+    Retorna (facturas, datos de paginación).
+    """
+    with_total = request.args.get('with_total', 'true').lower() not in ('false', '0', 'no')
+    query = query.order_by(Invoice.timestamp.desc(), Invoice.id.desc())
+    
+    if 'page' in request.args:
+        page = request.args.get('page', 1, type=int)
+        invoices = query.paginate(page=page, per_page=per_page, error_out=False,
+                                  count=with_total and count_total is None)
+        if with_total and count_total is not None:
+            invoices.total = count_total()
+        
+        return invoices.items, {
+            'page': page,
+            'per_page': per_page,
+            'total': invoices.total,
+            'pages': invoices.pages if with_total else None,
+            'has_next': invoices.has_next if with_total else len(invoices.items) == per_page,
+            'has_prev': invoices.has_prev
+        }
+    
+    cursor = request.args.get('cursor')
+    pagination = {'per_page': per_page, 'cursor': cursor}
+    
+    if with_total:
+        pagination['total'] = count_total() if count_total is not None else query.order_by(None).count()
+    
+    if cursor:
+        timestamp, invoice_id = decode_cursor(cursor)
+        # (timestamp, id) < cursor, con una cota simple sobre timestamp para recorrer el índice
+        query = query.filter(and_(
+            Invoice.timestamp <= timestamp,
+            or_(Invoice.timestamp < timestamp, Invoice.id < invoice_id)
+        ))
+    
+    # Una fila extra indica si existe una página siguiente sin contar
+    invoices = query.limit(per_page + 1).all()
+    has_next = len(invoices) > per_page
+    invoices = invoices[:per_page]
+    
+    pagination['has_next'] = has_next
+    pagination['next_cursor'] = encode_cursor(invoices[-1]) if has_next else None
+    
+    return invoices, pagination
+
+def count_ledger_blocks():
+    """Retorna el número de bloques del ledger desde los totales materializados"""
+    return db.session.query(LedgerTotal.row_count)\
+                     .filter_by(scope=TOTALS_GLOBAL, sector='', subsector='')\
+                     .scalar() or 0
+
+def load_chain_head():
+    """Lee el hash de la cabeza de la cadena, creando la fila de cabeza si aún no existe"""
+    block_hash = db.session.query(ChainHead.block_hash).filter_by(id=CHAIN_HEAD_ID).scalar()
+    if block_hash is not None:
+        return block_hash
+    
+    # Primera ejecución sobre un ledger existente: la cabeza es el último bloque
     last_invoice = Invoice.query.order_by(Invoice.id.desc()).first()
-    return last_invoice.block_hash if last_invoice else "0000000000000000000000000000000000000000000000000000000000000000"
+    block_hash = last_invoice.block_hash if last_invoice else GENESIS_PREVIOUS_HASH
+    db.session.add(ChainHead(
+        id=CHAIN_HEAD_ID,
+        block_id=last_invoice.id if last_invoice else 0,
+        block_hash=block_hash
+    ))
+    
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Otro proceso creó la fila al mismo tiempo
+        db.session.rollback()
+        block_hash = db.session.query(ChainHead.block_hash).filter_by(id=CHAIN_HEAD_ID).scalar()
+    
+    return block_hash
+
+def advance_chain_head(previous_hash, block_id, block_hash):
+    """Mueve la cabeza al nuevo bloque solo si aún apunta a previous_hash (compare-and-swap)"""
+    result = db.session.execute(
+        db.update(ChainHead)
+          .where(ChainHead.id == CHAIN_HEAD_ID, ChainHead.block_hash == previous_hash)
+          .values(block_id=block_id, block_hash=block_hash, updated_at=datetime.utcnow())
+          .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+# Cabeza de la cadena en memoria compartida por todas las rutas que anexan bloques
+chain_head = ChainHeadCache(load_chain_head)
+
+# Caché de respuestas de los endpoints de lectura, versionada por la cabeza de la cadena
+response_cache = ResponseCache(
+    create_backend(app.config['RESPONSE_CACHE_BACKEND'], app.config['RESPONSE_CACHE_DIR']),
+    load_chain_head,
+    default_ttl=app.config['RESPONSE_CACHE_TTL']
+)
+chain_head.subscribe(response_cache.set_version)
+
+# Índice de búsqueda por subcadena de las facturas (FTS5 trigram en SQLite, pg_trgm en PostgreSQL)
+invoice_search = InvoiceSearchIndex(Invoice.__table__)
+
+# Campos de User cuyo cambio invalida la identidad en caché
+USER_IDENTITY_FIELDS = ('username', 'email', 'full_name', 'role', 'is_active')
+
+def load_user_identity(user_id):
+    """Datos públicos del usuario (User.to_dict) de solo lectura, o None si ya no existe"""
+    user = User.query.get(user_id)
+    return MappingProxyType(user.to_dict()) if user else None
+
+# Identidad del JWT -> datos del usuario, para no consultar users en cada solicitud autenticada
+identity_cache = IdentityCache(load_user_identity, ttl=app.config['IDENTITY_CACHE_TTL'])
+
+def defer_identity_invalidation(user):
+    """Anota al usuario en su sesión para descartar su identidad en caché al confirmar el commit"""
+    inspect(user).session.info.setdefault('invalidated_identities', set()).add(user.id)
+
+@event.listens_for(User, 'after_update')
+def invalidate_updated_identity(mapper, connection, user):
+    """Descarta la identidad en caché cuando cambian su rol, su estado o sus datos públicos"""
+    state = inspect(user)
+    if any(state.attrs[field].history.has_changes() for field in USER_IDENTITY_FIELDS):
+        defer_identity_invalidation(user)
+
+@event.listens_for(User, 'after_delete')
+def invalidate_deleted_identity(mapper, connection, user):
+    defer_identity_invalidation(user)
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_committed_identities(session):
+    """Invalida tras el commit: durante el flush otra solicitud aún leería y guardaría la fila vieja"""
+    for user_id in session.info.pop('invalidated_identities', ()):
+        identity_cache.invalidate(user_id)
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_rolled_back_identities(session):
+    session.info.pop('invalidated_identities', None)
+
+def current_user_identity():
+    """Datos del usuario autenticado desde la caché de identidades (None si ya no existe)"""
+    return identity_cache.get(get_jwt_identity())
+
+# Cubetas de tokens por usuario y ruta (429 con Retry-After al agotar el presupuesto)
+rate_limiter = RateLimiter(
+    create_rate_limit_backend(app.config['RATE_LIMIT_BACKEND'], app.config['RATE_LIMIT_DB']),
+    enabled=app.config['RATE_LIMIT_ENABLED']
+)
 
+def get_app_engine():
+    """Motor de la base de datos de la aplicación, utilizable fuera de un contexto de aplicación"""
+    with app.app_context():
+        return db.engine
+
+# Trabajos de fondo (validaciones de la cadena) en la tabla jobs de la base de datos de la aplicación
+job_runner = JobRunner(
+    get_app_engine,
+    max_workers=app.config['JOB_WORKERS'],
+    progress_interval=app.config['JOB_PROGRESS_INTERVAL'],
+    retention=timedelta(hours=app.config['JOB_RETENTION_HOURS']),
+    heartbeat_interval=app.config['JOB_HEARTBEAT_INTERVAL']
+)
+
+# Páginas del ledger que se sirven desde la caché (las que consultan los dashboards)
+LEDGER_CACHED_PAGES = 5
+
+def is_cached_ledger_page():
+    """Indica si la página solicitada del ledger se sirve desde la caché"""
+    if request.args.get('cursor'):
+        return False
+    return request.args.get('page', 1, type=int) <= LEDGER_CACHED_PAGES
+
+def refresh_iva_plan():
+    """Recompila el plan de distribución después de modificar IVA_DISTRIBUTION_CONFIG"""
+    global IVA_PLAN
+    IVA_PLAN = compile_iva_plan(IVA_DISTRIBUTION_CONFIG)
+    response_cache.invalidate()
+    return IVA_PLAN
+
+def current_iva_plan():
+    """Plan de distribución vigente; los demás módulos lo leen aquí porque refresh_iva_plan lo reemplaza"""
+    return IVA_PLAN
+
+@timed(function_seconds.labels('distribute_iva'))
 def distribute_iva(iva_amount):
-    """Distribuye el IVA según la configuración establecida"""
-    distributions = []
-    remaining_percentage = 1.0
+    """Distribuye el IVA según el plan precompilado de la configuración establecida"""
+    return distribute_with_plan(IVA_PLAN, iva_amount)
+
+def insert_distribution_rows(rows):
+    """Inserta filas de distribución con un único executemany de Core, sin la unidad de trabajo del ORM"""
+    if rows:
+        db.session.execute(IVADistribution.__table__.insert(), rows)
+
+# =========================================================
+# TOTALES ACUMULADOS DEL LEDGER
+# =========================================================
+
+# Claves de ledger_totals que ya existen en la base de datos (confirmadas)
+_known_ledger_total_keys = set()
+
+def ledger_total_keys(plan):
+    """Claves (alcance, sector, subsector) de los totales que mantiene un plan de distribución"""
+    keys = {(TOTALS_GLOBAL, '', '')}
+    for entry in plan:
+        if entry.subsector:
+            keys.add((TOTALS_SUBSECTOR, entry.sector, entry.subsector))
+        else:
+            keys.add((TOTALS_SECTOR, entry.sector, ''))
+    return keys
+
+def ensure_ledger_total_keys(keys):
+    """Crea en la transacción actual las filas de totales que aún no existen"""
+    if keys <= _known_ledger_total_keys:
+        return
+    
+    existing = {tuple(row) for row in db.session.query(LedgerTotal.scope, LedgerTotal.sector, LedgerTotal.subsector)}
+    _known_ledger_total_keys.update(existing)
+    
+    missing = keys - existing
+    if missing:
+        db.session.execute(LedgerTotal.__table__.insert(), [
+            {'scope': scope, 'sector': sector, 'subsector': subsector, 'row_count': 0,
+             'amount_cents': 0, 'iva_cents': 0, 'updated_at': datetime.utcnow()}
+            for scope, sector, subsector in sorted(missing)
+        ])
+
+def apply_ledger_totals(plan, iva_amounts, total_amounts):
+    """Acumula facturas recién anexadas en ledger_totals, dentro de la transacción del anexado"""
+    ensure_ledger_total_keys(ledger_total_keys(plan))
+    
+    count = len(iva_amounts)
+    deltas = [{
+        'key_scope': TOTALS_GLOBAL, 'key_sector': '', 'key_subsector': '', 'delta_rows': count,
+        'delta_amount': sum(to_cents(amount) for amount in total_amounts),
+        'delta_iva': sum(to_cents(amount) for amount in iva_amounts)
+    }]
+    
+    for entry, (sector_cents, subsector_cents) in zip(plan, distribute_batch_cents(plan, iva_amounts)):
+        if entry.subsector:
+            key = (TOTALS_SUBSECTOR, entry.sector, entry.subsector)
+            amount = sum(subsector_cents)
+        else:
+            key = (TOTALS_SECTOR, entry.sector, '')
+            amount = sum(sector_cents)
+        deltas.append({
+            'key_scope': key[0], 'key_sector': key[1], 'key_subsector': key[2],
+            'delta_rows': count, 'delta_amount': amount, 'delta_iva': 0
+        })
+    
+    table = LedgerTotal.__table__
+    db.session.execute(
+        table.update()
+             .where(table.c.scope == bindparam('key_scope'),
+                    table.c.sector == bindparam('key_sector'),
+                    table.c.subsector == bindparam('key_subsector'))
+             .values(row_count=table.c.row_count + bindparam('delta_rows'),
+                     amount_cents=table.c.amount_cents + bindparam('delta_amount'),
+                     iva_cents=table.c.iva_cents + bindparam('delta_iva'),
+                     updated_at=datetime.utcnow()),
+        deltas
+    )
+
+def read_ledger_totals():
+    """Lee los totales materializados (una fila por sector y subsector)"""
+    return {
+        (total.scope, total.sector, total.subsector): {
+            'row_count': total.row_count,
+            'amount_cents': total.amount_cents,
+            'iva_cents': total.iva_cents
+        }
+        for total in LedgerTotal.query.all()
+    }
+
+def compute_ledger_totals():
+    """Calcula los totales desde las tablas vivas (recorrido completo, solo para reconstrucción)"""
+    invoice_count, iva_cents, amount_cents = db.session.query(
+        func.count(Invoice.id),
+        func.sum(func.round(Invoice.iva_amount * 100)),
+        func.sum(func.round(Invoice.total_amount * 100))
+    ).one()
+    totals = {(TOTALS_GLOBAL, '', ''): {
+        'row_count': invoice_count,
+        'amount_cents': int(amount_cents or 0),
+        'iva_cents': int(iva_cents or 0)
+    }}
+    
+    sector_rows = db.session.query(
+        IVADistribution.sector,
+        func.count(IVADistribution.id),
+        func.sum(func.round(IVADistribution.amount * 100))
+    ).filter(IVADistribution.subsector.is_(None))\
+     .group_by(IVADistribution.sector)
+    for sector, row_count, cents in sector_rows:
+        totals[(TOTALS_SECTOR, sector, '')] = {'row_count': row_count, 'amount_cents': int(cents or 0), 'iva_cents': 0}
+    
+    subsector_rows = db.session.query(
+        IVADistribution.sector,
+        IVADistribution.subsector,
+        func.count(IVADistribution.id),
+        func.sum(func.round(IVADistribution.subsector_amount * 100))
+    ).filter(IVADistribution.subsector.isnot(None))\
+     .group_by(IVADistribution.sector, IVADistribution.subsector)
+    for sector, subsector, row_count, cents in subsector_rows:
+        totals[(TOTALS_SUBSECTOR, sector, subsector)] = {'row_count': row_count, 'amount_cents': int(cents or 0), 'iva_cents': 0}
+    
+    return totals
+
+def verify_ledger_totals(materialized, live):
+    """Compara los totales materializados con los vivos y retorna las diferencias"""
+    empty = {'row_count': 0, 'amount_cents': 0, 'iva_cents': 0}
+    mismatches = []
     
-    for sector, config in IVA_DISTRIBUTION_CONFIG.items():
-        sector_percentage = config["percentage"]
-        sector_amount = iva_amount * Decimal(str(sector_percentage))
+    for key in sorted(set(materialized) | set(live)):
+        stored = materialized.get(key, empty)
+        actual = live.get(key, empty)
         
-        # Distribución principal del sector
-        distributions.append({
+        if stored != actual:
+            mismatches.append({'scope': key[0], 'sector': key[1], 'subsector': key[2],
+                               'materialized': stored, 'live': actual})
+    
+    return mismatches
+
+def write_ledger_totals(totals):
+    """Reemplaza los totales materializados actualizando las filas en su lugar"""
+    empty = {'row_count': 0, 'amount_cents': 0, 'iva_cents': 0}
+    ensure_ledger_total_keys(set(totals))
+    
+    for total in LedgerTotal.query.all():
+        values = totals.get((total.scope, total.sector, total.subsector), empty)
+        total.row_count = values['row_count']
+        total.amount_cents = values['amount_cents']
+        total.iva_cents = values['iva_cents']
+        total.updated_at = datetime.utcnow()
+    
+    db.session.commit()
+
+def summarize_ledger_totals():
+    """Construye las estadísticas generales y por sector a partir de los totales materializados"""
+    totals = read_ledger_totals()
+    general = totals.get((TOTALS_GLOBAL, '', ''), {'row_count': 0, 'amount_cents': 0, 'iva_cents': 0})
+    total_invoices = general['row_count']
+    total_iva = Decimal(general['iva_cents']).scaleb(-2)
+    total_amount = Decimal(general['amount_cents']).scaleb(-2)
+    
+    general_stats = {
+        'total_invoices': total_invoices,
+        'total_iva_collected': float(total_iva),
+        'total_amount_processed': float(total_amount),
+        'average_invoice_amount': float(total_amount / total_invoices) if total_invoices > 0 else 0
+    }
+    
+    sector_distribution = [
+        {
             'sector': sector,
-            'percentage': sector_percentage,
-            'amount': sector_amount,
-            'subsector': None,
-            'subsector_percentage': None,
-            'subsector_amount': None
-        })
+            'total_amount': float(Decimal(values['amount_cents']).scaleb(-2)),
+            'transaction_count': values['row_count'],
+            'percentage': float(Decimal(values['amount_cents']).scaleb(-2) / total_iva * 100) if total_iva > 0 else 0
+        }
+        for (scope, sector, _), values in sorted(totals.items())
+        if scope == TOTALS_SECTOR and values['row_count'] > 0
+    ]
+    
+    return general_stats, sector_distribution
+
+# =========================================================
+# ANEXADO AGRUPADO DE FACTURAS (GROUP COMMIT)
+# =========================================================
+
+class InvoiceNumberConflictError(Exception):
+    """El número de factura ya existe en el ledger o se repite dentro del mismo grupo"""
+
+@timed(function_seconds.labels('write_invoice_group'))
+def write_invoice_group(items):
+    """Registra un grupo de facturas encoladas en una sola transacción (tarea escritora)
+
+    Cada elemento trae los campos ya validados de la factura, su user_id y el plan de
+    distribución vigente al encolarla. Retorna, alineado con items, {'id', 'block_hash'} de
+    cada factura registrada o la excepción que la rechazó.
+    """
+    with app.app_context():
+        results = [None] * len(items)
         
-        # Distribución por subsectores
-        for subsector, sub_percentage in config["breakdown"].items():
-            subsector_amount = sector_amount * Decimal(str(sub_percentage))
-            distributions.append({
-                'sector': sector,
-                'percentage': sector_percentage,
-                'amount': sector_amount,
-                'subsector': subsector,
-                'subsector_percentage': sub_percentage,
-                'subsector_amount': subsector_amount
-            })
-        
-        remaining_percentage -= sector_percentage
-    
-    # Distribución del porcentaje restante a "Otros"
-    if remaining_percentage > 0:
-        other_amount = iva_amount * Decimal(str(remaining_percentage))
-        distributions.append({
-            'sector': 'Otros',
-            'percentage': remaining_percentage,
-            'amount': other_amount,
-            'subsector': None,
-            'subsector_percentage': None,
-            'subsector_amount': None
-        })
+        # Números repetidos entre solicitudes del mismo grupo
+        accepted = []
+        group_numbers = set()
+        for position, item in enumerate(items):
+            if item['invoice_number'] in group_numbers:
+                results[position] = InvoiceNumberConflictError(item['invoice_number'])
+                continue
+            group_numbers.add(item['invoice_number'])
+            accepted.append(position)
+        
+        def reject_registered():
+            """Rechaza las facturas cuyo número ya está registrado (una consulta IN) y retorna cuántas"""
+            registered = {
+                row.invoice_number for row in db.session.query(Invoice.invoice_number)
+                                                 .filter(Invoice.invoice_number.in_(
+                                                     [items[position]['invoice_number'] for position in accepted]
+                                                 ))
+            }
+            for position in accepted:
+                if items[position]['invoice_number'] in registered:
+                    results[position] = InvoiceNumberConflictError(items[position]['invoice_number'])
+            accepted[:] = [position for position in accepted if items[position]['invoice_number'] not in registered]
+            return len(registered)
+        
+        if accepted:
+            reject_registered()
+        written = []
+        
+        def write_group(previous_hash):
+            """Encadena los hashes del grupo en memoria y lo escribe con inserciones masivas"""
+            head_hash = previous_hash
+            invoice_rows = []
+            
+            for position in accepted:
+                item = items[position]
+                row = {
+                    'invoice_number': item['invoice_number'],
+                    'company_name': item['company_name'],
+                    'company_nit': item['company_nit'],
+                    'subtotal': item['subtotal'],
+                    'iva_amount': item['iva_amount'],
+                    'total_amount': item['total_amount'],
+                    'previous_hash': previous_hash,
+                    'timestamp': datetime.utcnow(),
+                    'user_id': int(item['user_id']),
+                    'hash_version': CURRENT_HASH_VERSION
+                }
+                row['block_hash'] = calculate_block_hash(row)
+                invoice_rows.append(row)
+                previous_hash = row['block_hash']
+            
+            db.session.execute(Invoice.__table__.insert(), invoice_rows)
+            invoice_ids = dict(
+                db.session.query(Invoice.invoice_number, Invoice.id)
+                          .filter(Invoice.invoice_number.in_([row['invoice_number'] for row in invoice_rows]))
+            )
+            
+            # Mover la cabeza de la cadena una sola vez para todo el grupo (compare-and-swap)
+            if not advance_chain_head(head_hash, invoice_ids[invoice_rows[-1]['invoice_number']], previous_hash):
+                db.session.rollback()
+                return None
+            
+            # Distribuir el IVA por plan (normalmente todo el grupo comparte el mismo)
+            by_plan = {}
+            for position in accepted:
+                by_plan.setdefault(id(items[position]['plan']), []).append(items[position])
+            for plan_items in by_plan.values():
+                plan = plan_items[0]['plan']
+                iva_amounts = [item['iva_amount'] for item in plan_items]
+                insert_distribution_rows(plan_distribution_rows_batch(
+                    plan, [invoice_ids[item['invoice_number']] for item in plan_items], iva_amounts
+                ))
+                apply_ledger_totals(plan, iva_amounts, [item['total_amount'] for item in plan_items])
+            
+            db.session.commit()
+            
+            written[:] = [{'id': invoice_ids[row['invoice_number']], 'block_hash': row['block_hash']}
+                          for row in invoice_rows]
+            return previous_hash
+        
+        while accepted:
+            try:
+                chain_head.append(write_group)
+                break
+            except IntegrityError:
+                # Otra solicitud registró alguno de los números entre la verificación y la escritura:
+                # solo esas facturas se rechazan y el resto del grupo se reintenta
+                db.session.rollback()
+                if not reject_registered():
+                    raise
+        
+        for position, result in zip(accepted, written):
+            results[position] = result
+        return results
+
+# Cola de anexado: create_invoice encola y una sola tarea escritora confirma por grupos
+invoice_appends = GroupCommitQueue(
+    write_invoice_group,
+    max_batch_size=app.config['APPEND_QUEUE_MAX_BATCH'],
+    max_linger=app.config['APPEND_QUEUE_MAX_LINGER_MS'] / 1000,
+    max_depth=app.config['APPEND_QUEUE_MAX_DEPTH'],
+    name='invoice-append-writer'
+)
+
+def append_invoice(item):
+    """Encola una factura validada y espera a que su grupo se confirme; retorna {'id', 'block_hash'}"""
+    future = invoice_appends.submit(item)
+    
+    # Devolver la conexión de la solicitud al pool antes de esperar: la tarea escritora usa el
+    # mismo pool y, con todas las conexiones retenidas por solicitudes en espera, no avanzaría
+    db.session.close()
     
-    return distributions
+    return future.result(timeout=app.config['APPEND_QUEUE_TIMEOUT'])
+
+# =========================================================
+# RANGOS DE MERKLE Y PRUEBAS DE INCLUSIÓN
+# =========================================================
+
+# Siguiente rango sin sellar conocido por este proceso (None = aún no consultado)
+_next_merkle_range = None
+
+def merkle_range_bounds(range_number):
+    """Primer y último id de factura cubiertos por un rango"""
+    return range_number * MERKLE_RANGE_SIZE + 1, (range_number + 1) * MERKLE_RANGE_SIZE
+
+def load_range_block_hashes(range_number):
+    """Ids y hashes de los bloques de un rango en orden de la cadena (recorrido por clave primaria)"""
+    first_id, last_id = merkle_range_bounds(range_number)
+    return db.session.query(Invoice.id, Invoice.block_hash)\
+                     .filter(Invoice.id.between(first_id, last_id))\
+                     .order_by(Invoice.id.asc())\
+                     .all()
+
+def seal_merkle_ranges():
+    """Persiste la raíz de cada rango completo que aún no está sellado; retorna cuántos selló
+
+    Un rango está completo cuando existe una factura con id posterior a su último id: los
+    anexados se serializan con el compare-and-swap de la cabeza, así que los ids confirmados
+    crecen en el orden de la cadena y ningún bloque nuevo cae en un rango ya completo.
+    """
+    global _next_merkle_range
+    
+    complete_ranges = (db.session.query(func.max(Invoice.id)).scalar() or 0) // MERKLE_RANGE_SIZE
+    if _next_merkle_range is None:
+        last_sealed = db.session.query(func.max(MerkleRange.id)).scalar()
+        _next_merkle_range = 0 if last_sealed is None else last_sealed + 1
+    
+    sealed = 0
+    while _next_merkle_range < complete_ranges:
+        range_number = _next_merkle_range
+        rows = load_range_block_hashes(range_number)
+        
+        if rows:
+            first_id, last_id = merkle_range_bounds(range_number)
+            db.session.add(MerkleRange(
+                id=range_number,
+                first_block_id=first_id,
+                last_block_id=last_id,
+                leaf_count=len(rows),
+                root_hash=merkle_root([row.block_hash for row in rows])
+            ))
+            try:
+                db.session.commit()
+                sealed += 1
+            except IntegrityError:
+                # Otro proceso selló el mismo rango
+                db.session.rollback()
+        
+        _next_merkle_range = range_number + 1
+    
+    return sealed
+
+def seal_merkle_ranges_after_append(block_hash):
+    """Listener de chain_head: sella los rangos que completó el anexado recién confirmado"""
+    try:
+        seal_merkle_ranges()
+    except Exception as e:
+        # El anexado ya está confirmado; el rango se sellará en el siguiente anexado
+        db.session.rollback()
+        print(f"Error al sellar los rangos de Merkle: {e}")
+
+chain_head.subscribe(seal_merkle_ranges_after_append)
+
+def build_inclusion_proof(invoice):
+    """Construye la prueba de inclusión de una factura en la raíz de Merkle de su rango
+
+    Para un rango sellado la raíz es la persistida; consistent indica si coincide con la
+    recalculada desde los bloques actuales (False revela bloques alterados tras el sellado).
+    Para el rango abierto la raíz se calcula sobre los bloques anexados hasta ahora.
+    """
+    range_number = (invoice.id - 1) // MERKLE_RANGE_SIZE
+    block_hashes = [row.block_hash for row in load_range_block_hashes(range_number)]
+    position = block_hashes.index(invoice.block_hash)
+    computed_root = merkle_root(block_hashes)
+    sealed_range = MerkleRange.query.get(range_number)
+    
+    return {
+        'range': range_number,
+        'sealed': sealed_range is not None,
+        'root_hash': sealed_range.root_hash if sealed_range else computed_root,
+        'consistent': sealed_range is None or sealed_range.root_hash == computed_root,
+        'leaf_count': len(block_hashes),
+        'leaf_position': position,
+        'proof': merkle_proof(block_hashes, position)
+    }
+
+def verify_merkle_ranges():
+    """Recalcula las raíces de todos los rangos sellados; retorna los que no coinciden"""
+    mismatches = []
+    for merkle_range in MerkleRange.query.order_by(MerkleRange.id.asc()).all():
+        block_hashes = [row.block_hash for row in load_range_block_hashes(merkle_range.id)]
+        root_hash = merkle_root(block_hashes) if block_hashes else None
+        if root_hash != merkle_range.root_hash:
+            mismatches.append({'range': merkle_range.id, 'sealed_root': merkle_range.root_hash, 'live_root': root_hash})
+    return mismatches
+
+# =========================================================
+# INSTRUMENTACIÓN
+# =========================================================
+
+# Acumuladores de la solicitud en curso en cada hilo (las consultas de la tarea escritora
+# solo cuentan en los totales del proceso)
+_request_metrics = threading.local()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started_at = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query_metrics(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_started_at
+    db_queries_total.inc()
+    db_query_seconds_total.inc(elapsed)
+    if getattr(_request_metrics, 'active', False):
+        _request_metrics.queries += 1
+        _request_metrics.query_seconds += elapsed
+
+@app.before_request
+def start_request_metrics():
+    _request_metrics.active = True
+    _request_metrics.started_at = time.perf_counter()
+    _request_metrics.queries = 0
+    _request_metrics.query_seconds = 0.0
+
+@app.after_request
+def record_request_metrics(response):
+    """Observa la latencia y las consultas de la solicitud
+
+    En las respuestas en streaming la latencia llega hasta que se entrega la respuesta, no
+    hasta que termina el cuerpo.
+    """
+    if getattr(_request_metrics, 'active', False):
+        _request_metrics.active = False
+        route = request.url_rule.rule if request.url_rule else 'sin_ruta'
+        http_request_seconds.labels(request.method, route, response.status_code)\
+                            .observe(time.perf_counter() - _request_metrics.started_at)
+        db_queries_per_request.labels(route).observe(_request_metrics.queries)
+        db_query_seconds_per_request.labels(route).observe(_request_metrics.query_seconds)
+    return response
+
+registry.callback(
+    'xlerion_append_queue_depth', 'Facturas en cola esperando su grupo',
+    lambda: invoice_appends.stats()['queue_depth']
+)
+registry.callback(
+    'xlerion_append_queue_items_total', 'Facturas procesadas por la cola de anexado',
+    lambda: {result: invoice_appends.stats()[result] for result in ('committed', 'rejected')},
+    kind='counter', labelnames=('result',)
+)
+registry.callback(
+    'xlerion_append_queue_groups_total', 'Grupos confirmados por la tarea escritora',
+    lambda: invoice_appends.stats()['groups'], kind='counter'
+)
+def append_queue_commit_quantiles():
+    """Percentiles recientes de la latencia de confirmación de la cola de anexado, en segundos"""
+    latency = invoice_appends.stats()['commit_latency_ms']
+    return {
+        quantile: latency[key] / 1000 if latency[key] is not None else None
+        for quantile, key in (('0.5', 'p50'), ('0.99', 'p99'))
+    }
+
+registry.callback(
+    'xlerion_append_queue_commit_seconds', 'Latencia reciente de confirmación de un grupo',
+    append_queue_commit_quantiles, labelnames=('quantile',)
+)
+registry.callback(
+    'xlerion_password_hash_pending', 'Hashes de contraseña en curso o en espera en el pool',
+    lambda: password_hasher.stats()['pending']
+)
+registry.callback(
+    'xlerion_password_hash_tasks_total', 'Tareas del pool de hash de contraseñas por resultado',
+    lambda: {result: password_hasher.stats()[result] for result in ('completed', 'rejected', 'timed_out')},
+    kind='counter', labelnames=('result',)
+)
+registry.callback(
+    'xlerion_login_activity_pending_writes', 'Usuarios con actividad de inicio de sesión sin escribir',
+    lambda: login_activity.stats()['pending_writes']
+)
+registry.callback(
+    'xlerion_login_activity_flushed_rows_total', 'Filas de users escritas por el buffer de inicio de sesión',
+    lambda: login_activity.stats()['flushed_rows'], kind='counter'
+)
+registry.callback(
+    'xlerion_identity_cache_lookups_total', 'Búsquedas de la identidad del JWT por resultado',
+    lambda: {result: identity_cache.stats()[result] for result in ('hits', 'misses')},
+    kind='counter', labelnames=('result',)
+)
+registry.callback(
+    'xlerion_rate_limit_requests_total', 'Solicitudes evaluadas por el limitador de tasa',
+    lambda: {(scope, result): count for scope, counters in rate_limiter.stats().items()
+             for result, count in counters.items()},
+    kind='counter', labelnames=('scope', 'result')
+)
+registry.callback(
+    'xlerion_jobs_running', 'Trabajos de fondo en ejecución en este proceso',
+    lambda: job_runner.stats()['running']
+)
+registry.callback(
+    'xlerion_jobs_finished_total', 'Trabajos de fondo terminados por estado',
+    lambda: {status: job_runner.stats()[status] for status in ('completed', 'failed', 'cancelled')},
+    kind='counter', labelnames=('status',)
+)
+registry.callback(
+    'xlerion_db_pool_connections_in_use', 'Conexiones del pool de SQLAlchemy prestadas',
+    lambda: db.engine.pool.checkedout()
+)
 
 # =========================================================
 # ENDPOINTS DE LA API
@@ -409,6 +1357,9 @@ def register_user():
         
     except ValidationError as e:
         return jsonify({'error': 'Datos inválidos', 'details': e.messages}), 400
+    except PasswordHasherBusyError:
+        db.session.rollback()
+        return jsonify({'error': 'Hay demasiados registros en curso, intente nuevamente'}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Error interno del servidor'}), 500
@@ -436,8 +1387,11 @@ def login_user():
                 'error': 'Cuenta bloqueada por múltiples intentos fallidos. Intente más tarde.'
             }), 423
         
-        # Verificar contraseña
-        if not user.check_password(password):
+        # Verificar contraseña; la sesión suelta su conexión mientras el pool de hash trabaja
+        db.session.close()
+        password_valid = user.check_password(password)
+        db.session.add(user)
+        if not password_valid:
             user.increment_failed_attempts()
             return jsonify({'error': 'Credenciales inválidas'}), 401
         
@@ -445,7 +1399,9 @@ def login_user():
         if not user.is_active:
             return jsonify({'error': 'Cuenta desactivada'}), 403
         
-        # Login exitoso
+        # Login exitoso: solo se confirma si cambió el hash; la actividad va en el próximo lote
+        if user.upgrade_password_hash(password):
+            db.session.commit()
         user.reset_failed_attempts()
         access_token = create_access_token(identity=user.id)
         
@@ -457,6 +1413,8 @@ def login_user():
         
     except ValidationError as e:
         return jsonify({'error': 'Datos inválidos', 'details': e.messages}), 400
+    except PasswordHasherBusyError:
+        return jsonify({'error': 'Hay demasiados inicios de sesión en curso, intente nuevamente'}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': 'Error interno del servidor'}), 500
 
@@ -465,15 +1423,23 @@ def login_user():
 def get_profile():
     """Obtiene el perfil del usuario autenticado"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        identity = current_user_identity()
         
-        if not user:
+        if not identity:
             return jsonify({'error': 'Usuario no encontrado'}), 404
         
+        # last_login puede estar más al día en el buffer de inicio de sesión que en la caché
+        profile = dict(identity)
+        last_login = login_activity.state(identity['id'], (0, None, None)).last_login
+        if last_login:
+            profile['last_login'] = last_login.isoformat()
+        
+        # COUNT sobre ix_invoices_user_timestamp_id en lugar de cargar todas las facturas
+        invoice_count = db.session.query(func.count(Invoice.id)).filter(Invoice.user_id == identity['id']).scalar()
+        
         return jsonify({
-            'user': user.to_dict(),
-            'invoice_count': len(user.invoices)
+            'user': profile,
+            'invoice_count': invoice_count
         }), 200
         
     except Exception as e:
@@ -481,6 +1447,7 @@ def get_profile():
 
 @app.route('/invoices', methods=['POST'])
 @jwt_required()
+@rate_limiter.limit(app.config['RATE_LIMIT_WRITE'], scope='invoices_write')
 def create_invoice():
     """Crea una nueva factura y la registra en el blockchain"""
     try:
@@ -488,18 +1455,16 @@ def create_invoice():
         schema = InvoiceSchema()
         data = schema.load(request.json)
         
-        # Obtener usuario actual
+        # Obtener usuario actual (desde la caché de identidades)
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user:
+        if not current_user_identity():
             return jsonify({'error': 'Usuario no encontrado'}), 404
         
         # Sanitizar entradas
         invoice_number = sanitize_input(data['invoice_number'])
         company_name = sanitize_input(data['company_name'])
         company_nit = sanitize_input(data['company_nit'])
-        subtotal = Decimal(str(data['subtotal']))
+        subtotal = Decimal(str(data['subtotal'])).quantize(CENTS, rounding=ROUND_HALF_UP)
         
         # Verificar que el número de factura no exista
         existing_invoice = Invoice.query.filter_by(invoice_number=invoice_number).first()
@@ -507,149 +1472,101 @@ def create_invoice():
             return jsonify({'error': 'El número de factura ya existe'}), 409
         
         # Calcular IVA (19%)
-        iva_amount = subtotal * Decimal('0.19')
+        # Se redondea a centavos para que el hash coincida con lo que persiste la columna Numeric(15, 2)
+        iva_amount = (subtotal * Decimal('0.19')).quantize(CENTS, rounding=ROUND_HALF_UP)
         total_amount = subtotal + iva_amount
         
-        # Obtener hash del bloque anterior
-        previous_hash = get_previous_hash()
+        # Calcular distribución del IVA (no depende de la posición en la cadena)
+        distributions = distribute_iva(iva_amount)
         
-        # Crear datos del bloque
-        block_data = {
+        # Encolar la factura: la tarea escritora enlaza su hash y la confirma junto con su grupo
+        result = append_invoice({
             'invoice_number': invoice_number,
             'company_name': company_name,
             'company_nit': company_nit,
-            'subtotal': float(subtotal),
-            'iva_amount': float(iva_amount),
-            'total_amount': float(total_amount),
-            'timestamp': datetime.utcnow().isoformat(),
-            'previous_hash': previous_hash,
-            'user_id': user_id
-        }
-        
-        # Calcular hash del bloque
-        block_hash = calculate_hash(block_data)
-        
-        # Crear factura
-        invoice = Invoice(
-            invoice_number=invoice_number,
-            company_name=company_name,
-            company_nit=company_nit,
-            subtotal=subtotal,
-            iva_amount=iva_amount,
-            total_amount=total_amount,
-            block_hash=block_hash,
-            previous_hash=previous_hash,
-            user_id=user_id
-        )
-        
-        db.session.add(invoice)
-        db.session.flush()  # Para obtener el ID de la factura
-        
-        # Calcular y guardar distribución del IVA
-        distributions = distribute_iva(iva_amount)
-        
-        for dist in distributions:
-            iva_dist = IVADistribution(
-                invoice_id=invoice.id,
-                sector=dist['sector'],
-                percentage=Decimal(str(dist['percentage'])),
-                amount=dist['amount'],
-                subsector=dist['subsector'],
-                subsector_percentage=Decimal(str(dist['subsector_percentage'])) if dist['subsector_percentage'] else None,
-                subsector_amount=dist['subsector_amount']
-            )
-            db.session.add(iva_dist)
-        
-        db.session.commit()
+            'subtotal': subtotal,
+            'iva_amount': iva_amount,
+            'total_amount': total_amount,
+            'user_id': user_id,
+            'plan': IVA_PLAN
+        })
+        invoice = Invoice.query.get(result['id'])
         
         return jsonify({
             'message': 'Factura registrada exitosamente en el blockchain',
             'invoice': invoice.to_dict(),
-            'block_hash': block_hash,
+            'block_hash': result['block_hash'],
             'distributions': distributions
         }), 201
         
     except ValidationError as e:
         return jsonify({'error': 'Datos inválidos', 'details': e.messages}), 400
+    except InvoiceNumberConflictError:
+        return jsonify({'error': 'El número de factura ya existe'}), 409
+    except ChainHeadConflictError:
+        db.session.rollback()
+        return jsonify({'error': 'La cadena cambió durante el registro, intente nuevamente'}), 409
+    except AppendQueueFullError:
+        return jsonify({'error': 'Hay demasiadas facturas en cola, intente nuevamente'}), 503
+    except AppendTimeoutError:
+        return jsonify({'error': 'La factura sigue en cola de registro, consulte más tarde'}), 503
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Error interno del servidor', 'details': str(e)}), 500
 
 @app.route('/blockchain/ledger', methods=['GET'])
 @jwt_required()
+@response_cache.cached(when=is_cached_ledger_page)
 def get_blockchain_ledger():
     """Obtiene el ledger completo del blockchain con paginación"""
     try:
-        page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
         
         # Limitar per_page
         per_page = min(per_page, 100)
         
-        invoices = Invoice.query.order_by(Invoice.timestamp.desc())\
-                               .paginate(page=page, per_page=per_page, error_out=False)
+        # Proyección opcional: solo se cargan las distribuciones si se van a retornar
+        fields, include_distribution = parse_invoice_projection()
+        
+        # El total del ledger se lee de los totales materializados, sin COUNT(*)
+        invoices, pagination = paginate_invoices(
+            with_distributions(Invoice.query, include_distribution), per_page, count_total=count_ledger_blocks
+        )
         
         ledger_blocks = []
-        for invoice in invoices.items:
-            block_data = invoice.to_dict()
-            block_data['is_valid'] = True  # Simplificado para esta demo
+        for invoice in invoices:
+            block_data = invoice.to_dict(fields, include_distribution)
+            block_data['is_valid'] = verify_block_hash(invoice)
             ledger_blocks.append(block_data)
         
         return jsonify({
             'ledger': ledger_blocks,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': invoices.total,
-                'pages': invoices.pages,
-                'has_next': invoices.has_next,
-                'has_prev': invoices.has_prev
-            }
+            'pagination': pagination
         }), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Error interno del servidor'}), 500
 
 @app.route('/blockchain/stats', methods=['GET'])
 @jwt_required()
+@response_cache.cached()
 def get_blockchain_stats():
-    """Obtiene estadísticas del blockchain"""
+    """Obtiene estadísticas del blockchain a partir de los totales acumulados del ledger"""
     try:
-        # Estadísticas generales
-        total_invoices = Invoice.query.count()
-        total_iva = db.session.query(db.func.sum(Invoice.iva_amount)).scalar() or 0
-        total_amount = db.session.query(db.func.sum(Invoice.total_amount)).scalar() or 0
-        
-        # Estadísticas por sector
-        sector_stats = db.session.query(
-            IVADistribution.sector,
-            db.func.sum(IVADistribution.amount).label('total_amount'),
-            db.func.count(IVADistribution.id).label('count')
-        ).filter(IVADistribution.subsector.is_(None))\
-         .group_by(IVADistribution.sector)\
-         .all()
+        # Estadísticas generales y por sector (lectura O(#sectores) de ledger_totals)
+        general_stats, sector_distribution = summarize_ledger_totals()
         
         # Últimas transacciones
-        recent_invoices = Invoice.query.order_by(Invoice.timestamp.desc())\
+        recent_invoices = with_distributions(Invoice.query)\
+                                      .order_by(Invoice.timestamp.desc())\
                                       .limit(5)\
                                       .all()
         
         return jsonify({
-            'general_stats': {
-                'total_invoices': total_invoices,
-                'total_iva_collected': float(total_iva),
-                'total_amount_processed': float(total_amount),
-                'average_invoice_amount': float(total_amount / total_invoices) if total_invoices > 0 else 0
-            },
-            'sector_distribution': [
-                {
-                    'sector': stat.sector,
-                    'total_amount': float(stat.total_amount),
-                    'transaction_count': stat.count,
-                    'percentage': float(stat.total_amount / total_iva * 100) if total_iva > 0 else 0
-                }
-                for stat in sector_stats
-            ],
+            'general_stats': general_stats,
+            'sector_distribution': sector_distribution,
             'recent_transactions': [invoice.to_dict() for invoice in recent_invoices],
             'distribution_config': IVA_DISTRIBUTION_CONFIG
         }), 200
@@ -657,6 +1574,50 @@ def get_blockchain_stats():
     except Exception as e:
         return jsonify({'error': 'Error interno del servidor'}), 500
 
+@app.route('/blockchain/append-queue/stats', methods=['GET'])
+@jwt_required()
+def get_append_queue_stats():
+    """Profundidad de la cola de anexado, tamaño de los grupos y latencias de confirmación"""
+    return jsonify(invoice_appends.stats()), 200
+
+def is_visible_job(job):
+    """Un trabajo es visible para quien lo creó y para los administradores"""
+    if not job:
+        return False
+    if job['created_by'] == str(get_jwt_identity()):
+        return True
+    identity = current_user_identity()
+    return bool(identity) and identity['role'] == 'admin'
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    """Estado, avance y resultado de un trabajo de fondo"""
+    job = job_runner.get(job_id)
+    if not is_visible_job(job):
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    
+    return jsonify(job), 200
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_job(job_id):
+    """Cancela un trabajo: de inmediato si está en cola, o al reportar su siguiente avance"""
+    if not is_visible_job(job_runner.get(job_id)):
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    
+    job = job_runner.cancel(job_id)
+    return jsonify(job), 202 if job['status'] == 'running' else 200
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Exporta las métricas del proceso en formato de texto de Prometheus"""
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    return app.response_class(registry.render(), mimetype='text/plain; version=0.0.4')
+
 # =========================================================
 # MANEJO DE ERRORES
 # =========================================================
@@ -686,10 +1647,43 @@ def missing_token_callback(error):
 # INICIALIZACIÓN
 # =========================================================
 
+def ensure_invoice_columns():
+    """Agrega a una tabla invoices existente las columnas posteriores a su creación"""
+    existing = {column['name'] for column in inspect(db.engine).get_columns('invoices')}
+    if 'hash_version' not in existing:
+        # Los bloques existentes se hashearon con el esquema JSON
+        with db.engine.begin() as connection:
+            connection.execute(text(
+                f'ALTER TABLE invoices ADD COLUMN hash_version SMALLINT NOT NULL DEFAULT {HASH_VERSION_JSON}'
+            ))
+
 def init_database():
     """Inicializa la base de datos y crea usuario admin"""
     db.create_all()
     
+    # create_all no agrega columnas ni índices nuevos a tablas existentes
+    ensure_invoice_columns()
+    for index in Invoice.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+    
+    # Índice de búsqueda de facturas (se mantiene solo en cada inserción)
+    with db.engine.connect() as connection:
+        invoice_search.ensure(connection)
+        connection.commit()
+    
+    # Calcular los totales acumulados la primera vez (ledgers existentes o base de datos nueva)
+    if not LedgerTotal.query.first():
+        write_ledger_totals(compute_ledger_totals())
+    
+    # Sellar las raíces de Merkle de los rangos completos que falten (ledgers existentes)
+    seal_merkle_ranges()
+    
+    # Tabla de trabajos de fondo; los pendientes cuyo proceso dejó de renovar su latido ya no corren
+    job_runner.ensure_table()
+    interrupted_jobs = job_runner.recover_interrupted()
+    if interrupted_jobs:
+        print(f"⚠️  Trabajos interrumpidos marcados como fallidos: {interrupted_jobs}")
+    
     # Crear usuario admin por defecto
     admin = User.query.filter_by(username='admin').first()
     if not admin:
@@ -704,6 +1698,64 @@ def init_database():
         db.session.commit()
         print("✅ Usuario administrador creado: admin / Admin123!")
 
+# =========================================================
+# COMANDOS DE LÍNEA DE COMANDOS
+# =========================================================
+
+@app.cli.command('rebuild-ledger-totals')
+@click.option('--check', is_flag=True, help='Solo verificar los totales, sin reescribirlos')
+def rebuild_ledger_totals_command(check):
+    """Recalcula los totales acumulados desde las tablas vivas y los verifica"""
+    live = compute_ledger_totals()
+    mismatches = verify_ledger_totals(read_ledger_totals(), live)
+    
+    click.echo(f'Totales con diferencias: {len(mismatches)}')
+    for mismatch in mismatches:
+        click.echo(json.dumps(mismatch, ensure_ascii=False))
+    
+    if check:
+        if mismatches:
+            raise SystemExit(1)
+        return
+    
+    write_ledger_totals(live)
+    remaining = verify_ledger_totals(read_ledger_totals(), compute_ledger_totals())
+    click.echo(f'Totales reconstruidos; diferencias tras la reconstrucción: {len(remaining)}')
+    if remaining:
+        raise SystemExit(1)
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Crea el índice de búsqueda de facturas y lo reconstruye desde la tabla invoices"""
+    with db.engine.connect() as connection:
+        if not invoice_search.ensure(connection):
+            click.echo('El motor de base de datos no soporta el índice de búsqueda; se usará ILIKE')
+            return
+        invoice_search.rebuild(connection)
+        connection.commit()
+    click.echo('Índice de búsqueda reconstruido')
+
+@app.cli.command('rebuild-merkle-ranges')
+@click.option('--check', is_flag=True, help='Solo verificar las raíces selladas, sin reconstruirlas')
+def rebuild_merkle_ranges_command(check):
+    """Verifica las raíces de Merkle selladas y las vuelve a sellar desde la tabla invoices"""
+    global _next_merkle_range
+    mismatches = verify_merkle_ranges()
+    
+    click.echo(f'Rangos con diferencias: {len(mismatches)}')
+    for mismatch in mismatches:
+        click.echo(json.dumps(mismatch))
+    
+    if check:
+        if mismatches:
+            raise SystemExit(1)
+        return
+    
+    MerkleRange.query.delete()
+    db.session.commit()
+    _next_merkle_range = None
+    click.echo(f'Rangos de Merkle sellados: {seal_merkle_ranges()}')
+
 # =========================================================
 # EJECUCIÓN DEL SERVIDOR
 # =========================================================
@@ -0,0 +1,154 @@
+# Archivo: append_queue.py
+# Cola de anexado con group commit: los manejadores encolan elementos ya validados y una única
+# tarea escritora los confirma por grupos, una transacción (un fsync) por grupo.
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+# Muestras recientes de latencia que se conservan para los percentiles
+LATENCY_SAMPLES = 1024
+
+class AppendQueueFullError(Exception):
+    """La cola de anexado alcanzó su profundidad máxima"""
+
+class GroupCommitQueue:
+    """Agrupa los anexados concurrentes y los escribe desde un solo hilo escritor
+
+    write_group(items) escribe y confirma un grupo completo y retorna, alineado con items, el
+    resultado de cada elemento o la excepción que lo rechazó. Si write_group lanza una
+    excepción, todo el grupo falla con ella. Cada grupo espera a lo sumo max_linger segundos
+    desde su primer elemento para completar max_batch_size elementos; los que ya están en la
+    cola se toman sin esperar. El hilo escritor se inicia con el primer submit().
+    """
+
+    def __init__(self, write_group, max_batch_size=256, max_linger=0.002, max_depth=10000, name='append-writer'):
+        self._write_group = write_group
+        self._max_batch_size = max_batch_size
+        self._max_linger = max_linger
+        self._name = name
+        self._queue = queue.Queue(maxsize=max_depth)
+        self._lock = threading.Lock()
+        self._writer = None
+        self._commit_latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._wait_latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._counters = {
+            'submitted': 0,
+            'committed': 0,
+            'rejected': 0,
+            'failed_groups': 0,
+            'groups': 0,
+            'max_group_size': 0,
+            'max_queue_depth': 0,
+            'queue_full': 0
+        }
+
+    def submit(self, item):
+        """Encola un elemento y retorna un Future que se resuelve cuando su grupo se confirma"""
+        self._ensure_writer()
+        future = Future()
+
+        try:
+            self._queue.put_nowait((item, future, time.perf_counter()))
+        except queue.Full:
+            self._count('queue_full')
+            raise AppendQueueFullError(f'La cola de anexado tiene {self._queue.maxsize} elementos pendientes')
+
+        with self._lock:
+            self._counters['submitted'] += 1
+            self._counters['max_queue_depth'] = max(self._counters['max_queue_depth'], self._queue.qsize())
+        return future
+
+    def stats(self):
+        """Profundidad de la cola, contadores acumulados y latencias recientes en milisegundos"""
+        with self._lock:
+            groups = self._counters['groups']
+            return dict(
+                self._counters,
+                queue_depth=self._queue.qsize(),
+                max_batch_size=self._max_batch_size,
+                max_linger_ms=self._max_linger * 1000,
+                avg_group_size=round((self._counters['committed'] + self._counters['rejected']) / groups, 2)
+                               if groups else 0,
+                commit_latency_ms=self._percentiles(self._commit_latencies),
+                wait_latency_ms=self._percentiles(self._wait_latencies)
+            )
+
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._writer.start()
+
+    def _next_group(self):
+        """Espera el primer elemento y completa el grupo hasta max_batch_size o max_linger"""
+        group = [self._queue.get()]
+        deadline = time.perf_counter() + self._max_linger
+
+        while len(group) < self._max_batch_size:
+            try:
+                group.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                group.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return group
+
+    def _run(self):
+        while True:
+            group = self._next_group()
+            items = [item for item, _, _ in group]
+
+            started_at = time.perf_counter()
+            try:
+                results = self._write_group(items)
+                error = None
+            except Exception as e:
+                results, error = None, e
+            finished_at = time.perf_counter()
+
+            committed = rejected = 0
+            for position, (_, future, submitted_at) in enumerate(group):
+                result = error if error is not None else results[position]
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                    rejected += 1
+                else:
+                    future.set_result(result)
+                    committed += 1
+
+            with self._lock:
+                self._counters['groups'] += 1
+                self._counters['committed'] += committed
+                self._counters['rejected'] += rejected
+                self._counters['failed_groups'] += error is not None
+                self._counters['max_group_size'] = max(self._counters['max_group_size'], len(group))
+                self._commit_latencies.append(finished_at - started_at)
+                self._wait_latencies.extend(finished_at - submitted_at for _, _, submitted_at in group)
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    @staticmethod
+    def _percentiles(samples):
+        if not samples:
+            return {'p50': None, 'p99': None, 'max': None}
+        ordered = sorted(samples)
+        return {
+            'p50': round(ordered[len(ordered) // 2] * 1000, 3),
+            'p99': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3),
+            'max': round(ordered[-1] * 1000, 3)
+        }
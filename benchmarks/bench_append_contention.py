@@ -0,0 +1,119 @@
+# Archivo: benchmarks/bench_append_contention.py
+# Benchmark de contención: facturas anexadas por segundo con 1, 8 y 32 escritores concurrentes.
+# Usa una base de datos SQLite temporal y verifica al final de cada ronda que la cadena no se bifurcó.
+# --max-batch compara tamaños máximos de grupo de la cola de anexado (1 = una transacción por factura)
+# y --metrics imprime al final las métricas del proceso en formato de Prometheus.
+#
+# Uso: python benchmarks/bench_append_contention.py [--appends 400] [--writers 1 8 32] [--max-batch 1 256] [--metrics]
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+# La base de datos debe configurarse antes de importar la aplicación
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='xlerion-bench-'), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+# Todos los escritores usan el mismo usuario: el limitador de tasa rechazaría la carga
+os.environ['RATE_LIMIT_ENABLED'] = 'false'
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+import app as app_module  # noqa: E402
+from app import app, db, init_database, chain_head, write_invoice_group, Invoice, User, GENESIS_PREVIOUS_HASH  # noqa: E402
+from append_queue import GroupCommitQueue  # noqa: E402
+from metrics import registry  # noqa: E402
+
+def reset_database():
+    """Recrea el esquema vacío y retorna un token del administrador"""
+    with app.app_context():
+        db.drop_all()
+        init_database()
+        chain_head.invalidate()
+        admin = User.query.filter_by(username='admin').first()
+        return create_access_token(identity=admin.id)
+
+def count_forks():
+    """Cuenta los bloques cuyo previous_hash no apunta al bloque anterior"""
+    with app.app_context():
+        forks = 0
+        previous_hash = GENESIS_PREVIOUS_HASH
+        for block_hash, block_previous_hash in db.session.query(Invoice.block_hash, Invoice.previous_hash)\
+                                                           .order_by(Invoice.id.asc()):
+            if block_previous_hash != previous_hash:
+                forks += 1
+            previous_hash = block_hash
+        return forks
+
+def run_round(writers, total_appends, max_batch, linger_ms):
+    """Ejecuta una ronda con el número de escritores y el tamaño máximo de grupo indicados"""
+    token = reset_database()
+    app_module.invoice_appends = GroupCommitQueue(
+        write_invoice_group, max_batch_size=max_batch, max_linger=linger_ms / 1000
+    )
+    headers = {'Authorization': f'Bearer {token}'}
+    per_writer = max(1, total_appends // writers)
+    errors = []
+
+    def writer(worker_id):
+        client = app.test_client()
+        for n in range(per_writer):
+            response = client.post('/invoices', headers=headers, json={
+                'invoice_number': f'BENCH-{worker_id}-{n}',
+                'company_name': 'Empresa Benchmark SAS',
+                'company_nit': '900123456',
+                'subtotal': '1000.00'
+            })
+            if response.status_code != 201:
+                errors.append(response.status_code)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    started_at = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started_at
+
+    appended = per_writer * writers - len(errors)
+    stats = app_module.invoice_appends.stats()
+    return {
+        'writers': writers,
+        'max_batch': max_batch,
+        'avg_group': stats['avg_group_size'],
+        'commit_p99': stats['commit_latency_ms']['p99'] or 0,
+        'appends': appended,
+        'errors': len(errors),
+        'elapsed': elapsed,
+        'appends_per_second': appended / elapsed,
+        'forks': count_forks()
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de contención de anexados')
+    parser.add_argument('--appends', type=int, default=400, help='Facturas por ronda')
+    parser.add_argument('--writers', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--max-batch', type=int, nargs='+', default=[1, 256], help='Tamaños máximos de grupo')
+    parser.add_argument('--linger-ms', type=float, default=2.0, help='Espera máxima para completar un grupo')
+    parser.add_argument('--metrics', action='store_true', help='Imprimir las métricas del proceso al terminar')
+    args = parser.parse_args()
+
+    print(f'{"grupo máx":>9} {"escritores":>10} {"anexados":>9} {"errores":>8} {"segundos":>9} {"anexados/s":>11} '
+          f'{"grupo medio":>12} {"commit p99 (ms)":>16} {"bifurcaciones":>14}')
+    for max_batch in args.max_batch:
+        for writers in args.writers:
+            result = run_round(writers, args.appends, max_batch, args.linger_ms)
+            print(f'{result["max_batch"]:>9} {result["writers"]:>10} {result["appends"]:>9} {result["errors"]:>8} '
+                  f'{result["elapsed"]:>9.2f} {result["appends_per_second"]:>11.1f} {result["avg_group"]:>12.1f} '
+                  f'{result["commit_p99"]:>16.2f} {result["forks"]:>14}')
+
+    if args.metrics:
+        with app.app_context():
+            print(registry.render())
+
+if __name__ == '__main__':
+    main()
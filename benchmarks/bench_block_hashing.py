@@ -0,0 +1,66 @@
+# Archivo: benchmarks/bench_block_hashing.py
+# Hashes por segundo de los dos esquemas de hash de bloques: JSON ordenado con montos float
+# (versión 1, bloques heredados) frente a la codificación binaria canónica (versión 2).
+#
+# Uso: python benchmarks/bench_block_hashing.py [--blocks 200000] [--repeat 3]
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from block_hashing import calculate_block_hash, HASH_VERSION_JSON, HASH_VERSION_BINARY  # noqa: E402
+
+def sample_blocks(count):
+    """Bloques sintéticos con la forma de las filas de invoices"""
+    rng = random.Random(3)
+    started = datetime(2024, 1, 1)
+    blocks = []
+    for number in range(count):
+        subtotal = Decimal(rng.randrange(100, 10 ** 9)).scaleb(-2)
+        iva_amount = (subtotal * Decimal('0.19')).quantize(Decimal('0.01'))
+        blocks.append({
+            'invoice_number': f'FV-{number:08d}',
+            'company_name': f'Comercializadora Andina {number % 997:03d} SAS',
+            'company_nit': f'{rng.randrange(800000000, 999999999)}',
+            'subtotal': subtotal,
+            'iva_amount': iva_amount,
+            'total_amount': subtotal + iva_amount,
+            'timestamp': started + timedelta(microseconds=number * 1500),
+            'previous_hash': f'{number:064x}',
+            'user_id': 1
+        })
+    return blocks
+
+def measure(blocks, hash_version, repeat):
+    """Retorna el mejor resultado en hashes por segundo de `repeat` pasadas"""
+    best = 0
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        for block in blocks:
+            calculate_block_hash(block, hash_version)
+        best = max(best, len(blocks) / (time.perf_counter() - started_at))
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de los esquemas de hash de bloques')
+    parser.add_argument('--blocks', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    blocks = sample_blocks(args.blocks)
+    results = {}
+    print(f'{"esquema":>18} {"hashes/s":>12}')
+    for label, hash_version in (('v1 JSON', HASH_VERSION_JSON), ('v2 binario', HASH_VERSION_BINARY)):
+        results[hash_version] = measure(blocks, hash_version, args.repeat)
+        print(f'{label:>18} {results[hash_version]:>12.0f}')
+    print(f'mejora: {results[HASH_VERSION_BINARY] / results[HASH_VERSION_JSON]:.2f}x')
+
+if __name__ == '__main__':
+    main()
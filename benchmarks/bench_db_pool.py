@@ -0,0 +1,155 @@
+# Archivo: benchmarks/bench_db_pool.py
+# Prueba de carga de server_improved.py con y sin pool de conexiones. Como sustituto local de
+# MariaDB se usa SQLite detrás de un adaptador con la interfaz de PyMySQL (paramstyle %s,
+# cursores de diccionarios, ping) y una latencia de handshake simulada en cada conexión nueva.
+#
+# Uso: python benchmarks/bench_db_pool.py [--threads 1 8 32] [--requests 200] [--handshake-ms 3]
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import server_improved  # noqa: E402
+from db_pool import ConnectionPool  # noqa: E402
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='xlerion-bench-'), 'blocks.db')
+
+class StandInCursor:
+    """Cursor con la interfaz de los cursores de PyMySQL sobre sqlite3 (filas dict o tuplas)"""
+
+    def __init__(self, connection, as_dict=True):
+        self._cursor = connection.cursor()
+        self._as_dict = as_dict
+
+    def _row(self, row):
+        return dict(row) if self._as_dict else tuple(row)
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(sql.replace('%s', '?'), tuple(params))
+
+    def executemany(self, sql, rows):
+        self._cursor.executemany(sql.replace('%s', '?'), rows)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return self._row(row) if row is not None else None
+
+    def fetchmany(self, size):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._cursor.close()
+
+class StandInConnection:
+    """Conexión con la interfaz de pymysql.Connection usada por server_improved.py"""
+
+    def __init__(self, handshake_seconds):
+        # Handshake TCP + autenticación de un servidor real
+        time.sleep(handshake_seconds)
+        self._connection = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=30)
+        self._connection.row_factory = sqlite3.Row
+
+    def cursor(self, cursorclass=None):
+        # Sin clase explícita se usa la del DB_CONFIG (DictCursor)
+        return StandInCursor(self._connection, as_dict=cursorclass is None)
+
+    def ping(self, reconnect=False):
+        self._connection.execute('SELECT 1')
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def close(self):
+        self._connection.close()
+
+def seed(blocks=2000):
+    connection = sqlite3.connect(DB_PATH)
+    connection.execute("""CREATE TABLE blocks (
+        block_index INTEGER PRIMARY KEY, timestamp_iso TEXT, data TEXT, previous_hash TEXT, hash TEXT UNIQUE,
+        traceability TEXT, created_by TEXT, company_name TEXT, company_nit TEXT, invoice_number TEXT,
+        block_timestamp TEXT)""")
+    for column in ('company_name', 'company_nit', 'invoice_number', 'block_timestamp'):
+        connection.execute(f'CREATE INDEX ix_blocks_{column} ON blocks ({column})')
+    connection.executemany('INSERT INTO blocks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', [
+        (index, '2024-01-01T00:00:00.000Z',
+         json.dumps({'companyName': f'Empresa {index % 50}', 'companyNit': f'900{index:06d}', 'number': f'F-{index}'}),
+         f'{index - 1:064x}', f'{index:064x}', '[]', 'admin', f'Empresa {index % 50}', f'900{index:06d}',
+         f'F-{index}', '2024-01-01 00:00:00')
+        for index in range(blocks)
+    ])
+    connection.commit()
+    connection.close()
+
+def run_load(threads, requests_per_thread):
+    """Lanza `threads` clientes concurrentes y retorna solicitudes por segundo"""
+    errors = []
+
+    def client():
+        test_client = server_improved.app.test_client()
+        for number in range(requests_per_thread):
+            response = test_client.get(f'/api/blocks/search?companyName=Empresa {number % 50}&limit=20')
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+    workers = [threading.Thread(target=client) for _ in range(threads)]
+    started_at = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started_at
+
+    assert not errors, f'{len(errors)} solicitudes fallidas'
+    return threads * requests_per_thread / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga del pool de conexiones PyMySQL')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=200, help='Solicitudes por hilo')
+    parser.add_argument('--handshake-ms', type=float, default=3.0, help='Latencia simulada de cada conexión nueva')
+    parser.add_argument('--pool-size', type=int, default=10)
+    args = parser.parse_args()
+
+    seed()
+    handshake = args.handshake_ms / 1000
+    server_improved.pymysql.connect = lambda **kwargs: StandInConnection(handshake)
+
+    print(f'handshake simulado: {args.handshake_ms} ms, pool de {args.pool_size} conexiones')
+    print(f'{"hilos":>6} {"sin pool (req/s)":>17} {"con pool (req/s)":>17} {"mejora":>7} {"esperas":>8} {"agotado":>8}')
+    for threads in args.threads:
+        server_improved.DB_POOL_SIZE = 0
+        without_pool = run_load(threads, args.requests)
+
+        server_improved.DB_POOL_SIZE = args.pool_size
+        server_improved.db_pool = ConnectionPool(
+            server_improved.db_pool._connect, max_size=args.pool_size, timeout=30
+        )
+        with_pool = run_load(threads, args.requests)
+        stats = server_improved.db_pool.stats()
+        server_improved.db_pool.close_all()
+
+        print(f'{threads:>6} {without_pool:>17.0f} {with_pool:>17.0f} {with_pool / without_pool:>6.1f}x '
+              f'{stats["waits"]:>8} {stats["exhausted"]:>8}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# Archivo: benchmarks/bench_distribution_insert.py
+# Micro-benchmark de inserción de filas de distribución del IVA: un objeto ORM por fila con
+# db.session.add() frente a un executemany de Core (insert_distribution_rows).
+#
+# Uso: python benchmarks/bench_distribution_insert.py [--invoices 1000 100000] [--commit-every 1000]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+# La base de datos debe configurarse antes de importar la aplicación
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='xlerion-bench-'), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+from app import app, db, IVADistribution, IVA_PLAN, insert_distribution_rows  # noqa: E402
+from iva_plan import plan_distribution_rows  # noqa: E402
+
+def insert_with_orm(invoice_id, iva_amount):
+    """Ruta anterior: un objeto IVADistribution por fila"""
+    for row in plan_distribution_rows(IVA_PLAN, invoice_id, iva_amount):
+        db.session.add(IVADistribution(**row))
+
+def insert_with_core(invoice_id, iva_amount):
+    """Ruta masiva: un executemany de Core por factura"""
+    insert_distribution_rows(plan_distribution_rows(IVA_PLAN, invoice_id, iva_amount))
+
+def run(path, invoices, commit_every):
+    """Inserta la distribución de `invoices` facturas y retorna los segundos empleados"""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        iva_amount = Decimal('190.00')
+
+        started_at = time.perf_counter()
+        for invoice_id in range(1, invoices + 1):
+            path(invoice_id, iva_amount)
+            if invoice_id % commit_every == 0:
+                db.session.commit()
+        db.session.commit()
+        elapsed = time.perf_counter() - started_at
+
+        assert IVADistribution.query.count() == invoices * len(IVA_PLAN)
+        return elapsed, invoices * len(IVA_PLAN)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de inserción de distribuciones del IVA')
+    parser.add_argument('--invoices', type=int, nargs='+', default=[1000, 100000])
+    parser.add_argument('--commit-every', type=int, default=1000, help='Facturas por transacción')
+    args = parser.parse_args()
+
+    print(f'{"facturas":>9} {"filas":>10} {"ORM (s)":>9} {"Core (s)":>9} {"filas/s ORM":>12} {"filas/s Core":>13} {"mejora":>7}')
+    for invoices in args.invoices:
+        orm_elapsed, rows = run(insert_with_orm, invoices, args.commit_every)
+        core_elapsed, _ = run(insert_with_core, invoices, args.commit_every)
+        print(f'{invoices:>9} {rows:>10} {orm_elapsed:>9.2f} {core_elapsed:>9.2f} '
+              f'{rows / orm_elapsed:>12.0f} {rows / core_elapsed:>13.0f} {orm_elapsed / core_elapsed:>6.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# Archivo: benchmarks/bench_invoice_search.py
+# Latencia de búsqueda de facturas (p50/p99) sobre un conjunto sintético: ILIKE '%término%'
+# con recorrido completo de la tabla frente al índice FTS5 trigram de search_index.py.
+#
+# Uso: python benchmarks/bench_invoice_search.py [--invoices 1000000] [--queries 200]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+# La base de datos debe configurarse antes de importar la aplicación
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='xlerion-bench-'), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+from app import app, db, Invoice, init_database, invoice_search  # noqa: E402
+
+PREFIXES = ('Comercializadora', 'Distribuidora', 'Inversiones', 'Constructora', 'Ferretería', 'Transportes')
+NAMES = ('Andina', 'del Caribe', 'Santa Fe', 'Los Andes', 'El Dorado', 'Pacífico', 'Orinoquía', 'Nevado')
+SUFFIXES = ('SAS', 'Ltda', 'SA', 'y Cía')
+
+def company_name(rng):
+    return f'{rng.choice(PREFIXES)} {rng.choice(NAMES)} {rng.randrange(100000):05d} {rng.choice(SUFFIXES)}'
+
+def seed(invoices, chunk_size=20000):
+    """Inserta `invoices` facturas sintéticas; los triggers mantienen el índice FTS5"""
+    rng = random.Random(7)
+    started = datetime(2024, 1, 1)
+    for first in range(0, invoices, chunk_size):
+        db.session.execute(Invoice.__table__.insert(), [
+            {
+                'invoice_number': f'FV-{number:08d}',
+                'company_name': company_name(rng),
+                'company_nit': f'{rng.randrange(800000000, 999999999)}',
+                'subtotal': Decimal('100.00'),
+                'iva_amount': Decimal('19.00'),
+                'total_amount': Decimal('119.00'),
+                'block_hash': f'{number:064x}',
+                'previous_hash': f'{number - 1:064x}',
+                'timestamp': started + timedelta(seconds=number),
+                'user_id': 1
+            }
+            for number in range(first, min(first + chunk_size, invoices))
+        ])
+    db.session.commit()
+
+def sample_queries(count):
+    """Términos de búsqueda mezclando alta y baja selectividad"""
+    rng = random.Random(11)
+    queries = []
+    for _ in range(count):
+        kind = rng.randrange(4)
+        if kind == 0:
+            queries.append({'company_name': rng.choice(NAMES)})
+        elif kind == 1:
+            queries.append({'company_name': f'{rng.randrange(100000):05d}'})
+        elif kind == 2:
+            queries.append({'company_nit': f'{rng.randrange(800000, 999999)}'})
+        else:
+            queries.append({'invoice_number': f'{rng.randrange(10 ** 6):06d}'})
+    return queries
+
+def build_query(criteria, use_index):
+    """Misma consulta que /invoices/search: primera página, más recientes primero, sin total"""
+    query = Invoice.query.filter_by(user_id=1)
+    if use_index:
+        query = query.filter(*invoice_search.filter(db.session.connection(), criteria))
+    else:
+        for name, term in criteria.items():
+            query = query.filter(getattr(Invoice, name).ilike(f'%{term}%'))
+    return query.order_by(Invoice.timestamp.desc(), Invoice.id.desc()).limit(21)
+
+def measure(queries, use_index):
+    """Retorna (p50, p99) en milisegundos"""
+    samples = []
+    for criteria in queries:
+        started_at = time.perf_counter()
+        build_query(criteria, use_index).all()
+        samples.append((time.perf_counter() - started_at) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de búsqueda de facturas')
+    parser.add_argument('--invoices', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    with app.app_context():
+        init_database()
+        started_at = time.perf_counter()
+        seed(args.invoices)
+        print(f'{args.invoices} facturas insertadas en {time.perf_counter() - started_at:.1f} s (con índice FTS5)')
+
+        # Estadísticas del planificador como tras reiniciar el servidor sobre el ledger cargado
+        with db.engine.connect() as connection:
+            invoice_search.ensure(connection)
+            connection.commit()
+
+        queries = sample_queries(args.queries)
+        print(f'{"ruta":>8} {"p50 (ms)":>10} {"p99 (ms)":>10}')
+        for label, use_index in (('ILIKE', False), ('FTS5', True)):
+            p50, p99 = measure(queries, use_index)
+            print(f'{label:>8} {p50:>10.2f} {p99:>10.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# Archivo: benchmarks/bench_ledger_pagination.py
+# Latencia de la primera página frente a una página profunda del ledger: paginación por
+# OFFSET con COUNT(*) (?page=) frente a paginación keyset sobre (timestamp, id) (?cursor=).
+#
+# Uso: python benchmarks/bench_ledger_pagination.py [--invoices 250000] [--per-page 20] [--pages 1 10000]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+# La base de datos debe configurarse antes de importar la aplicación
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='xlerion-bench-'), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+from app import app, db, Invoice, init_database, paginate_invoices, encode_cursor  # noqa: E402
+
+def seed(invoices, chunk_size=10000):
+    """Inserta `invoices` facturas (sin distribución) con timestamps crecientes"""
+    started = datetime(2024, 1, 1)
+    amount = Decimal('100.00')
+    for first in range(0, invoices, chunk_size):
+        db.session.execute(Invoice.__table__.insert(), [
+            {
+                'invoice_number': f'BENCH-{number}',
+                'company_name': 'Empresa de prueba',
+                'company_nit': '900123456',
+                'subtotal': amount,
+                'iva_amount': Decimal('19.00'),
+                'total_amount': Decimal('119.00'),
+                'block_hash': f'{number:064x}',
+                'previous_hash': f'{number - 1:064x}',
+                # Varias facturas por segundo: el id desempata los timestamps iguales
+                'timestamp': started + timedelta(seconds=number // 4),
+                'user_id': 1
+            }
+            for number in range(first, min(first + chunk_size, invoices))
+        ])
+    db.session.commit()
+
+def cursor_for_page(page, per_page):
+    """Cursor que un cliente habría recibido al terminar la página anterior"""
+    if page == 1:
+        return None
+    last = Invoice.query.order_by(Invoice.timestamp.desc(), Invoice.id.desc())\
+                        .offset((page - 1) * per_page - 1).first()
+    return encode_cursor(last)
+
+def measure(query_string, repeat):
+    """Retorna la mediana en milisegundos de paginar la consulta con los parámetros dados"""
+    samples = []
+    for _ in range(repeat):
+        with app.test_request_context(query_string=query_string):
+            started_at = time.perf_counter()
+            invoices, _ = paginate_invoices(Invoice.query, query_string['per_page'])
+            samples.append((time.perf_counter() - started_at) * 1000)
+            db.session.remove()
+    assert invoices, 'Página vacía'
+    samples.sort()
+    return samples[len(samples) // 2]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de paginación OFFSET frente a keyset')
+    parser.add_argument('--invoices', type=int, default=250000)
+    parser.add_argument('--per-page', type=int, default=20)
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with app.app_context():
+        init_database()
+        seed(args.invoices)
+
+        print(f'{args.invoices} facturas, {args.per_page} por página (mediana de {args.repeat} ejecuciones, ms)')
+        print(f'{"página":>7} {"OFFSET+COUNT":>13} {"OFFSET":>8} {"keyset+COUNT":>13} {"keyset":>8}')
+        for page in args.pages:
+            cursor = cursor_for_page(page, args.per_page)
+            keyset = {'per_page': args.per_page}
+            if cursor:
+                keyset['cursor'] = cursor
+
+            offset_total = measure({'page': page, 'per_page': args.per_page}, args.repeat)
+            offset_only = measure({'page': page, 'per_page': args.per_page, 'with_total': 'false'}, args.repeat)
+            keyset_total = measure(keyset, args.repeat)
+            keyset_only = measure(dict(keyset, with_total='false'), args.repeat)
+            print(f'{page:>7} {offset_total:>13.2f} {offset_only:>8.2f} {keyset_total:>13.2f} {keyset_only:>8.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# Archivo: benchmarks/bench_profile.py
+# Latencia de GET /profile para un usuario con muchas facturas: la versión anterior (consulta del
+# usuario en cada solicitud y len(user.invoices), que carga todas sus facturas) frente a la
+# actual (identidad en caché y COUNT sobre el índice de facturas por usuario).
+#
+# Uso: python benchmarks/bench_profile.py [--invoices 100000] [--repeat 20]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+# La base de datos debe configurarse antes de importar la aplicación
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='xlerion-bench-'), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+from flask import jsonify  # noqa: E402
+from flask_jwt_extended import jwt_required, get_jwt_identity  # noqa: E402
+from app import app, db, User, Invoice, init_database, identity_cache  # noqa: E402
+
+@app.route('/bench/profile-anterior', methods=['GET'])
+@jwt_required()
+def legacy_profile():
+    """get_profile() antes de la caché de identidades"""
+    user = User.query.get(get_jwt_identity())
+    return jsonify({'user': user.to_dict(), 'invoice_count': len(user.invoices)}), 200
+
+def seed(invoices, user_id, chunk_size=10000):
+    """Inserta `invoices` facturas (sin distribución) del usuario dado"""
+    started = datetime(2024, 1, 1)
+    for first in range(0, invoices, chunk_size):
+        db.session.execute(Invoice.__table__.insert(), [
+            {
+                'invoice_number': f'BENCH-{number}',
+                'company_name': 'Empresa de prueba',
+                'company_nit': '900123456',
+                'subtotal': Decimal('100.00'),
+                'iva_amount': Decimal('19.00'),
+                'total_amount': Decimal('119.00'),
+                'block_hash': f'{number:064x}',
+                'previous_hash': f'{number - 1:064x}',
+                'timestamp': started + timedelta(seconds=number),
+                'user_id': user_id
+            }
+            for number in range(first, min(first + chunk_size, invoices))
+        ])
+    db.session.commit()
+
+def measure(client, path, headers, repeat):
+    """Retorna la mediana en milisegundos de `repeat` solicitudes GET a path"""
+    samples = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        response = client.get(path, headers=headers)
+        samples.append((time.perf_counter() - started_at) * 1000)
+        assert response.status_code == 200, response.get_json()
+    samples.sort()
+    return samples[len(samples) // 2], response.get_json()['invoice_count']
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de GET /profile con muchas facturas')
+    parser.add_argument('--invoices', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with app.app_context():
+        init_database()
+        admin_id = User.query.filter_by(username='admin').one().id
+        seed(args.invoices, admin_id)
+
+    client = app.test_client()
+    token = client.post('/login', json={'username': 'admin', 'password': 'Admin123!'}).get_json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    legacy_ms, legacy_count = measure(client, '/bench/profile-anterior', headers, args.repeat)
+    current_ms, current_count = measure(client, '/profile', headers, args.repeat)
+    assert legacy_count == current_count == args.invoices
+
+    print(f'{args.invoices} facturas del usuario (mediana de {args.repeat} solicitudes, ms)')
+    print(f'{"versión":>28} {"ms":>9}')
+    print(f'{"usuario + len(invoices)":>28} {legacy_ms:>9.2f}')
+    print(f'{"identidad en caché + COUNT":>28} {current_ms:>9.2f}')
+    print(f'mejora: {legacy_ms / current_ms:.1f}x  caché de identidades: {identity_cache.stats()}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+# Archivo: block_hashing.py
+# Cálculo del hash de los bloques del blockchain (sin dependencias de Flask ni de la base de datos)
+
+import hashlib
+import json
+import math
+import struct
+from datetime import datetime, timezone
+from decimal import Decimal
+from operator import attrgetter, itemgetter
+from iva_plan import to_cents
+from metrics import registry
+
+# Versiones del esquema de hash de los bloques (columna invoices.hash_version)
+HASH_VERSION_JSON = 1    # JSON con claves ordenadas y montos float (bloques heredados)
+HASH_VERSION_BINARY = 2  # Codificación binaria canónica (encode_block)
+
+# Esquema con el que se hashean los bloques nuevos
+CURRENT_HASH_VERSION = HASH_VERSION_BINARY
+
+# Hash previo del bloque génesis
+GENESIS_PREVIOUS_HASH = "0000000000000000000000000000000000000000000000000000000000000000"
+
+# Campos del bloque en el orden fijo de la codificación canónica
+BLOCK_FIELDS = (
+    'invoice_number', 'company_name', 'company_nit', 'subtotal', 'iva_amount', 'total_amount',
+    'timestamp', 'previous_hash', 'user_id'
+)
+
+# Hashes calculados por esquema (la tasa por segundo se obtiene en Prometheus con rate())
+block_hashes_total = registry.counter('xlerion_block_hashes_total', 'Hashes de bloque calculados', ('version',))
+_hash_counters = {version: block_hashes_total.labels(version) for version in (HASH_VERSION_JSON, HASH_VERSION_BINARY)}
+
+_get_block_fields = attrgetter(*BLOCK_FIELDS)
+_get_row_fields = itemgetter(*BLOCK_FIELDS)
+
+# Montos en centavos y timestamp en microsegundos, enteros de 64 bits con signo (big-endian)
+_NUMBERS = struct.Struct('>qqqq')
+_USER_ID = struct.Struct('>q')
+_EPOCH = datetime(1970, 1, 1)
+
+def _fields(block):
+    """Campos del bloque desde una factura, una fila de SQLAlchemy o un diccionario"""
+    return _get_row_fields(block) if isinstance(block, dict) else _get_block_fields(block)
+
+def calculate_hash(data):
+    """Calcula el hash SHA-256 de los datos"""
+    json_string = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(json_string.encode()).hexdigest()
+
+def build_block_data(block):
+    """Construye los datos hasheados de un bloque a partir de una factura o fila equivalente"""
+    (invoice_number, company_name, company_nit, subtotal, iva_amount, total_amount,
+     timestamp, previous_hash, user_id) = _fields(block)
+    return {
+        'invoice_number': invoice_number,
+        'company_name': company_name,
+        'company_nit': company_nit,
+        'subtotal': float(subtotal),
+        'iva_amount': float(iva_amount),
+        'total_amount': float(total_amount),
+        'timestamp': timestamp.isoformat(),
+        'previous_hash': previous_hash,
+        'user_id': user_id
+    }
+
+def _cents(amount):
+    """Centavos enteros de un monto; los Decimal con a lo sumo dos decimales se convierten sin redondear"""
+    if isinstance(amount, Decimal) and amount.as_tuple().exponent >= -2:
+        return int(amount.scaleb(2))
+    return to_cents(amount)
+
+def _encode_text(value):
+    data = value.encode('utf-8')
+    return len(data).to_bytes(4, 'big') + data
+
+def _timestamp_micros(timestamp):
+    """Microsegundos desde la época Unix de un datetime UTC o su texto ISO (sin zona = UTC)"""
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = timestamp - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+def encode_block(block):
+    """Codificación binaria canónica (versión 2) de los campos de un bloque
+
+    Orden fijo: byte de versión; número de factura, razón social y NIT en UTF-8 con longitud
+    de 4 bytes; subtotal, IVA y total en centavos enteros y el timestamp UTC en microsegundos
+    (int64); el hash previo como sus 32 bytes; y el user_id (int64). No depende de float ni de
+    la representación textual de la plataforma.
+    """
+    (invoice_number, company_name, company_nit, subtotal, iva_amount, total_amount,
+     timestamp, previous_hash, user_id) = _fields(block)
+
+    previous = bytes.fromhex(previous_hash)
+    if len(previous) != 32:
+        raise ValueError('El hash previo debe ser un SHA-256 hexadecimal')
+
+    return b''.join((
+        bytes((HASH_VERSION_BINARY,)),
+        _encode_text(invoice_number),
+        _encode_text(company_name),
+        _encode_text(company_nit),
+        _NUMBERS.pack(_cents(subtotal), _cents(iva_amount), _cents(total_amount), _timestamp_micros(timestamp)),
+        previous,
+        _USER_ID.pack(int(user_id))
+    ))
+
+def calculate_block_hash(block, hash_version=CURRENT_HASH_VERSION):
+    """Calcula el hash de un bloque (factura, fila o diccionario) con el esquema indicado"""
+    if hash_version == HASH_VERSION_BINARY:
+        block_hash = hashlib.sha256(encode_block(block)).hexdigest()
+    elif hash_version == HASH_VERSION_JSON:
+        block_hash = calculate_hash(build_block_data(block))
+    else:
+        raise ValueError(f'Versión de hash desconocida: {hash_version}')
+    _hash_counters[hash_version].inc()
+    return block_hash
+
+def verify_block_hash(block):
+    """Verifica que el hash almacenado de un bloque coincida con su contenido
+
+    Usa el esquema de su hash_version; los bloques sin versión son heredados (JSON).
+    """
+    hash_version = getattr(block, 'hash_version', None) or HASH_VERSION_JSON
+    try:
+        return calculate_block_hash(block, hash_version) == block.block_hash
+    except ValueError:
+        return False
+
+# =========================================================
+# HASH DE LOS BLOQUES DEL FRONTEND (app_improved.js)
+# =========================================================
+
+# Mayor índice de arreglo de JavaScript: las claves que lo representan se ordenan primero
+_JS_MAX_ARRAY_INDEX = 2 ** 32 - 2
+
+def _js_number(value):
+    """Formatea un número como Number.prototype.toString() de JavaScript
+
+    Los enteros de Python se tratan como el double en que los convierte JSON.parse(). Las cifras
+    son las más cortas que identifican el double (las de repr(), igual que en JavaScript) y se
+    ubican según la regla de ECMAScript: notación decimal con ceros de relleno para exponentes
+    decimales de -6 a 21 y notación exponencial fuera de ese rango.
+    """
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        if abs(value) <= 2 ** 53:
+            return str(value)
+        try:
+            value = float(value)
+        except OverflowError:
+            return 'null'
+    if math.isnan(value) or math.isinf(value):
+        return 'null'
+    if value == 0:
+        return '0'
+
+    sign = '-' if value < 0 else ''
+    _, digits, exponent = Decimal(repr(abs(value))).normalize().as_tuple()
+    digits = ''.join(map(str, digits))
+    k = len(digits)
+    n = exponent + k  # valor = 0.cifras x 10^n
+
+    if k <= n <= 21:
+        text = digits + '0' * (n - k)
+    elif 0 < n <= 21:
+        text = f'{digits[:n]}.{digits[n:]}'
+    elif -6 < n <= 0:
+        text = f"0.{'0' * -n}{digits}"
+    else:
+        mantissa = digits if k == 1 else f'{digits[0]}.{digits[1:]}'
+        text = f"{mantissa}e{'+' if n > 0 else '-'}{abs(n - 1)}"
+    return sign + text
+
+def _js_key_order(obj):
+    """Orden de las claves de un objeto de JavaScript: índices enteros ascendentes y luego inserción"""
+    def is_array_index(key):
+        return key.isdigit() and (key == '0' or key[0] != '0') and int(key) <= _JS_MAX_ARRAY_INDEX
+
+    indexes = sorted((key for key in obj if is_array_index(key)), key=int)
+    return indexes + [key for key in obj if not is_array_index(key)]
+
+def js_stringify(value):
+    """Serializa un valor decodificado de JSON exactamente como JSON.stringify() de JavaScript"""
+    if value is None or isinstance(value, bool):
+        return json.dumps(value)
+    if isinstance(value, (int, float)):
+        return _js_number(value)
+    if isinstance(value, str):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, (list, tuple)):
+        return '[' + ','.join(js_stringify(item) for item in value) + ']'
+    if isinstance(value, dict):
+        return '{' + ','.join(
+            json.dumps(key, ensure_ascii=False) + ':' + js_stringify(value[key]) for key in _js_key_order(value)
+        ) + '}'
+    raise TypeError(f'Tipo no serializable en JSON: {type(value).__name__}')
+
+def calculate_js_block_hash(index, previous_hash, timestamp, data):
+    """Replica Block.calculateHash() del frontend: SHA-256 de index + previousHash + timestamp + JSON.stringify(data)"""
+    data_string = _js_number(index) + previous_hash + timestamp + js_stringify(data)
+    return hashlib.sha256(data_string.encode('utf-8')).hexdigest()
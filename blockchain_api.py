@@ -1,248 +1,438 @@
 # Archivo: blockchain_api.py
 # Endpoints API para el sistema de blockchain mejorado
 
-import hashlib
 import json
+import click
 from datetime import datetime
-from decimal import Decimal
-from flask import request, jsonify
+from decimal import Decimal, ROUND_HALF_UP
+from flask import Response, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from marshmallow import ValidationError
-from server_improved import app, db, User, Invoice, IVADistribution, InvoiceSchema, sanitize_input
-
-# Configuración de distribución del IVA (ahora configurable)
-IVA_DISTRIBUTION_CONFIG = {
-    "Salud": {
-        "percentage": 0.08,
-        "breakdown": {
-            "Nómina de personal": 0.50,
-            "Insumos médicos": 0.30,
-            "Mantenimiento de hospitales": 0.20
-        }
-    },
-    "Educación": {
-        "percentage": 0.07,
-        "breakdown": {
-            "Salarios docentes": 0.60,
-            "Materiales escolares": 0.25,
-            "Construcción y mantenimiento de escuelas": 0.15
-        }
-    },
-    "Infraestructura vial": {
-        "percentage": 0.10,
-        "breakdown": {
-            "Construcción de vías": 0.50,
-            "Mantenimiento de puentes": 0.30,
-            "Señalización y seguridad": 0.20
-        }
-    },
-    "Ambiente": {
-        "percentage": 0.05,
-        "breakdown": {
-            "Proyectos de reforestación": 0.40,
-            "Gestión de residuos": 0.30,
-            "Educación ambiental": 0.30
-        }
-    },
-    "Cultura y deporte": {
-        "percentage": 0.03,
-        "breakdown": {
-            "Programas culturales": 0.60,
-            "Instalaciones deportivas": 0.40
-        }
-    },
-    "Seguridad": {
-        "percentage": 0.12,
-        "breakdown": {
-            "Equipamiento policial": 0.40,
-            "Tecnología de seguridad": 0.35,
-            "Capacitación": 0.25
-        }
-    },
-    "Administración": {
-        "percentage": 0.05,
-        "breakdown": {
-            "Sistemas tecnológicos": 0.50,
-            "Capacitación funcionarios": 0.30,
-            "Infraestructura administrativa": 0.20
-        }
-    }
-}
+from sqlalchemy.exc import IntegrityError
+from block_hashing import calculate_block_hash, build_block_data, verify_block_hash, CURRENT_HASH_VERSION, GENESIS_PREVIOUS_HASH
+from chain_head import ChainHeadConflictError
+from iva_plan import plan_distribution_rows_batch, CENTS
+from ledger_audit import run_parallel_audit, max_audit_workers, MAX_REPORTED_INVALID
+from metrics import registry, timed
+from job_runner import JobLimitError, JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED
+from app import (app, db, Invoice, ChainCheckpoint, MerkleRange, InvoiceSchema, sanitize_input,
+                 IVA_DISTRIBUTION_CONFIG, current_iva_plan,
+                 chain_head, advance_chain_head, insert_distribution_rows, apply_ledger_totals,
+                 response_cache, parse_invoice_projection, with_distributions, paginate_invoices,
+                 invoice_search, build_inclusion_proof, function_seconds, current_user_identity, rate_limiter,
+                 job_runner, get_job)
+
+# Identificador del punto de control de validación (fila única)
+CHECKPOINT_ID = 1
+
+# Tamaño de cada página keyset al recorrer la cadena durante la validación
+VALIDATION_CHUNK_SIZE = 1000
+
+# Máximo de facturas aceptadas en un solo lote de ingesta
+MAX_BATCH_SIZE = 5000
+
+# Grupo de trabajos de las validaciones de la cadena completa (?mode=full y ?mode=parallel); a lo
+# sumo VALIDATION_MAX_CONCURRENT pendientes a la vez entre todos los workers (ver JobRunner)
+FULL_VALIDATION_GROUP = 'full_validation'
+registry.callback(
+    'xlerion_full_validations_running', 'Validaciones de la cadena completa en curso',
+    lambda: job_runner.count_active(FULL_VALIDATION_GROUP)
+)
+
+# Columnas necesarias para recalcular el hash de un bloque (evita cargar entidades ORM completas)
+BLOCK_COLUMNS = (
+    Invoice.id,
+    Invoice.invoice_number,
+    Invoice.company_name,
+    Invoice.company_nit,
+    Invoice.subtotal,
+    Invoice.iva_amount,
+    Invoice.total_amount,
+    Invoice.block_hash,
+    Invoice.previous_hash,
+    Invoice.timestamp,
+    Invoice.user_id,
+    Invoice.hash_version
+)
 
 # =========================================================
 # FUNCIONES DE BLOCKCHAIN
 # =========================================================
 
-def calculate_hash(data):
-    """Calcula el hash SHA-256 de los datos"""
-    json_string = json.dumps(data, sort_keys=True, default=str)
-    return hashlib.sha256(json_string.encode()).hexdigest()
+@timed(function_seconds.labels('validate_block_integrity'))
+def validate_block_integrity(invoice):
+    """Valida la integridad de un bloque"""
+    return verify_block_hash(invoice)
 
-def get_previous_hash():
-    """Obtiene el hash del último bloque"""
-    last_invoice = Invoice.query.order_by(Invoice.id.desc()).first()
-    return last_invoice.block_hash if last_invoice else "0000000000000000000000000000000000000000000000000000000000000000"
+def resolve_validation_start(checkpoint, full_rescan=False):
+    """Determina desde qué bloque debe reanudarse la validación
 
-def distribute_iva(iva_amount):
-    """Distribuye el IVA según la configuración establecida"""
-    distributions = []
-    remaining_percentage = 1.0
+    Retorna el punto de partida y el estado del punto de control. El bloque ancla del
+    punto de control se vuelve a comparar contra su hash persistido; si fue alterado o
+    eliminado, el punto de control se descarta y se valida desde el génesis.
+    """
+    genesis = {'block_id': 0, 'block_hash': GENESIS_PREVIOUS_HASH, 'verified_blocks': 0}
     
-    for sector, config in IVA_DISTRIBUTION_CONFIG.items():
-        sector_percentage = config["percentage"]
-        sector_amount = iva_amount * Decimal(str(sector_percentage))
-        
-        # Distribución principal del sector
-        distributions.append({
-            'sector': sector,
-            'percentage': sector_percentage,
-            'amount': sector_amount,
-            'subsector': None,
-            'subsector_percentage': None,
-            'subsector_amount': None
-        })
-        
-        # Distribución por subsectores
-        for subsector, sub_percentage in config["breakdown"].items():
-            subsector_amount = sector_amount * Decimal(str(sub_percentage))
-            distributions.append({
-                'sector': sector,
-                'percentage': sector_percentage,
-                'amount': sector_amount,
-                'subsector': subsector,
-                'subsector_percentage': sub_percentage,
-                'subsector_amount': subsector_amount
-            })
-        
-        remaining_percentage -= sector_percentage
+    if full_rescan:
+        return genesis, 'ignored'
+    
+    if not checkpoint:
+        return genesis, 'missing'
     
-    # Distribución del porcentaje restante a "Otros"
-    if remaining_percentage > 0:
-        other_amount = iva_amount * Decimal(str(remaining_percentage))
-        distributions.append({
-            'sector': 'Otros',
-            'percentage': remaining_percentage,
-            'amount': other_amount,
-            'subsector': None,
-            'subsector_percentage': None,
-            'subsector_amount': None
-        })
+    anchor = Invoice.query.get(checkpoint.block_id)
+    if not anchor or anchor.block_hash != checkpoint.block_hash or not validate_block_integrity(anchor):
+        return genesis, 'invalidated'
     
-    return distributions
+    return {
+        'block_id': checkpoint.block_id,
+        'block_hash': checkpoint.block_hash,
+        'verified_blocks': checkpoint.verified_blocks
+    }, 'used'
 
-def validate_block_integrity(invoice):
-    """Valida la integridad de un bloque"""
-    block_data = {
-        'invoice_number': invoice.invoice_number,
-        'company_name': invoice.company_name,
-        'company_nit': invoice.company_nit,
-        'subtotal': float(invoice.subtotal),
-        'iva_amount': float(invoice.iva_amount),
-        'total_amount': float(invoice.total_amount),
-        'timestamp': invoice.timestamp.isoformat(),
-        'previous_hash': invoice.previous_hash,
-        'user_id': invoice.user_id
+def save_checkpoint(checkpoint, block_id, block_hash, verified_blocks):
+    """Persiste el punto de control hasta el último bloque verificado de forma contigua"""
+    if block_id == 0:
+        # Ningún bloque válido desde el génesis: no hay nada que recordar
+        if checkpoint:
+            db.session.delete(checkpoint)
+            db.session.commit()
+        return None
+    
+    if not checkpoint:
+        checkpoint = ChainCheckpoint(id=CHECKPOINT_ID)
+        db.session.add(checkpoint)
+    
+    if checkpoint.block_id != block_id or checkpoint.block_hash != block_hash:
+        checkpoint.block_id = block_id
+        checkpoint.block_hash = block_hash
+        checkpoint.verified_blocks = verified_blocks
+        checkpoint.verified_at = datetime.utcnow()
+        db.session.commit()
+    
+    return checkpoint
+
+def iter_block_chunks(after_id, chunk_size=VALIDATION_CHUNK_SIZE):
+    """Recorre los bloques posteriores a after_id en páginas keyset ordenadas por id
+
+    Cada página es una consulta independiente (WHERE id > último id LIMIT n) que devuelve
+    filas ligeras, por lo que la memoria usada no depende del tamaño de la cadena.
+    """
+    while True:
+        rows = db.session.query(*BLOCK_COLUMNS)\
+                         .filter(Invoice.id > after_id)\
+                         .order_by(Invoice.id.asc())\
+                         .limit(chunk_size)\
+                         .all()
+        if not rows:
+            return
+        
+        yield rows
+        after_id = rows[-1].id
+
+def validate_chain(start, chunk_size=VALIDATION_CHUNK_SIZE):
+    """Genera el resultado de validación de cada bloque posterior al punto de partida"""
+    previous_hash = start['block_hash']
+    
+    for rows in iter_block_chunks(start['block_id'], chunk_size):
+        for block in rows:
+            is_valid = validate_block_integrity(block)
+            hash_chain_valid = block.previous_hash == previous_hash
+            
+            yield {
+                'invoice_id': block.id,
+                'invoice_number': block.invoice_number,
+                'block_hash': block.block_hash,
+                'previous_hash': block.previous_hash,
+                'expected_previous_hash': previous_hash,
+                'hash_integrity_valid': is_valid,
+                'hash_chain_valid': hash_chain_valid,
+                'overall_valid': is_valid and hash_chain_valid
+            }
+            
+            previous_hash = block.block_hash
+
+def new_validation_summary(start):
+    """Crea el acumulador de una validación que parte de start"""
+    return {
+        'trusted_blocks': start['verified_blocks'],
+        'newly_verified': 0,
+        'valid_new_blocks': 0,
+        'verified_block_id': start['block_id'],
+        'verified_block_hash': start['block_hash'],
+        'verified_count': 0,
+        'chain_intact': True
     }
+
+def record_validation_result(summary, result):
+    """Acumula el resultado de un bloque en el resumen de la validación"""
+    summary['newly_verified'] += 1
+    if result['overall_valid']:
+        summary['valid_new_blocks'] += 1
+    
+    # El punto de control solo avanza mientras la cadena verificada sea contigua y válida
+    summary['chain_intact'] = summary['chain_intact'] and result['overall_valid']
+    if summary['chain_intact']:
+        summary['verified_block_id'] = result['invoice_id']
+        summary['verified_block_hash'] = result['block_hash']
+        summary['verified_count'] += 1
+
+def finish_validation(checkpoint, summary, mode, checkpoint_status):
+    """Persiste el nuevo punto de control y construye el resumen de la validación"""
+    trusted_blocks = summary['trusted_blocks']
+    total_blocks = trusted_blocks + summary['newly_verified']
+    valid_blocks = trusted_blocks + summary['valid_new_blocks']
+    
+    checkpoint = save_checkpoint(
+        checkpoint,
+        block_id=summary['verified_block_id'],
+        block_hash=summary['verified_block_hash'],
+        verified_blocks=trusted_blocks + summary['verified_count']
+    )
     
-    calculated_hash = calculate_hash(block_data)
-    return calculated_hash == invoice.block_hash
+    return {
+        'blockchain_valid': valid_blocks == total_blocks,
+        'mode': mode,
+        'total_blocks': total_blocks,
+        'valid_blocks': valid_blocks,
+        'invalid_blocks': total_blocks - valid_blocks,
+        'blocks_newly_verified': summary['newly_verified'],
+        'blocks_trusted_from_checkpoint': trusted_blocks,
+        'checkpoint_status': checkpoint_status,
+        'checkpoint': checkpoint.to_dict() if checkpoint else None
+    }
+
+def get_database_url():
+    """Obtiene la URL completa de la base de datos para abrir conexiones fuera de la aplicación"""
+    return db.engine.url.render_as_string(hide_password=False)
+
+def run_validation_job(params, progress):
+    """Valida la cadena en un trabajo de fondo (ver validate_blockchain) reportando su avance
+
+    El resultado incluye el detalle de hasta MAX_REPORTED_INVALID bloques inválidos; el de los
+    válidos no se guarda para que el resultado no crezca con el ledger.
+    """
+    mode = params['mode']
+    with app.app_context():
+        if mode == 'parallel':
+            return run_parallel_audit(
+                get_database_url(), params.get('workers'), params.get('partitions'),
+                max_workers=app.config['AUDIT_MAX_WORKERS'], max_partitions=app.config['AUDIT_MAX_PARTITIONS'],
+                progress=lambda done, total, blocks_verified: progress(
+                    partitions_done=done, partitions_total=total, blocks_verified=blocks_verified
+                )
+            )
+        
+        checkpoint = ChainCheckpoint.query.get(CHECKPOINT_ID)
+        start, checkpoint_status = resolve_validation_start(checkpoint, full_rescan=(mode == 'full'))
+        
+        summary = new_validation_summary(start)
+        invalid_details = []
+        
+        for result in validate_chain(start):
+            record_validation_result(summary, result)
+            if not result['overall_valid'] and len(invalid_details) < MAX_REPORTED_INVALID:
+                invalid_details.append(result)
+            progress(
+                blocks_verified=summary['newly_verified'],
+                invalid_blocks=summary['newly_verified'] - summary['valid_new_blocks'],
+                blocks_trusted_from_checkpoint=summary['trusted_blocks']
+            )
+        
+        response_data = finish_validation(checkpoint, summary, mode, checkpoint_status)
+        response_data['invalid_block_details'] = invalid_details
+        return response_data
+
+# Tipo de trabajo de las validaciones iniciadas con POST /blockchain/validate
+VALIDATION_JOB_KIND = 'blockchain_validate'
+job_runner.register(VALIDATION_JOB_KIND, run_validation_job)
+
+# Tipo de las validaciones completas en streaming, que se ejecutan en la solicitud (ver track())
+STREAM_VALIDATION_JOB_KIND = 'blockchain_validate_stream'
+
+
+def parse_batch_payload():
+    """Obtiene la lista de facturas de un lote: arreglo JSON, {"invoices": [...]} o NDJSON"""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        lines = request.get_data(as_text=True).splitlines()
+        return [json.loads(line) for line in lines if line.strip()]
+    
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        payload = payload.get('invoices')
+    
+    if not isinstance(payload, list):
+        raise ValueError('Se esperaba una lista de facturas')
+    
+    return payload
 
 # =========================================================
 # ENDPOINTS DE BLOCKCHAIN
 # =========================================================
 
-@app.route('/invoices', methods=['POST'])
+@app.route('/invoices/batch', methods=['POST'])
 @jwt_required()
-def create_invoice():
-    """Crea una nueva factura y la registra en el blockchain"""
+@rate_limiter.limit(app.config['RATE_LIMIT_WRITE'], scope='invoices_write')
+def create_invoices_batch():
+    """Registra un lote de facturas en el blockchain en una sola transacción
+
+    Acepta un arreglo JSON (o {"invoices": [...]}) o un cuerpo NDJSON. Los errores de cada
+    factura se reportan por su índice en el lote sin abortar el registro de las demás.
+    """
     try:
-        # Validar esquema de entrada
-        schema = InvoiceSchema()
-        data = schema.load(request.json)
+        try:
+            items = parse_batch_payload()
+        except ValueError:
+            return jsonify({'error': 'Cuerpo del lote inválido'}), 400
         
-        # Obtener usuario actual
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        if not items:
+            return jsonify({'error': 'El lote está vacío'}), 400
         
-        if not user:
+        if len(items) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'El lote excede el máximo de {MAX_BATCH_SIZE} facturas'}), 413
+        
+        # Obtener usuario actual (desde la caché de identidades)
+        user_id = get_jwt_identity()
+        if not current_user_identity():
             return jsonify({'error': 'Usuario no encontrado'}), 404
         
-        # Sanitizar entradas
-        invoice_number = sanitize_input(data['invoice_number'])
-        company_name = sanitize_input(data['company_name'])
-        company_nit = sanitize_input(data['company_nit'])
-        subtotal = Decimal(str(data['subtotal']))
+        # Validar todo el lote de una vez; valid_data conserva los índices originales
+        try:
+            loaded = InvoiceSchema(many=True).load(items)
+            item_errors = {}
+        except ValidationError as e:
+            loaded, item_errors = e.valid_data, e.messages
+        
+        errors = [
+            {'index': index, 'error': 'Datos inválidos', 'details': messages}
+            for index, messages in item_errors.items()
+        ]
+        
+        pending = []
+        seen_numbers = set()
+        for index, data in enumerate(loaded):
+            if index in item_errors:
+                continue
+            
+            invoice_number = sanitize_input(data['invoice_number'])
+            if invoice_number in seen_numbers:
+                errors.append({'index': index, 'invoice_number': invoice_number,
+                               'error': 'Número de factura repetido dentro del lote'})
+                continue
+            seen_numbers.add(invoice_number)
+            
+            subtotal = Decimal(str(data['subtotal'])).quantize(CENTS, rounding=ROUND_HALF_UP)
+            iva_amount = (subtotal * Decimal('0.19')).quantize(CENTS, rounding=ROUND_HALF_UP)
+            pending.append({
+                'index': index,
+                'invoice_number': invoice_number,
+                'company_name': sanitize_input(data['company_name']),
+                'company_nit': sanitize_input(data['company_nit']),
+                'subtotal': subtotal,
+                'iva_amount': iva_amount,
+                'total_amount': subtotal + iva_amount
+            })
         
-        # Verificar que el número de factura no exista
-        existing_invoice = Invoice.query.filter_by(invoice_number=invoice_number).first()
-        if existing_invoice:
-            return jsonify({'error': 'El número de factura ya existe'}), 409
+        def reject_registered():
+            """Quita del lote los números de factura ya registrados (una consulta IN) y retorna cuántos"""
+            existing_numbers = {
+                row.invoice_number for row in db.session.query(Invoice.invoice_number)
+                                                 .filter(Invoice.invoice_number.in_([item['invoice_number'] for item in pending]))
+            }
+            for item in pending:
+                if item['invoice_number'] in existing_numbers:
+                    errors.append({'index': item['index'], 'invoice_number': item['invoice_number'],
+                                   'error': 'El número de factura ya existe'})
+            pending[:] = [item for item in pending if item['invoice_number'] not in existing_numbers]
+            return len(existing_numbers)
         
-        # Calcular IVA (19%)
-        iva_amount = subtotal * Decimal('0.19')
-        total_amount = subtotal + iva_amount
+        if pending:
+            reject_registered()
         
-        # Obtener hash del bloque anterior
-        previous_hash = get_previous_hash()
+        created = []
         
-        # Crear datos del bloque
-        block_data = {
-            'invoice_number': invoice_number,
-            'company_name': company_name,
-            'company_nit': company_nit,
-            'subtotal': float(subtotal),
-            'iva_amount': float(iva_amount),
-            'total_amount': float(total_amount),
-            'timestamp': datetime.utcnow().isoformat(),
-            'previous_hash': previous_hash,
-            'user_id': user_id
-        }
-        
-        # Calcular hash del bloque
-        block_hash = calculate_hash(block_data)
-        
-        # Crear factura
-        invoice = Invoice(
-            invoice_number=invoice_number,
-            company_name=company_name,
-            company_nit=company_nit,
-            subtotal=subtotal,
-            iva_amount=iva_amount,
-            total_amount=total_amount,
-            block_hash=block_hash,
-            previous_hash=previous_hash,
-            user_id=user_id
-        )
+        # Plan de distribución vigente al recibir el lote (refresh_iva_plan puede reemplazarlo)
+        plan = current_iva_plan()
         
-        db.session.add(invoice)
-        db.session.flush()  # Para obtener el ID de la factura
-        
-        # Calcular y guardar distribución del IVA
-        distributions = distribute_iva(iva_amount)
-        
-        for dist in distributions:
-            iva_dist = IVADistribution(
-                invoice_id=invoice.id,
-                sector=dist['sector'],
-                percentage=Decimal(str(dist['percentage'])),
-                amount=dist['amount'],
-                subsector=dist['subsector'],
-                subsector_percentage=Decimal(str(dist['subsector_percentage'])) if dist['subsector_percentage'] else None,
-                subsector_amount=dist['subsector_amount']
+        def write_batch(previous_hash):
+            """Encadena los hashes en memoria y escribe el lote con inserciones masivas"""
+            head_hash = previous_hash
+            invoice_rows = []
+            
+            for item in pending:
+                row = {
+                    'invoice_number': item['invoice_number'],
+                    'company_name': item['company_name'],
+                    'company_nit': item['company_nit'],
+                    'subtotal': item['subtotal'],
+                    'iva_amount': item['iva_amount'],
+                    'total_amount': item['total_amount'],
+                    'previous_hash': previous_hash,
+                    'timestamp': datetime.utcnow(),
+                    'user_id': int(user_id),
+                    'hash_version': CURRENT_HASH_VERSION
+                }
+                row['block_hash'] = calculate_block_hash(row)
+                invoice_rows.append(row)
+                previous_hash = row['block_hash']
+            
+            db.session.execute(Invoice.__table__.insert(), invoice_rows)
+            invoice_ids = dict(
+                db.session.query(Invoice.invoice_number, Invoice.id)
+                          .filter(Invoice.invoice_number.in_([row['invoice_number'] for row in invoice_rows]))
             )
-            db.session.add(iva_dist)
+            
+            # Mover la cabeza de la cadena una sola vez para todo el lote (compare-and-swap)
+            if not advance_chain_head(head_hash, invoice_ids[invoice_rows[-1]['invoice_number']], previous_hash):
+                db.session.rollback()
+                return None
+            
+            # Distribuir el IVA de todo el lote en modo vectorizado
+            insert_distribution_rows(plan_distribution_rows_batch(
+                plan,
+                [invoice_ids[item['invoice_number']] for item in pending],
+                [item['iva_amount'] for item in pending]
+            ))
+            apply_ledger_totals(
+                plan,
+                [item['iva_amount'] for item in pending],
+                [item['total_amount'] for item in pending]
+            )
+            
+            db.session.commit()
+            
+            created[:] = [
+                {
+                    'index': item['index'],
+                    'invoice_id': invoice_ids[row['invoice_number']],
+                    'invoice_number': row['invoice_number'],
+                    'block_hash': row['block_hash']
+                }
+                for item, row in zip(pending, invoice_rows)
+            ]
+            return previous_hash
         
-        db.session.commit()
+        while pending:
+            try:
+                chain_head.append(write_batch)
+                break
+            except IntegrityError:
+                # Otra solicitud registró alguno de los números entre la verificación y la escritura:
+                # se reportan como duplicados y se reintenta con el resto del lote
+                db.session.rollback()
+                if not reject_registered():
+                    raise
+        
+        errors.sort(key=lambda error: error['index'])
         
         return jsonify({
-            'message': 'Factura registrada exitosamente en el blockchain',
-            'invoice': invoice.to_dict(),
-            'block_hash': block_hash,
-            'distributions': distributions
-        }), 201
-        
-    except ValidationError as e:
-        return jsonify({'error': 'Datos inválidos', 'details': e.messages}), 400
+            'message': f'{len(created)} de {len(items)} facturas registradas en el blockchain',
+            'created': created,
+            'errors': errors
+        }), 201 if created else 400
+        
+    except ChainHeadConflictError:
+        db.session.rollback()
+        return jsonify({'error': 'La cadena cambió durante el registro, intente nuevamente'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Error interno del servidor', 'details': str(e)}), 500
@@ -253,28 +443,25 @@ def get_invoices():
     """Obtiene las facturas del usuario actual con paginación"""
     try:
         user_id = get_jwt_identity()
-        page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
         
         # Limitar per_page para evitar sobrecarga
         per_page = min(per_page, 100)
         
-        invoices = Invoice.query.filter_by(user_id=user_id)\
-                               .order_by(Invoice.timestamp.desc())\
-                               .paginate(page=page, per_page=per_page, error_out=False)
+        # Proyección opcional: solo se cargan las distribuciones si se van a retornar
+        fields, include_distribution = parse_invoice_projection()
+        
+        invoices, pagination = paginate_invoices(
+            with_distributions(Invoice.query, include_distribution).filter_by(user_id=user_id), per_page
+        )
         
         return jsonify({
-            'invoices': [invoice.to_dict() for invoice in invoices.items],
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': invoices.total,
-                'pages': invoices.pages,
-                'has_next': invoices.has_next,
-                'has_prev': invoices.has_prev
-            }
+            'invoices': [invoice.to_dict(fields, include_distribution) for invoice in invoices],
+            'pagination': pagination
         }), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Error interno del servidor'}), 500
 
@@ -300,131 +487,153 @@ def get_invoice(invoice_id):
     except Exception as e:
         return jsonify({'error': 'Error interno del servidor'}), 500
 
-@app.route('/blockchain/ledger', methods=['GET'])
+@app.route('/blockchain/validate', methods=['POST'])
 @jwt_required()
-def get_blockchain_ledger():
-    """Obtiene el ledger completo del blockchain con paginación"""
-    try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
-        
-        # Limitar per_page
-        per_page = min(per_page, 100)
-        
-        invoices = Invoice.query.order_by(Invoice.timestamp.desc())\
-                               .paginate(page=page, per_page=per_page, error_out=False)
-        
-        ledger_blocks = []
-        for invoice in invoices.items:
-            block_data = invoice.to_dict()
-            block_data['is_valid'] = validate_block_integrity(invoice)
-            ledger_blocks.append(block_data)
-        
-        return jsonify({
-            'ledger': ledger_blocks,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': invoices.total,
-                'pages': invoices.pages,
-                'has_next': invoices.has_next,
-                'has_prev': invoices.has_prev
-            }
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'error': 'Error interno del servidor'}), 500
+@rate_limiter.limit(app.config['RATE_LIMIT_VALIDATE'], scope='blockchain_validate')
+def validate_blockchain():
+    """Inicia la validación del blockchain como trabajo de fondo y retorna su id de inmediato
 
-@app.route('/blockchain/stats', methods=['GET'])
-@jwt_required()
-def get_blockchain_stats():
-    """Obtiene estadísticas del blockchain"""
+    Por defecto la validación es incremental desde el último punto de control: los bloques
+    anteriores se consideran verificados y no se vuelven a hashear. Con ?mode=full se ignora el
+    punto de control y se re-verifica la cadena completa (auditorías), y con ?mode=parallel la
+    auditoría completa reparte los hashes en un pool de procesos. El avance (bloques verificados)
+    y el resultado se consultan en status_url; el trabajo se cancela con cancel_url.
+    """
     try:
-        # Estadísticas generales
-        total_invoices = Invoice.query.count()
-        total_iva = db.session.query(db.func.sum(Invoice.iva_amount)).scalar() or 0
-        total_amount = db.session.query(db.func.sum(Invoice.total_amount)).scalar() or 0
-        
-        # Estadísticas por sector
-        sector_stats = db.session.query(
-            IVADistribution.sector,
-            db.func.sum(IVADistribution.amount).label('total_amount'),
-            db.func.count(IVADistribution.id).label('count')
-        ).filter(IVADistribution.subsector.is_(None))\
-         .group_by(IVADistribution.sector)\
-         .all()
-        
-        # Últimas transacciones
-        recent_invoices = Invoice.query.order_by(Invoice.timestamp.desc())\
-                                      .limit(5)\
-                                      .all()
+        mode = request.args.get('mode', 'incremental')
+        if mode not in ('incremental', 'full', 'parallel'):
+            return jsonify({'error': 'Modo de validación inválido'}), 400
+        
+        params = {'mode': mode}
+        if mode == 'parallel':
+            workers = request.args.get('workers', type=int)
+            partitions = request.args.get('partitions', type=int)
+            
+            # El pool de la auditoría no puede exceder los CPU ni los topes configurados
+            max_workers = max_audit_workers(app.config['AUDIT_MAX_WORKERS'])
+            if workers is not None and not 1 <= workers <= max_workers:
+                return jsonify({'error': f'workers debe estar entre 1 y {max_workers}'}), 400
+            max_partitions = app.config['AUDIT_MAX_PARTITIONS']
+            if partitions is not None and not 1 <= partitions <= max_partitions:
+                return jsonify({'error': f'partitions debe estar entre 1 y {max_partitions}'}), 400
+            
+            params.update(workers=workers, partitions=partitions)
+        
+        # Las validaciones completas ocupan un cupo hasta que termina su trabajo
+        full_chain = mode in ('full', 'parallel')
+        job_id = job_runner.submit(
+            VALIDATION_JOB_KIND, params, created_by=str(get_jwt_identity()),
+            limit_group=FULL_VALIDATION_GROUP if full_chain else None,
+            max_active=app.config['VALIDATION_MAX_CONCURRENT'] if full_chain else None
+        )
         
         return jsonify({
-            'general_stats': {
-                'total_invoices': total_invoices,
-                'total_iva_collected': float(total_iva),
-                'total_amount_processed': float(total_amount),
-                'average_invoice_amount': float(total_amount / total_invoices) if total_invoices > 0 else 0
-            },
-            'sector_distribution': [
-                {
-                    'sector': stat.sector,
-                    'total_amount': float(stat.total_amount),
-                    'transaction_count': stat.count,
-                    'percentage': float(stat.total_amount / total_iva * 100) if total_iva > 0 else 0
-                }
-                for stat in sector_stats
-            ],
-            'recent_transactions': [invoice.to_dict() for invoice in recent_invoices],
-            'distribution_config': IVA_DISTRIBUTION_CONFIG
-        }), 200
-        
+            'message': 'Validación iniciada',
+            'job_id': job_id,
+            'status_url': f'/jobs/{job_id}',
+            'cancel_url': f'/jobs/{job_id}/cancel'
+        }), 202
+        
+    except JobLimitError:
+        return jsonify({'error': 'Hay demasiadas validaciones completas en curso, intente más tarde'}), 503, {'Retry-After': '5'}
     except Exception as e:
         return jsonify({'error': 'Error interno del servidor'}), 500
 
-@app.route('/blockchain/validate', methods=['POST'])
+@app.route('/blockchain/validate/stream', methods=['POST'])
 @jwt_required()
-def validate_blockchain():
-    """Valida la integridad completa del blockchain"""
-    try:
-        invoices = Invoice.query.order_by(Invoice.id.asc()).all()
-        
-        validation_results = []
-        previous_hash = "0000000000000000000000000000000000000000000000000000000000000000"
-        
-        for invoice in invoices:
-            is_valid = validate_block_integrity(invoice)
-            hash_chain_valid = invoice.previous_hash == previous_hash
+@rate_limiter.limit(app.config['RATE_LIMIT_VALIDATE'], scope='blockchain_validate')
+def validate_blockchain_stream():
+    """Valida el blockchain emitiendo NDJSON: una línea por bloque inválido y un resumen final
+
+    Acepta los mismos modos que /blockchain/validate. La cadena se recorre en páginas keyset y
+    cada línea se envía en cuanto se calcula, de modo que la memoria del servidor es constante
+    sin importar el tamaño del ledger.
+    """
+    mode = request.args.get('mode', 'incremental')
+    if mode not in ('incremental', 'full'):
+        return jsonify({'error': 'Modo de validación inválido'}), 400
+    
+    # Una validación completa se registra como trabajo en curso para ocupar su cupo global
+    job_id = None
+    outcome = {'status': JOB_CANCELLED}
+    if mode == 'full':
+        try:
+            job_id = job_runner.track(
+                STREAM_VALIDATION_JOB_KIND, {'mode': mode}, created_by=str(get_jwt_identity()),
+                limit_group=FULL_VALIDATION_GROUP, max_active=app.config['VALIDATION_MAX_CONCURRENT']
+            )
+        except JobLimitError:
+            return jsonify({'error': 'Hay demasiadas validaciones completas en curso, intente más tarde'}), 503, {'Retry-After': '5'}
+    
+    def generate():
+        try:
+            checkpoint = ChainCheckpoint.query.get(CHECKPOINT_ID)
+            start, checkpoint_status = resolve_validation_start(checkpoint, full_rescan=(mode == 'full'))
+            summary = new_validation_summary(start)
             
-            validation_results.append({
-                'invoice_id': invoice.id,
-                'invoice_number': invoice.invoice_number,
-                'block_hash': invoice.block_hash,
-                'previous_hash': invoice.previous_hash,
-                'expected_previous_hash': previous_hash,
-                'hash_integrity_valid': is_valid,
-                'hash_chain_valid': hash_chain_valid,
-                'overall_valid': is_valid and hash_chain_valid
-            })
+            for result in validate_chain(start):
+                record_validation_result(summary, result)
+                if not result['overall_valid']:
+                    yield json.dumps(dict(result, type='invalid_block')) + '\n'
             
-            previous_hash = invoice.block_hash
-        
-        total_blocks = len(validation_results)
-        valid_blocks = sum(1 for result in validation_results if result['overall_valid'])
+            summary_data = finish_validation(checkpoint, summary, mode, checkpoint_status)
+            outcome.update(status=JOB_COMPLETED, result=summary_data)
+            yield json.dumps(dict(summary_data, type='summary')) + '\n'
+            
+        except Exception as e:
+            # Los encabezados ya se enviaron: el error se reporta como última línea
+            db.session.rollback()
+            outcome.update(status=JOB_FAILED, error=str(e))
+            yield json.dumps({'type': 'error', 'error': 'Error interno del servidor'}) + '\n'
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    if job_id:
+        # El cupo se libera al cerrar la respuesta; si el cliente se desconecta queda como cancelada
+        response.call_on_close(lambda: job_runner.finish(job_id, **outcome))
+    return response, 200
+
+@app.route('/blockchain/validate/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_validation_job(job_id):
+    """Obtiene el estado y el resultado de una validación (equivale a GET /jobs/<job_id>)"""
+    return get_job(job_id)
+
+@app.route('/blockchain/proof/<int:invoice_id>', methods=['GET'])
+@jwt_required()
+def get_inclusion_proof(invoice_id):
+    """Obtiene la prueba de inclusión O(log n) de una factura en la raíz de Merkle de su rango
+
+    El auditor recalcula el hash del bloque desde block con block_hashing.calculate_block_hash
+    (según hash_version) y con merkle.verify_inclusion_proof comprueba que pertenece a
+    root_hash sin descargar el ledger.
+    """
+    try:
+        invoice = Invoice.query.get(invoice_id)
+        if not invoice:
+            return jsonify({'error': 'Factura no encontrada'}), 404
         
         return jsonify({
-            'blockchain_valid': valid_blocks == total_blocks,
-            'total_blocks': total_blocks,
-            'valid_blocks': valid_blocks,
-            'invalid_blocks': total_blocks - valid_blocks,
-            'validation_details': validation_results
+            'invoice_id': invoice.id,
+            'block_hash': invoice.block_hash,
+            'hash_version': invoice.hash_version,
+            'block': build_block_data(invoice),
+            'block_is_valid': validate_block_integrity(invoice),
+            'merkle': build_inclusion_proof(invoice)
         }), 200
         
     except Exception as e:
         return jsonify({'error': 'Error interno del servidor'}), 500
 
+@app.route('/blockchain/merkle/ranges', methods=['GET'])
+@jwt_required()
+def get_merkle_ranges():
+    """Lista las raíces de Merkle selladas (las raíces contra las que se verifican las pruebas)"""
+    ranges = MerkleRange.query.order_by(MerkleRange.id.asc()).all()
+    return jsonify({'ranges': [merkle_range.to_dict() for merkle_range in ranges]}), 200
+
 @app.route('/config/iva-distribution', methods=['GET'])
 @jwt_required()
+@response_cache.cached()
 def get_iva_distribution_config():
     """Obtiene la configuración actual de distribución del IVA"""
     return jsonify({
@@ -438,6 +647,7 @@ def get_iva_distribution_config():
 
 @app.route('/invoices/search', methods=['GET'])
 @jwt_required()
+@rate_limiter.limit(app.config['RATE_LIMIT_SEARCH'], scope='invoices_search')
 def search_invoices():
     """Busca facturas por diferentes criterios"""
     try:
@@ -453,21 +663,21 @@ def search_invoices():
         max_amount = request.args.get('max_amount', type=float)
         
         # Paginación
-        page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
         per_page = min(per_page, 100)
         
-        # Construir consulta
-        query = Invoice.query.filter_by(user_id=user_id)
+        # Proyección opcional: solo se cargan las distribuciones si se van a retornar
+        fields, include_distribution = parse_invoice_projection()
         
-        if company_name:
-            query = query.filter(Invoice.company_name.ilike(f'%{company_name}%'))
-        
-        if company_nit:
-            query = query.filter(Invoice.company_nit.ilike(f'%{company_nit}%'))
+        # Construir consulta
+        query = with_distributions(Invoice.query, include_distribution).filter_by(user_id=user_id)
         
-        if invoice_number:
-            query = query.filter(Invoice.invoice_number.ilike(f'%{invoice_number}%'))
+        # Búsqueda por subcadena con el índice de búsqueda (FTS5 trigram / pg_trgm)
+        query = query.filter(*invoice_search.filter(db.session.connection(), {
+            'company_name': company_name,
+            'company_nit': company_nit,
+            'invoice_number': invoice_number
+        }))
         
         if date_from:
             try:
@@ -490,19 +700,11 @@ def search_invoices():
             query = query.filter(Invoice.total_amount <= max_amount)
         
         # Ejecutar consulta con paginación
-        invoices = query.order_by(Invoice.timestamp.desc())\
-                       .paginate(page=page, per_page=per_page, error_out=False)
+        invoices, pagination = paginate_invoices(query, per_page)
         
         return jsonify({
-            'invoices': [invoice.to_dict() for invoice in invoices.items],
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': invoices.total,
-                'pages': invoices.pages,
-                'has_next': invoices.has_next,
-                'has_prev': invoices.has_prev
-            },
+            'invoices': [invoice.to_dict(fields, include_distribution) for invoice in invoices],
+            'pagination': pagination,
             'search_criteria': {
                 'company_name': company_name,
                 'company_nit': company_nit,
@@ -514,5 +716,24 @@ def search_invoices():
             }
         }), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Error interno del servidor'}), 500
+
+# =========================================================
+# COMANDOS DE LÍNEA DE COMANDOS
+# =========================================================
+
+@app.cli.command('audit-chain')
+@click.option('--workers', type=int, default=None, help='Procesos del pool (por defecto, uno por CPU)')
+@click.option('--partitions', type=int, default=None, help='Rangos de id en que se divide la tabla')
+def audit_chain_command(workers, partitions):
+    """Audita la cadena completa verificando los hashes en paralelo"""
+    result = run_parallel_audit(
+        get_database_url(), workers=workers, partitions=partitions,
+        max_workers=app.config['AUDIT_MAX_WORKERS'], max_partitions=app.config['AUDIT_MAX_PARTITIONS']
+    )
+    click.echo(json.dumps(result, indent=2))
+    if not result['blockchain_valid']:
+        raise SystemExit(1)
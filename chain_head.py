@@ -0,0 +1,62 @@
+# Archivo: chain_head.py
+# Cabeza de la cadena en memoria y serialización de los anexados de bloques
+
+import threading
+
+class ChainHeadConflictError(Exception):
+    """No fue posible anexar el bloque porque otro proceso movió la cabeza de la cadena"""
+
+class ChainHeadCache:
+    """Mantiene en memoria el hash del último bloque y serializa los anexados del proceso
+
+    load_head() lee la cabeza desde la base de datos y solo se invoca en el primer anexado
+    o después de un conflicto. Entre procesos la exclusión la garantiza la función de
+    escritura con un compare-and-swap sobre la fila de cabeza en la base de datos.
+    """
+
+    def __init__(self, load_head, max_retries=5):
+        self._load_head = load_head
+        self._max_retries = max_retries
+        self._lock = threading.Lock()
+        self._head = None
+        self._listeners = []
+
+    def peek(self):
+        """Retorna el hash de la cabeza en caché (None si aún no se ha cargado)"""
+        return self._head
+
+    def subscribe(self, listener):
+        """Registra listener(block_hash), invocado después de cada anexado confirmado"""
+        self._listeners.append(listener)
+
+    def invalidate(self):
+        """Descarta la cabeza en caché para que el siguiente anexado la relea de la base de datos"""
+        self._head = None
+
+    def append(self, write_block):
+        """Anexa un bloque con el hash previo vigente
+
+        write_block(previous_hash) escribe y confirma el bloque y retorna su hash, o None si el
+        compare-and-swap de la cabeza falló (en ese caso debe haber revertido la transacción).
+        Ante un conflicto se relee la cabeza y se reintenta hasta max_retries veces.
+        """
+        with self._lock:
+            for _ in range(self._max_retries):
+                if self._head is None:
+                    self._head = self._load_head()
+
+                try:
+                    block_hash = write_block(self._head)
+                except Exception:
+                    self._head = None
+                    raise
+
+                if block_hash is not None:
+                    self._head = block_hash
+                    for listener in self._listeners:
+                        listener(block_hash)
+                    return block_hash
+
+                self._head = None
+
+        raise ChainHeadConflictError('La cabeza de la cadena cambió durante el anexado')
@@ -0,0 +1,178 @@
+# Archivo: db_pool.py
+# Pool de conexiones acotado y seguro entre hilos para el backend PyMySQL (server_improved.py):
+# reutiliza conexiones abiertas en lugar de pagar el handshake TCP + autenticación por solicitud.
+
+import threading
+import time
+
+class PoolExhaustedError(Exception):
+    """Todas las conexiones del pool están en uso y no se liberó ninguna dentro del tiempo de espera"""
+
+class PooledConnection:
+    """Conexión prestada por el pool: delega en la conexión real y close() la devuelve al pool"""
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def close(self):
+        """Devuelve la conexión al pool (llamadas repetidas no tienen efecto)"""
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool.release(connection)
+
+    def discard(self):
+        """Cierra la conexión real en lugar de devolverla (p. ej. tras abandonar un cursor sin buffer)"""
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool.discard(connection)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class ConnectionPool:
+    """Pool de conexiones DB-API con tamaño máximo, verificación al prestar y reciclaje por inactividad
+
+    connect() crea una conexión nueva. Al prestar una conexión inactiva se verifica con ping()
+    (las que fallan se reemplazan) y las que superan max_idle segundos sin uso se cierran y se
+    reemplazan. Al devolverla se revierte cualquier transacción abierta. Si las max_size
+    conexiones están en uso, acquire() espera hasta timeout segundos y luego lanza
+    PoolExhaustedError.
+    """
+
+    def __init__(self, connect, max_size=10, max_idle=300, timeout=5.0):
+        self._connect = connect
+        self._max_size = max_size
+        self._max_idle = max_idle
+        self._timeout = timeout
+        self._condition = threading.Condition()
+        self._idle = []
+        self._size = 0
+        self._counters = {
+            'checkouts': 0,
+            'connections_created': 0,
+            'connections_reused': 0,
+            'connections_recycled': 0,
+            'failed_pings': 0,
+            'waits': 0,
+            'exhausted': 0
+        }
+
+    def acquire(self):
+        """Presta una conexión del pool"""
+        deadline = time.monotonic() + self._timeout
+        waited = False
+
+        with self._condition:
+            while True:
+                if self._idle:
+                    connection, released_at = self._idle.pop()
+                    break
+                if self._size < self._max_size:
+                    # Se reserva el cupo; la conexión se crea fuera del candado
+                    self._size += 1
+                    connection = released_at = None
+                    break
+
+                remaining = deadline - time.monotonic()
+                if not waited:
+                    self._counters['waits'] += 1
+                    waited = True
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    if not self._idle and self._size >= self._max_size:
+                        self._counters['exhausted'] += 1
+                        raise PoolExhaustedError(f'Las {self._max_size} conexiones del pool están en uso')
+
+            self._counters['checkouts'] += 1
+
+        if connection is not None:
+            connection = self._check(connection, released_at)
+        if connection is None:
+            connection = self._create()
+
+        return PooledConnection(self, connection)
+
+    def release(self, connection):
+        """Recibe una conexión devuelta; si quedó inservible se descarta y se libera su cupo"""
+        try:
+            connection.rollback()
+        except Exception:
+            self.discard(connection)
+            return
+
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def discard(self, connection):
+        """Cierra una conexión prestada que no debe volver al pool y libera su cupo"""
+        self._close(connection)
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def stats(self):
+        """Estado del pool y contadores acumulados (incluidos los agotamientos)"""
+        with self._condition:
+            return dict(
+                self._counters,
+                max_size=self._max_size,
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._size - len(self._idle)
+            )
+
+    def close_all(self):
+        """Cierra las conexiones inactivas (las prestadas se cierran al devolverse)"""
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for connection, _ in idle:
+            self._close(connection)
+
+    def _check(self, connection, released_at):
+        """Retorna la conexión si sigue sana, o None si se cerró por inactividad o por fallar el ping"""
+        if time.monotonic() - released_at > self._max_idle:
+            self._close(connection)
+            self._count('connections_recycled')
+            return None
+
+        try:
+            connection.ping(reconnect=False)
+        except Exception:
+            self._close(connection)
+            self._count('failed_pings')
+            return None
+
+        self._count('connections_reused')
+        return connection
+
+    def _create(self):
+        try:
+            connection = self._connect()
+        except Exception:
+            # El cupo reservado se libera para que otro hilo pueda intentarlo
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        self._count('connections_created')
+        return connection
+
+    def _count(self, name):
+        with self._condition:
+            self._counters[name] += 1
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
@@ -0,0 +1,63 @@
+# Archivo: identity_cache.py
+# Caché de corta duración de la identidad del JWT -> datos del usuario, para que las solicitudes
+# autenticadas no consulten la tabla users en cada llamada.
+
+import threading
+import time
+from collections import OrderedDict
+
+class IdentityCache:
+    """Datos de usuario por identidad con expiración de ttl segundos y expulsión LRU
+
+    load(identity) retorna los datos del usuario (un valor inmutable) o None si no existe; los
+    None no se guardan. invalidate(identity) descarta la entrada cuando cambian los datos del
+    usuario en este proceso; en otros procesos el cambio se ve al vencer el ttl. Una carga que
+    empezó antes de una invalidación no se guarda, para no reinstalar datos viejos.
+    """
+
+    def __init__(self, load, ttl=30, max_entries=4096):
+        self._load = load
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, identity):
+        key = str(identity)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                return entry[1]
+            self._counters['misses'] += 1
+            generation = self._generation
+
+        value = self._load(identity)
+        if value is None:
+            return None
+
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (time.monotonic() + self._ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self._max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, identity):
+        with self._lock:
+            self._entries.pop(str(identity), None)
+            self._generation += 1
+            self._counters['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries), ttl=self._ttl)
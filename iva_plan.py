@@ -0,0 +1,168 @@
+# Archivo: iva_plan.py
+# Plan precompilado de distribución del IVA: la configuración anidada se recorre una sola vez
+# y cada factura se distribuye con un único ciclo sobre una tupla de multiplicadores Decimal.
+
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+
+# Una fila de la distribución. Los porcentajes se conservan como float (tal como aparecen en
+# la configuración y en las respuestas de la API) y como Decimal (para persistirlos).
+IVAPlanEntry = namedtuple('IVAPlanEntry', [
+    'sector',
+    'percentage',
+    'percentage_decimal',
+    'subsector',
+    'subsector_percentage',
+    'subsector_percentage_decimal',
+    'subsector_multiplier'
+])
+
+# Sector que recibe el porcentaje no asignado por la configuración
+OTHER_SECTOR = 'Otros'
+
+# Precisión de las columnas de montos de iva_distributions (Numeric(15, 2))
+CENTS = Decimal('0.01')
+
+def compile_iva_plan(config):
+    """Compila la configuración de distribución del IVA en una tupla inmutable de filas"""
+    entries = []
+    remaining_percentage = 1.0
+
+    for sector, sector_config in config.items():
+        sector_percentage = sector_config['percentage']
+        sector_decimal = Decimal(str(sector_percentage))
+
+        # Distribución principal del sector
+        entries.append(IVAPlanEntry(sector, sector_percentage, sector_decimal, None, None, None, None))
+
+        # Distribución por subsectores: el multiplicador combinado evita una multiplicación por fila
+        for subsector, sub_percentage in sector_config['breakdown'].items():
+            sub_decimal = Decimal(str(sub_percentage))
+            entries.append(IVAPlanEntry(
+                sector, sector_percentage, sector_decimal,
+                subsector, sub_percentage, sub_decimal, sector_decimal * sub_decimal
+            ))
+
+        remaining_percentage -= sector_percentage
+
+    # Distribución del porcentaje restante a "Otros"
+    if remaining_percentage > 0:
+        entries.append(IVAPlanEntry(
+            OTHER_SECTOR, remaining_percentage, Decimal(str(remaining_percentage)), None, None, None, None
+        ))
+
+    return tuple(entries)
+
+def distribute_with_plan(plan, iva_amount):
+    """Distribuye un monto de IVA según el plan (mismo formato que distribute_iva)"""
+    return [
+        {
+            'sector': entry.sector,
+            'percentage': entry.percentage,
+            'amount': iva_amount * entry.percentage_decimal,
+            'subsector': entry.subsector,
+            'subsector_percentage': entry.subsector_percentage,
+            'subsector_amount': iva_amount * entry.subsector_multiplier if entry.subsector else None
+        }
+        for entry in plan
+    ]
+
+def plan_distribution_rows(plan, invoice_id, iva_amount):
+    """Genera las filas de iva_distributions de una factura directamente desde el plan
+
+    Los montos se redondean a centavos (half-up), la precisión declarada de las columnas, para
+    que todos los motores de base de datos persistan exactamente el mismo valor.
+    """
+    return [
+        {
+            'invoice_id': invoice_id,
+            'sector': entry.sector,
+            'percentage': entry.percentage_decimal,
+            'amount': (iva_amount * entry.percentage_decimal).quantize(CENTS, rounding=ROUND_HALF_UP),
+            'subsector': entry.subsector,
+            'subsector_percentage': entry.subsector_percentage_decimal,
+            'subsector_amount': (iva_amount * entry.subsector_multiplier).quantize(CENTS, rounding=ROUND_HALF_UP)
+                                if entry.subsector else None
+        }
+        for entry in plan
+    ]
+
+# =========================================================
+# MODO VECTORIZADO (LOTES COMPLETOS, COLUMNA POR COLUMNA)
+# =========================================================
+
+def distribute_batch(plan, iva_amounts):
+    """Distribuye un lote completo de montos de IVA, una columna del plan a la vez
+
+    Retorna, por cada fila del plan, la columna de montos del sector y la de montos del
+    subsector (None para filas sin subsector), alineadas con iva_amounts. Los valores son
+    idénticos a los de distribute_with_plan para cada monto.
+    """
+    return [
+        (
+            [amount * entry.percentage_decimal for amount in iva_amounts],
+            [amount * entry.subsector_multiplier for amount in iva_amounts] if entry.subsector else None
+        )
+        for entry in plan
+    ]
+
+def _as_fraction(value):
+    """Representa un Decimal como (numerador, denominador) enteros con denominador potencia de 10"""
+    exponent = value.as_tuple().exponent
+    if exponent >= 0:
+        return int(value), 1
+    return int(value.scaleb(-exponent)), 10 ** -exponent
+
+def to_cents(amount):
+    """Convierte un monto a centavos enteros (redondeo half-up)"""
+    return int((Decimal(amount) * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+def _scale_cents(cents, numerator, denominator):
+    """Multiplica centavos no negativos por una fracción redondeando half-up"""
+    return [(value * numerator * 2 + denominator) // (2 * denominator) for value in cents]
+
+def distribute_batch_cents(plan, iva_amounts):
+    """Variante de distribute_batch en aritmética entera: montos redondeados a centavos enteros
+
+    Pensada para trabajos de recálculo y agregación, donde sumar enteros evita acumular
+    Decimal con más precisión de la que persisten las columnas Numeric(15, 2).
+    """
+    cents = [to_cents(amount) for amount in iva_amounts]
+    columns = []
+
+    for entry in plan:
+        sector_amounts = _scale_cents(cents, *_as_fraction(entry.percentage_decimal))
+        subsector_amounts = _scale_cents(cents, *_as_fraction(entry.subsector_multiplier)) if entry.subsector else None
+        columns.append((sector_amounts, subsector_amounts))
+
+    return columns
+
+def plan_distribution_rows_batch(plan, invoice_ids, iva_amounts):
+    """Genera las filas de iva_distributions de un lote de facturas en modo vectorizado
+
+    Produce las mismas filas que plan_distribution_rows para cada factura del lote.
+    """
+    rows = []
+
+    for entry, (sector_amounts, subsector_amounts) in zip(plan, distribute_batch(plan, iva_amounts)):
+        sector_amounts = [amount.quantize(CENTS, rounding=ROUND_HALF_UP) for amount in sector_amounts]
+        if subsector_amounts:
+            subsector_amounts = [amount.quantize(CENTS, rounding=ROUND_HALF_UP) for amount in subsector_amounts]
+        sector, percentage = entry.sector, entry.percentage_decimal
+        subsector, subsector_percentage = entry.subsector, entry.subsector_percentage_decimal
+        rows.extend(
+            {
+                'invoice_id': invoice_id,
+                'sector': sector,
+                'percentage': percentage,
+                'amount': amount,
+                'subsector': subsector,
+                'subsector_percentage': subsector_percentage,
+                'subsector_amount': subsector_amount
+            }
+            for invoice_id, amount, subsector_amount in zip(
+                invoice_ids, sector_amounts, subsector_amounts or [None] * len(sector_amounts)
+            )
+        )
+
+    return rows
@@ -0,0 +1,384 @@
+# Archivo: job_runner.py
+# Trabajos de fondo para las operaciones largas del ledger: una tabla jobs en la base de datos de
+# la aplicación (SQLite por defecto) y un pool de hilos local, sin intermediarios externos. La
+# solicitud recibe el id del trabajo de inmediato y consulta su estado y avance en la tabla.
+
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import (MetaData, Table, Column, Index, String, Text, Boolean, DateTime, func, inspect, literal,
+                        or_, select, text)
+
+# Estados de un trabajo
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+FINISHED_STATUSES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+ACTIVE_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+
+# Columnas agregadas después de la creación de la tabla (ver ensure_table)
+ADDED_COLUMNS = ('owner', 'heartbeat_at', 'limit_group')
+
+_metadata = MetaData()
+jobs_table = Table(
+    'jobs', _metadata,
+    Column('id', String(32), primary_key=True),
+    Column('kind', String(50), nullable=False),
+    Column('status', String(20), nullable=False),
+    Column('params', Text),
+    Column('progress', Text),
+    Column('result', Text),
+    Column('error', Text),
+    Column('created_by', String(50)),
+    Column('cancel_requested', Boolean, nullable=False, default=False),
+    Column('created_at', DateTime, nullable=False),
+    Column('started_at', DateTime),
+    Column('finished_at', DateTime),
+    Column('owner', String(100)),
+    Column('heartbeat_at', DateTime),
+    Column('limit_group', String(50)),
+    Index('ix_jobs_status_finished_at', 'status', 'finished_at')
+)
+
+class JobCancelledError(Exception):
+    """Se pidió cancelar el trabajo; lo lanza progress() para detener la función del trabajo"""
+
+class UnknownJobKindError(Exception):
+    """No hay una función registrada para el tipo de trabajo"""
+
+class JobLimitError(Exception):
+    """El grupo del trabajo ya tiene max_active trabajos pendientes en la base de datos"""
+
+def _dumps(value):
+    return json.dumps(value, default=str) if value is not None else None
+
+def _loads(value):
+    return json.loads(value) if value is not None else None
+
+def current_owner():
+    """Identificador del proceso que ejecuta los trabajos (host:pid)"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def lock_limit_group(connection, limit_group, timeout=10):
+    """Serializa las admisiones del grupo entre procesos hasta que termina la transacción
+
+    En READ COMMITTED dos transacciones pueden contar los pendientes a la vez y admitir ambas, así
+    que el conteo va detrás de un lock por grupo: un advisory lock de transacción en PostgreSQL y
+    un lock con nombre en MySQL (se libera en unlock_limit_group, después del commit). En SQLite no
+    hace falta: el DELETE de retención que precede al conteo ya toma el lock de escritura de la
+    base de datos. En otros motores el tope no está garantizado entre procesos.
+    """
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        key = zlib.crc32(f'jobs:{limit_group}'.encode())
+        connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': key})
+    elif dialect in ('mysql', 'mariadb'):
+        acquired = connection.execute(
+            text('SELECT GET_LOCK(:name, :timeout)'), {'name': f'jobs:{limit_group}', 'timeout': timeout}
+        ).scalar()
+        if acquired != 1:
+            raise JobLimitError(f'No se pudo reservar un lugar en {limit_group}; intente de nuevo')
+
+def unlock_limit_group(connection, limit_group):
+    if connection.dialect.name in ('mysql', 'mariadb'):
+        connection.execute(text('SELECT RELEASE_LOCK(:name)'), {'name': f'jobs:{limit_group}'})
+        connection.commit()
+
+def job_to_dict(row):
+    """Serializa una fila de jobs para la API"""
+    return {
+        'job_id': row.id,
+        'kind': row.kind,
+        'status': row.status,
+        'params': _loads(row.params),
+        'progress': _loads(row.progress),
+        'result': _loads(row.result),
+        'error': row.error,
+        'created_by': row.created_by,
+        'cancel_requested': bool(row.cancel_requested),
+        'created_at': row.created_at.isoformat(),
+        'started_at': row.started_at.isoformat() if row.started_at else None,
+        'finished_at': row.finished_at.isoformat() if row.finished_at else None,
+        'heartbeat_at': row.heartbeat_at.isoformat() if row.heartbeat_at else None
+    }
+
+class JobRunner:
+    """Ejecuta funciones registradas por tipo en un pool de max_workers hilos
+
+    La función de un tipo recibe (params, progress) y retorna un resultado serializable a JSON.
+    progress(**campos) publica el avance (se escribe a lo sumo cada progress_interval segundos)
+    y lanza JobCancelledError si se pidió cancelar el trabajo, de modo que la cancelación se
+    atiende en el siguiente reporte de avance. get_engine() retorna el motor de SQLAlchemy de la
+    base de datos de los trabajos. Cada proceso ejecuta los trabajos que recibe; el estado, el
+    avance y la cancelación pasan por la tabla, así que cualquier worker los atiende.
+
+    Cada trabajo registra el proceso que lo ejecuta (owner), y un hilo de ese proceso renueva su
+    heartbeat_at cada heartbeat_interval segundos mientras no termine. Un trabajo pendiente cuyo
+    latido tiene más de stale_after se da por interrumpido (su proceso terminó sin cerrarlo).
+
+    Los trabajos de un mismo limit_group pueden limitarse a max_active pendientes a la vez: el
+    conteo y la inserción son una sola sentencia tomada bajo el lock del grupo (ver
+    lock_limit_group), así que el tope es global para todos los procesos que comparten la base de
+    datos en SQLite, PostgreSQL y MySQL.
+    """
+
+    def __init__(self, get_engine, max_workers=2, progress_interval=0.5, retention=timedelta(hours=24),
+                 heartbeat_interval=10.0, stale_after=None):
+        self._get_engine = get_engine
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._progress_interval = progress_interval
+        self._retention = retention
+        self._heartbeat_interval = heartbeat_interval
+        self._stale_after = stale_after or timedelta(seconds=3 * heartbeat_interval)
+        self._heartbeat_pid = None
+        self._active = 0
+        self._functions = {}
+        self._lock = threading.Lock()
+        self._counters = {'submitted': 0, 'running': 0, JOB_COMPLETED: 0, JOB_FAILED: 0, JOB_CANCELLED: 0}
+
+    def register(self, kind, function):
+        self._functions[kind] = function
+        return function
+
+    def ensure_table(self):
+        """Crea la tabla jobs si no existe y le agrega las columnas posteriores a su creación"""
+        engine = self._get_engine()
+        _metadata.create_all(engine, tables=[jobs_table])
+
+        existing = {column['name'] for column in inspect(engine).get_columns('jobs')}
+        with engine.begin() as connection:
+            for name in ADDED_COLUMNS:
+                if name not in existing:
+                    column_type = jobs_table.c[name].type.compile(engine.dialect)
+                    connection.execute(text(f'ALTER TABLE jobs ADD COLUMN {name} {column_type}'))
+
+    def recover_interrupted(self):
+        """Marca como fallidos los trabajos pendientes cuyo proceso dejó de renovar su latido
+
+        Los trabajos de otros procesos vivos no se tocan. Se llama al iniciar el servidor y en
+        cada submit(), así que los trabajos de un worker caído no quedan pendientes para siempre.
+        """
+        with self._get_engine().begin() as connection:
+            return self._recover_stale(connection, datetime.utcnow())
+
+    def submit(self, kind, params=None, created_by=None, limit_group=None, max_active=None):
+        """Registra el trabajo y lo encola; retorna su id
+
+        Con max_active lanza JobLimitError si limit_group ya tiene max_active trabajos pendientes.
+        """
+        if kind not in self._functions:
+            raise UnknownJobKindError(f'Tipo de trabajo desconocido: {kind}')
+
+        job_id = self._create(kind, JOB_QUEUED, params, created_by, limit_group, max_active)
+        self._count('submitted')
+        self._executor.submit(self._run, job_id, kind, params)
+        return job_id
+
+    def track(self, kind, params=None, created_by=None, limit_group=None, max_active=None):
+        """Registra como trabajo en curso una operación que el llamador ejecuta por su cuenta
+
+        Sirve para que las operaciones síncronas (respuestas en streaming) cuenten en el tope de
+        su limit_group y renueven su latido. Debe cerrarse con finish(); retorna su id.
+        """
+        return self._create(kind, JOB_RUNNING, params, created_by, limit_group, max_active)
+
+    def finish(self, job_id, status=JOB_COMPLETED, result=None, error=None):
+        """Cierra un trabajo registrado con track()"""
+        try:
+            with self._get_engine().begin() as connection:
+                connection.execute(
+                    jobs_table.update().where(jobs_table.c.id == job_id)
+                    .values(status=status, result=_dumps(result), error=error, finished_at=datetime.utcnow())
+                )
+        finally:
+            self._release()
+
+    def count_active(self, limit_group):
+        """Trabajos pendientes (en cola o en curso) del grupo en todos los procesos"""
+        with self._get_engine().connect() as connection:
+            return connection.execute(
+                select(func.count()).select_from(jobs_table)
+                .where(jobs_table.c.limit_group == limit_group, jobs_table.c.status.in_(ACTIVE_STATUSES))
+            ).scalar()
+
+    def get(self, job_id):
+        """Estado del trabajo o None si no existe"""
+        with self._get_engine().connect() as connection:
+            row = connection.execute(select(jobs_table).where(jobs_table.c.id == job_id)).first()
+        return job_to_dict(row) if row else None
+
+    def cancel(self, job_id):
+        """Pide cancelar el trabajo: uno en cola se cancela de inmediato y uno en curso al
+        reportar su siguiente avance. Retorna el estado del trabajo o None si no existe."""
+        with self._get_engine().begin() as connection:
+            connection.execute(
+                jobs_table.update()
+                .where(jobs_table.c.id == job_id, jobs_table.c.status.in_((JOB_QUEUED, JOB_RUNNING)))
+                .values(cancel_requested=True)
+            )
+            connection.execute(
+                jobs_table.update()
+                .where(jobs_table.c.id == job_id, jobs_table.c.status == JOB_QUEUED)
+                .values(status=JOB_CANCELLED, finished_at=datetime.utcnow())
+            )
+        return self.get(job_id)
+
+    def stats(self):
+        """Trabajos en curso en este proceso y contadores por estado final"""
+        with self._lock:
+            return dict(self._counters)
+
+    def _create(self, kind, status, params, created_by, limit_group, max_active):
+        job_id = uuid.uuid4().hex
+        now = datetime.utcnow()
+        values = dict(
+            id=job_id, kind=kind, status=status, params=_dumps(params), created_by=created_by,
+            cancel_requested=False, created_at=now, started_at=now if status == JOB_RUNNING else None,
+            owner=current_owner(), heartbeat_at=now, limit_group=limit_group
+        )
+        with self._get_engine().connect() as connection:
+            try:
+                if max_active is not None:
+                    lock_limit_group(connection, limit_group)
+                # Los trabajos terminados se conservan durante retention para consultar su resultado
+                connection.execute(
+                    jobs_table.delete()
+                    .where(jobs_table.c.status.in_(FINISHED_STATUSES), jobs_table.c.finished_at < now - self._retention)
+                )
+                self._recover_stale(connection, now)
+
+                if max_active is None:
+                    connection.execute(jobs_table.insert().values(**values))
+                else:
+                    # INSERT ... SELECT condicionado al conteo de pendientes del grupo en la misma sentencia
+                    active = select(func.count().label('active')).select_from(jobs_table).where(
+                        jobs_table.c.limit_group == limit_group, jobs_table.c.status.in_(ACTIVE_STATUSES)
+                    ).subquery()
+                    row = select(*[literal(value, jobs_table.c[name].type) for name, value in values.items()])\
+                        .select_from(active).where(active.c.active < max_active)
+                    if not connection.execute(jobs_table.insert().from_select(list(values), row)).rowcount:
+                        raise JobLimitError(f'Ya hay {max_active} trabajos de {limit_group} en curso')
+                connection.commit()
+            finally:
+                if max_active is not None:
+                    connection.rollback()
+                    unlock_limit_group(connection, limit_group)
+
+        with self._lock:
+            self._active += 1
+            self._ensure_heartbeat()
+        return job_id
+
+    def _release(self):
+        with self._lock:
+            self._active -= 1
+
+    def _run(self, job_id, kind, params):
+        try:
+            now = datetime.utcnow()
+            with self._get_engine().begin() as connection:
+                started = connection.execute(
+                    jobs_table.update()
+                    .where(jobs_table.c.id == job_id, jobs_table.c.status == JOB_QUEUED)
+                    .values(status=JOB_RUNNING, started_at=now, heartbeat_at=now)
+                ).rowcount
+            if not started:
+                return  # Cancelado antes de empezar
+
+            self._count('running')
+            reported = {}
+            try:
+                result = self._functions[kind](params, self._progress_reporter(job_id, reported))
+                status, error = JOB_COMPLETED, None
+            except JobCancelledError:
+                result, status, error = None, JOB_CANCELLED, None
+            except Exception as e:
+                result, status, error = None, JOB_FAILED, str(e)
+            finally:
+                self._count('running', -1)
+
+            # El último avance reportado se escribe con el estado final, aunque el intervalo lo haya omitido
+            values = dict(status=status, result=_dumps(result), error=error, finished_at=datetime.utcnow())
+            if reported:
+                values['progress'] = _dumps(reported)
+            with self._get_engine().begin() as connection:
+                connection.execute(jobs_table.update().where(jobs_table.c.id == job_id).values(**values))
+            self._count(status)
+        except Exception as e:
+            print(f"Error al ejecutar el trabajo {job_id}: {e}")
+        finally:
+            self._release()
+
+    def _progress_reporter(self, job_id, reported):
+        """Función progress() del trabajo; reported conserva el último avance, escrito o no"""
+        last_write = [0.0]
+
+        def progress(force=False, **fields):
+            reported.clear()
+            reported.update(fields)
+            now = time.monotonic()
+            if not force and now - last_write[0] < self._progress_interval:
+                return
+            last_write[0] = now
+
+            # Una sola sentencia publica el avance y detecta la cancelación
+            with self._get_engine().begin() as connection:
+                updated = connection.execute(
+                    jobs_table.update()
+                    .where(jobs_table.c.id == job_id, jobs_table.c.cancel_requested.is_(False))
+                    .values(progress=_dumps(fields), heartbeat_at=datetime.utcnow())
+                ).rowcount
+            if not updated:
+                raise JobCancelledError(job_id)
+
+        return progress
+
+    def _recover_stale(self, connection, now):
+        return connection.execute(
+            jobs_table.update()
+            .where(
+                jobs_table.c.status.in_(ACTIVE_STATUSES),
+                or_(jobs_table.c.heartbeat_at.is_(None), jobs_table.c.heartbeat_at < now - self._stale_after)
+            )
+            .values(status=JOB_FAILED, error='Interrumpido: el proceso que lo ejecutaba dejó de responder',
+                    finished_at=now)
+        ).rowcount
+
+    def _ensure_heartbeat(self):
+        """Inicia el hilo de latidos del proceso (debe llamarse con self._lock tomado)
+
+        Se comprueba el pid porque un proceso creado con fork no hereda los hilos del padre.
+        """
+        if self._heartbeat_pid != os.getpid():
+            self._heartbeat_pid = os.getpid()
+            threading.Thread(target=self._beat, name='job-heartbeat', daemon=True).start()
+
+    def _beat(self):
+        owner = current_owner()
+        while True:
+            time.sleep(self._heartbeat_interval)
+            with self._lock:
+                if not self._active:
+                    continue
+            try:
+                with self._get_engine().begin() as connection:
+                    connection.execute(
+                        jobs_table.update()
+                        .where(jobs_table.c.owner == owner, jobs_table.c.status.in_(ACTIVE_STATUSES))
+                        .values(heartbeat_at=datetime.utcnow())
+                    )
+            except Exception as e:
+                print(f"Error al renovar el latido de los trabajos: {e}")
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
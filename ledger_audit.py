@@ -0,0 +1,191 @@
+# Archivo: ledger_audit.py
+# Auditoría paralela de la cadena completa: verifica los hashes por rangos de id en un
+# pool de procesos y luego une los enlaces previous_hash entre particiones.
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sqlalchemy import create_engine, select, func, MetaData, Table, Column, Integer, String, Numeric, DateTime
+from block_hashing import verify_block_hash, GENESIS_PREVIOUS_HASH
+
+# Particiones por worker: más particiones que procesos reparte mejor la carga
+PARTITIONS_PER_WORKER = 4
+
+# Máximo de particiones de una auditoría (cada una es una tarea del pool y una consulta)
+MAX_PARTITIONS = 256
+
+# Máximo de ids inválidos incluidos en el resultado (el conteo siempre es exacto)
+MAX_REPORTED_INVALID = 1000
+
+# Subconjunto de la tabla invoices necesario para recalcular los hashes. Se declara con
+# SQLAlchemy Core para que los procesos del pool no tengan que importar la aplicación Flask.
+_metadata = MetaData()
+invoices_table = Table(
+    'invoices', _metadata,
+    Column('id', Integer, primary_key=True),
+    Column('invoice_number', String(100)),
+    Column('company_name', String(200)),
+    Column('company_nit', String(50)),
+    Column('subtotal', Numeric(15, 2)),
+    Column('iva_amount', Numeric(15, 2)),
+    Column('total_amount', Numeric(15, 2)),
+    Column('block_hash', String(64)),
+    Column('previous_hash', String(64)),
+    Column('timestamp', DateTime),
+    Column('user_id', Integer),
+    Column('hash_version', Integer)
+)
+
+# Motor de base de datos por proceso del pool (se crea en el primer uso)
+_engines = {}
+
+# =========================================================
+# FUNCIONES DE AUDITORÍA
+# =========================================================
+
+def get_engine(database_url):
+    """Obtiene el motor de base de datos del proceso actual"""
+    engine = _engines.get(database_url)
+    if engine is None:
+        engine = create_engine(database_url)
+        _engines[database_url] = engine
+    return engine
+
+def reset_engines():
+    """Inicializador de los procesos del pool: descarta los motores heredados del proceso padre
+
+    Con fork, el hijo hereda el pool de conexiones del motor que el padre ya usó; dispose(close=False)
+    lo abandona sin cerrar esas conexiones (siguen siendo del padre) y el hijo abre las suyas.
+    """
+    for engine in _engines.values():
+        engine.dispose(close=False)
+    _engines.clear()
+
+def max_audit_workers(limit=None):
+    """Máximo de procesos de una auditoría: uno por CPU y, si se indica, no más de limit"""
+    cpus = os.cpu_count() or 1
+    return min(cpus, limit) if limit else cpus
+
+def plan_partitions(min_id, max_id, partitions):
+    """Divide el rango [min_id, max_id] en rangos de id contiguos y del mismo tamaño"""
+    if min_id is None or max_id is None:
+        return []
+
+    span = max_id - min_id + 1
+    partitions = max(1, min(partitions, span))
+    size = -(-span // partitions)
+
+    return [(lo, min(lo + size - 1, max_id)) for lo in range(min_id, max_id + 1, size)]
+
+def audit_partition(database_url, lo, hi):
+    """Verifica los hashes de los bloques con id en [lo, hi] (se ejecuta en un proceso del pool)
+
+    Además de los hashes verifica el enlace previous_hash entre bloques de la misma partición;
+    el enlace del primer bloque se resuelve después al unir las particiones.
+    """
+    query = select(invoices_table)\
+        .where(invoices_table.c.id.between(lo, hi))\
+        .order_by(invoices_table.c.id.asc())
+
+    count = 0
+    first = None
+    previous_hash = None
+    invalid_ids = []
+
+    with get_engine(database_url).connect() as connection:
+        for block in connection.execute(query):
+            if first is None:
+                first = {'id': block.id, 'previous_hash': block.previous_hash}
+                link_valid = True
+            else:
+                link_valid = block.previous_hash == previous_hash
+
+            if not link_valid or not verify_block_hash(block):
+                invalid_ids.append(block.id)
+
+            previous_hash = block.block_hash
+            count += 1
+
+    return {
+        'range': (lo, hi),
+        'count': count,
+        'first': first,
+        'last_hash': previous_hash,
+        'invalid_ids': invalid_ids
+    }
+
+def stitch_partitions(partition_results):
+    """Une los resultados de las particiones verificando el enlace entre sus bordes"""
+    expected_previous_hash = GENESIS_PREVIOUS_HASH
+    invalid_ids = []
+    total_blocks = 0
+
+    for result in sorted(partition_results, key=lambda r: r['range'][0]):
+        if not result['count']:
+            continue
+
+        first = result['first']
+        if first['previous_hash'] != expected_previous_hash and result['invalid_ids'][:1] != [first['id']]:
+            invalid_ids.append(first['id'])
+
+        invalid_ids.extend(result['invalid_ids'])
+        total_blocks += result['count']
+        expected_previous_hash = result['last_hash']
+
+    invalid_ids.sort()
+    return total_blocks, invalid_ids
+
+def run_parallel_audit(database_url, workers=None, partitions=None, progress=None,
+                       max_workers=None, max_partitions=MAX_PARTITIONS):
+    """Audita la cadena completa repartiendo la verificación de hashes en un pool de procesos
+
+    workers se acota a max_audit_workers(max_workers) y partitions a max_partitions.
+    progress, si se indica, recibe (particiones_completadas, total_particiones, bloques_verificados)
+    cada vez que termina una partición; si lanza una excepción, la auditoría se interrumpe.
+    """
+    if (workers is not None and workers < 1) or (partitions is not None and partitions < 1):
+        raise ValueError('workers y partitions deben ser mayores que cero')
+
+    started_at = time.perf_counter()
+    workers = min(workers or os.cpu_count() or 1, max_audit_workers(max_workers))
+    partitions = min(partitions or workers * PARTITIONS_PER_WORKER, max_partitions)
+
+    with get_engine(database_url).connect() as connection:
+        min_id, max_id = connection.execute(
+            select(func.min(invoices_table.c.id), func.max(invoices_table.c.id))
+        ).one()
+
+    ranges = plan_partitions(min_id, max_id, partitions)
+    partition_results = []
+    blocks_verified = 0
+
+    if ranges:
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), initializer=reset_engines) as executor:
+            futures = [executor.submit(audit_partition, database_url, lo, hi) for lo, hi in ranges]
+            try:
+                for future in as_completed(futures):
+                    result = future.result()
+                    partition_results.append(result)
+                    blocks_verified += result['count']
+                    if progress:
+                        progress(len(partition_results), len(ranges), blocks_verified)
+            except BaseException:
+                # Un error o una cancelación (lanzada por progress) descarta las particiones pendientes
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    total_blocks, invalid_ids = stitch_partitions(partition_results)
+    elapsed = time.perf_counter() - started_at
+
+    return {
+        'blockchain_valid': not invalid_ids,
+        'mode': 'parallel',
+        'total_blocks': total_blocks,
+        'valid_blocks': total_blocks - len(invalid_ids),
+        'invalid_blocks': len(invalid_ids),
+        'invalid_block_ids': invalid_ids[:MAX_REPORTED_INVALID],
+        'workers': workers,
+        'partitions': len(ranges),
+        'elapsed_seconds': round(elapsed, 3),
+        'blocks_per_second': round(total_blocks / elapsed, 1) if elapsed > 0 else 0
+    }
@@ -0,0 +1,174 @@
+# Archivo: login_activity.py
+# Buffer de escritura diferida para la actividad de inicio de sesión (intentos fallidos, bloqueo y
+# último acceso): los cambios se acumulan en memoria y se escriben por lotes desde un hilo, en
+# lugar de un commit por intento. La base de datos sigue siendo la fuente de verdad.
+
+import atexit
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+# Estado de inicio de sesión de un usuario, con la forma de las columnas de users
+LoginState = namedtuple('LoginState', 'failed_attempts locked_until last_login')
+
+# Cambios pendientes de un usuario, relativos a su fila: reset pone en cero los intentos y quita el
+# bloqueo antes de sumar failed_delta; lock_at es el bloqueo que corresponde si la suma llega al
+# máximo de intentos. locked_until y last_login solo avanzan, nunca retroceden.
+LoginChanges = namedtuple('LoginChanges', 'reset failed_delta lock_at last_login')
+
+NO_CHANGES = LoginChanges(False, 0, None, None)
+
+def _later(current, candidate):
+    if candidate is None or (current is not None and current >= candidate):
+        return current
+    return candidate
+
+def merge_changes(earlier, later):
+    """Combina dos cambios pendientes del mismo usuario en el orden en que ocurrieron"""
+    if later.reset:
+        return later
+    return LoginChanges(
+        earlier.reset,
+        earlier.failed_delta + later.failed_delta,
+        later.lock_at or earlier.lock_at,
+        _later(earlier.last_login, later.last_login)
+    )
+
+class LoginActivityBuffer:
+    """Cambios de inicio de sesión en memoria con escritura por lotes relativa a cada fila
+
+    Los métodos reciben el estado persistido (el de la fila recién cargada) y le aplican los
+    cambios aún no escritos de este proceso, de modo que los intentos de otros workers ya escritos
+    cuentan para el bloqueo y un inicio de sesión exitoso en cualquiera de ellos lo levanta. Un
+    inicio de sesión exitoso sin intentos fallidos ni bloqueo y con un último acceso registrado
+    hace menos de last_login_resolution no escribe nada.
+
+    write_batch(rows) recibe [(user_id, LoginChanges)] y los aplica en una transacción como
+    actualizaciones relativas (failed_login_attempts + failed_delta, bloqueo solo si es posterior;
+    ver apply()). Un hilo escritor llama a flush() cada flush_interval segundos, antes si hay
+    max_pending usuarios con cambios, y una última vez al terminar el proceso. Tras escribirse, los
+    cambios se descartan: la siguiente decisión parte de la fila.
+    """
+
+    def __init__(self, write_batch, max_failed_attempts=5, lockout=timedelta(minutes=30),
+                 last_login_resolution=timedelta(seconds=60), flush_interval=1.0, max_pending=500,
+                 name='login-activity-writer'):
+        self._write_batch = write_batch
+        self.max_failed_attempts = max_failed_attempts
+        self._lockout = lockout
+        self._last_login_resolution = last_login_resolution
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self._name = name
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer = None
+        self._pending = {}
+        self._counters = {
+            'failures': 0,
+            'successes': 0,
+            'skipped_writes': 0,
+            'flushes': 0,
+            'flushed_rows': 0,
+            'failed_flushes': 0
+        }
+
+    def apply(self, persisted, changes):
+        """Estado resultante de aplicar los cambios a la fila (lo mismo que escribe write_batch)"""
+        failed_attempts, locked_until, last_login = persisted
+        failed_attempts = failed_attempts or 0
+        if changes.reset:
+            failed_attempts, locked_until = 0, None
+        failed_attempts += changes.failed_delta
+        if changes.failed_delta and failed_attempts >= self.max_failed_attempts:
+            locked_until = _later(locked_until, changes.lock_at)
+        return LoginState(failed_attempts, locked_until, _later(last_login, changes.last_login))
+
+    def state(self, user_id, persisted):
+        """Estado vigente del usuario: el persistido más los cambios pendientes de este proceso"""
+        with self._lock:
+            return self._current(user_id, persisted)
+
+    def is_locked(self, user_id, persisted, now=None):
+        locked_until = self.state(user_id, persisted).locked_until
+        return locked_until is not None and locked_until > (now or datetime.utcnow())
+
+    def record_failure(self, user_id, persisted, now=None):
+        """Suma un intento fallido; la cuenta se bloquea si el total llega a max_failed_attempts"""
+        now = now or datetime.utcnow()
+        with self._lock:
+            self._counters['failures'] += 1
+            self._store(user_id, LoginChanges(False, 1, now + self._lockout, None))
+            return self._current(user_id, persisted)
+
+    def record_success(self, user_id, persisted, now=None):
+        """Reinicia los intentos fallidos, levanta el bloqueo y registra el último acceso"""
+        now = now or datetime.utcnow()
+        with self._lock:
+            current = self._current(user_id, persisted)
+            self._counters['successes'] += 1
+            recently_seen = current.last_login is not None and now - current.last_login < self._last_login_resolution
+            if current.failed_attempts == 0 and current.locked_until is None and recently_seen:
+                self._counters['skipped_writes'] += 1
+                return current
+            self._store(user_id, LoginChanges(True, 0, None, now))
+            return self._current(user_id, persisted)
+
+    def flush(self):
+        """Escribe los cambios pendientes en un lote y retorna cuántos usuarios se escribieron"""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._pending.items())
+                self._pending.clear()
+            if not batch:
+                return 0
+
+            try:
+                self._write_batch(batch)
+            except Exception:
+                # Los cambios no escritos vuelven antes que los que llegaron durante la escritura
+                with self._lock:
+                    self._counters['failed_flushes'] += 1
+                    for user_id, changes in batch:
+                        self._pending[user_id] = merge_changes(changes, self._pending.get(user_id, NO_CHANGES))
+                raise
+
+            with self._lock:
+                self._counters['flushes'] += 1
+                self._counters['flushed_rows'] += len(batch)
+            return len(batch)
+
+    def stats(self):
+        """Usuarios con cambios pendientes de escribir y contadores acumulados"""
+        with self._lock:
+            return dict(self._counters, pending_writes=len(self._pending))
+
+    def _current(self, user_id, persisted):
+        return self.apply(persisted, self._pending.get(user_id, NO_CHANGES))
+
+    def _store(self, user_id, changes):
+        """Acumula los cambios del usuario (debe llamarse con self._lock tomado)"""
+        self._pending[user_id] = merge_changes(self._pending.get(user_id, NO_CHANGES), changes)
+
+        self._ensure_writer()
+        if len(self._pending) >= self._max_pending:
+            self._wake.set()
+
+    def _ensure_writer(self):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._writer.start()
+            atexit.register(self._flush_quietly)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self._flush_interval)
+            self._wake.clear()
+            self._flush_quietly()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Error al escribir la actividad de inicio de sesión: {e}")
@@ -0,0 +1,75 @@
+# Archivo: merkle.py
+# Árboles de Merkle sobre los hashes de los bloques: raíces por rango y pruebas de inclusión
+# O(log n) verificables sin descargar el ledger (sin dependencias de Flask ni de la base de datos).
+#
+# Las hojas y los nodos internos usan prefijos distintos (0x00 y 0x01, como RFC 6962) para que
+# un nodo interno no pueda presentarse como hoja. Un nodo sin hermano al final de un nivel sube
+# sin cambios al nivel siguiente (no se duplica).
+
+import hashlib
+
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+
+def leaf_hash(block_hash):
+    """Hash de la hoja correspondiente al hash hexadecimal de un bloque"""
+    return hashlib.sha256(LEAF_PREFIX + bytes.fromhex(block_hash)).digest()
+
+def node_hash(left, right):
+    """Hash de un nodo interno a partir de sus dos hijos"""
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+def _next_level(level):
+    parents = [node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+    if len(level) % 2:
+        parents.append(level[-1])
+    return parents
+
+def merkle_root(block_hashes):
+    """Raíz hexadecimal del árbol de los hashes de bloque dados (en orden de la cadena)"""
+    if not block_hashes:
+        raise ValueError('No se puede construir un árbol de Merkle sin hojas')
+
+    level = [leaf_hash(block_hash) for block_hash in block_hashes]
+    while len(level) > 1:
+        level = _next_level(level)
+    return level[0].hex()
+
+def merkle_proof(block_hashes, position):
+    """Prueba de inclusión de la hoja en `position`: lista de hermanos desde la hoja hasta la raíz
+
+    Cada paso es {'hash': hermano en hexadecimal, 'position': 'left' | 'right'}, donde position
+    indica de qué lado del camino está el hermano. Los niveles en que el nodo sube sin hermano no
+    agregan pasos.
+    """
+    if not 0 <= position < len(block_hashes):
+        raise IndexError('La posición está fuera del rango de hojas')
+
+    proof = []
+    level = [leaf_hash(block_hash) for block_hash in block_hashes]
+    while len(level) > 1:
+        sibling = position ^ 1
+        if sibling < len(level):
+            proof.append({
+                'hash': level[sibling].hex(),
+                'position': 'left' if sibling < position else 'right'
+            })
+        level = _next_level(level)
+        position //= 2
+    return proof
+
+def verify_inclusion_proof(block_hash, proof, root):
+    """Verifica que block_hash pertenece al árbol cuya raíz hexadecimal es root"""
+    try:
+        current = leaf_hash(block_hash)
+        for step in proof:
+            sibling = bytes.fromhex(step['hash'])
+            if step['position'] == 'left':
+                current = node_hash(sibling, current)
+            elif step['position'] == 'right':
+                current = node_hash(current, sibling)
+            else:
+                return False
+    except (KeyError, TypeError, ValueError):
+        return False
+    return current.hex() == root
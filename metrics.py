@@ -0,0 +1,249 @@
+# Archivo: metrics.py
+# Instrumentación liviana de las rutas calientes: contadores, histogramas y métricas calculadas
+# al exportar, en formato de texto de Prometheus (sin dependencias externas). Registrar una
+# observación cuesta un candado y unas sumas; el formateo solo ocurre al exportar.
+
+import bisect
+import threading
+import time
+from functools import wraps
+
+# Límites de los histogramas de latencia en segundos (de 100 µs a 10 s)
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Límites de los histogramas de conteo (p. ej. consultas por solicitud)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class _Metric:
+    """Base de las métricas con etiquetas: cada combinación de valores tiene su propio hijo"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def labels(self, *values):
+        """Retorna el hijo de la combinación de etiquetas (conviene guardarlo en las rutas calientes)"""
+        values = tuple(str(value) for value in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f'{self.name} espera las etiquetas {self.labelnames}')
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+class Counter(_Metric):
+    """Valor acumulado que solo crece (p. ej. hashes calculados)"""
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def collect(self):
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}')
+        return lines
+
+    def snapshot(self):
+        return {values: child.value for values, child in list(self._children.items())}
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        position = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self.counts[position] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """Context manager que observa la duración del bloque en segundos"""
+        return _Timer(self)
+
+class _Timer:
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._child.observe(time.perf_counter() - self._started_at)
+
+class Histogram(_Metric):
+    """Distribución de observaciones en buckets acumulativos, con su suma y su conteo"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def collect(self):
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, values, (('le', _format_value(float(bound))),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+    def snapshot(self):
+        return {
+            values: {'count': child.count, 'sum': child.sum, 'avg': child.sum / child.count if child.count else 0}
+            for values, child in list(self._children.items())
+        }
+
+class CallbackMetric:
+    """Métrica calculada al exportar: callback() retorna un número o {valores de etiquetas: número}
+
+    Sirve para exponer estado que ya existe (profundidad de una cola, conexiones en uso) sin
+    costo en la ruta caliente.
+    """
+
+    def __init__(self, name, documentation, callback, kind='gauge', labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._callback = callback
+
+    def _values(self):
+        values = self._callback()
+        if isinstance(values, dict):
+            return {tuple(str(v) for v in (key if isinstance(key, tuple) else (key,))): value
+                    for key, value in values.items()}
+        return {(): values}
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for values, value in self._values().items():
+            if value is not None:
+                lines.append(f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}')
+        return lines
+
+    def snapshot(self):
+        return self._values()
+
+class MetricsRegistry:
+    """Conjunto de métricas de un proceso, exportable en formato de texto de Prometheus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'La métrica {metric.name} ya está registrada')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, callback, kind='gauge', labelnames=()):
+        return self.register(CallbackMetric(name, documentation, callback, kind, labelnames))
+
+    def render(self):
+        """Exporta todas las métricas; las calculadas que fallan se omiten sin afectar las demás"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                lines.extend(metric.collect())
+            except Exception:
+                continue
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """Valores actuales por métrica (para imprimir resúmenes desde los benchmarks)"""
+        result = {}
+        for name, metric in list(self._metrics.items()):
+            try:
+                result[name] = metric.snapshot()
+            except Exception:
+                continue
+        return result
+
+def timed(histogram_child):
+    """Decorador que observa en histogram_child la duración de cada llamada"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram_child.observe(time.perf_counter() - started_at)
+        return wrapper
+    return decorator
+
+# Registro del proceso compartido por la aplicación, los módulos de dominio y los benchmarks
+registry = MetricsRegistry()
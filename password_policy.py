@@ -0,0 +1,121 @@
+# Archivo: password_policy.py
+# Política de hash de contraseñas configurable por entorno (algoritmo y costo) y un pool acotado
+# que calcula los hashes fuera de los hilos de las solicitudes, para que una ráfaga de inicios de
+# sesión no acapare los workers que atienden las demás rutas.
+
+import hashlib
+import hmac
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Método por defecto de werkzeug (algoritmo:costo:bloque:paralelismo)
+DEFAULT_PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+
+# Hashes heredados de server_improved.py: SHA-256 hexadecimal sin sal
+LEGACY_SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+class PasswordHasherBusyError(Exception):
+    """El pool de hash tiene demasiadas tareas pendientes o no respondió a tiempo"""
+
+class PasswordPolicy:
+    """Algoritmo y costo vigentes para los hashes de contraseñas
+
+    method es un método de werkzeug (p. ej. 'scrypt:16384:8:1' o 'pbkdf2:sha256:600000'). Un hash
+    almacenado necesita rehacerse cuando su prefijo (el método con sus parámetros, antes del
+    primer '$') difiere del vigente o cuando es un SHA-256 heredado.
+    """
+
+    def __init__(self, method=DEFAULT_PASSWORD_HASH_METHOD):
+        self.method = method
+        # werkzeug completa los parámetros omitidos; el prefijo real sale de un hash de prueba
+        self.prefix = generate_password_hash('', method).split('$', 1)[0]
+
+    def hash(self, password):
+        return generate_password_hash(password, self.method)
+
+    def verify(self, stored_hash, password):
+        """Verifica la contraseña contra un hash de cualquier política, incluido el SHA-256 heredado"""
+        if not stored_hash:
+            return False
+        if LEGACY_SHA256_PATTERN.match(stored_hash):
+            legacy_hash = hashlib.sha256(password.encode('utf-8')).hexdigest()
+            return hmac.compare_digest(stored_hash, legacy_hash)
+        return check_password_hash(stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        if not stored_hash or LEGACY_SHA256_PATTERN.match(stored_hash):
+            return True
+        return stored_hash.split('$', 1)[0] != self.prefix
+
+class PasswordHasher:
+    """Ejecuta hash() y verify() de una política en un pool de hilos acotado
+
+    scrypt y pbkdf2 de hashlib liberan el GIL mientras calculan, así que max_workers limita los
+    núcleos que consume el hashing sin bloquear a los demás hilos. Con max_pending tareas en
+    curso o en espera, las siguientes fallan de inmediato con PasswordHasherBusyError en lugar de
+    acumular solicitudes; también falla la que espera más de timeout segundos.
+    """
+
+    def __init__(self, policy, max_workers=2, max_pending=32, timeout=10):
+        self.policy = policy
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='password-hash')
+        self._max_workers = max_workers
+        self._max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._counters = {'completed': 0, 'rejected': 0, 'timed_out': 0}
+
+    def hash(self, password):
+        return self._run(self.policy.hash, password)
+
+    def verify(self, stored_hash, password):
+        return self._run(self.policy.verify, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        return self.policy.needs_rehash(stored_hash)
+
+    def stats(self):
+        """Tareas pendientes, límites del pool y contadores acumulados"""
+        with self._lock:
+            return dict(
+                self._counters,
+                pending=self._pending,
+                max_pending=self._max_pending,
+                max_workers=self._max_workers,
+                method=self.policy.prefix
+            )
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise PasswordHasherBusyError(f'El pool de hash tiene {self._max_pending} tareas pendientes')
+
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(function, *args)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            return future.result(timeout=self._timeout)
+        except FutureTimeoutError:
+            self._count('timed_out')
+            raise PasswordHasherBusyError(f'El hash de la contraseña tardó más de {self._timeout} s')
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+            if future is not None:
+                self._counters['completed'] += 1
+        self._slots.release()
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
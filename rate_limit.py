@@ -0,0 +1,208 @@
+# Archivo: rate_limit.py
+# Limitación de tasa por usuario y ruta con cubetas de tokens. El tope de validaciones completas
+# simultáneas se aplica en la tabla jobs (ver job_runner.JobRunner).
+
+import functools
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from flask import jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+
+# Presupuesto de una cubeta: capacity solicitudes, que se recargan por completo en period segundos
+RateLimit = namedtuple('RateLimit', 'capacity period')
+
+def parse_rate(text):
+    """Convierte 'capacidad/segundos' (p. ej. '120/60') en un RateLimit"""
+    capacity, _, period = str(text).partition('/')
+    rate = RateLimit(int(capacity), float(period or 1))
+    if rate.capacity <= 0 or rate.period <= 0:
+        raise ValueError(f'Límite de tasa inválido: {text}')
+    return rate
+
+def refill(tokens, updated_at, now, capacity, period, cost):
+    """Recarga la cubeta hasta now y descuenta cost si alcanza
+
+    Retorna (tokens restantes, permitido, segundos hasta que alcancen los tokens).
+    """
+    refill_rate = capacity / period
+    tokens = min(capacity, tokens + max(0.0, now - updated_at) * refill_rate)
+    if tokens >= cost:
+        return tokens - cost, True, 0.0
+    return tokens, False, (cost - tokens) / refill_rate
+
+# =========================================================
+# BACKENDS DE LAS CUBETAS
+# =========================================================
+
+class RateLimitBackend:
+    """Interfaz de almacenamiento de las cubetas de tokens
+
+    take(key, capacity, period, cost) descuenta cost tokens de la cubeta key (creándola llena) y
+    retorna (permitido, segundos de espera, tokens restantes).
+    """
+
+    def take(self, key, capacity, period, cost=1):
+        raise NotImplementedError
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """Cubetas en memoria del proceso (por defecto); las inactivas se expulsan por LRU"""
+
+    def __init__(self, max_keys=100000):
+        self._max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, period, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens, allowed, retry_after = refill(tokens, updated_at, now, capacity, period, cost)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self._max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, retry_after, tokens
+
+class SQLiteRateLimitBackend(RateLimitBackend):
+    """Cubetas en un archivo SQLite compartido por todos los workers del mismo servidor
+
+    Cada take() es una transacción BEGIN IMMEDIATE de una fila. Las cubetas que ya se habrían
+    recargado por completo se eliminan en un barrido cada purge_interval operaciones.
+    """
+
+    def __init__(self, path, timeout=1.0, purge_interval=1024):
+        self._path = path
+        self._timeout = timeout
+        self._purge_interval = purge_interval
+        self._operations = 0
+        self._local = threading.local()
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, full_at REAL NOT NULL)"
+        )
+
+    def _connection(self):
+        # Una conexión por hilo, y nueva tras un fork (los workers no heredan la del proceso padre)
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.connection = sqlite3.connect(self._path, timeout=self._timeout, isolation_level=None)
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def take(self, key, capacity, period, cost=1):
+        connection = self._connection()
+        now = time.time()
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens, updated_at = row if row else (capacity, now)
+            tokens, allowed, retry_after = refill(tokens, updated_at, now, capacity, period, cost)
+            full_at = now + (capacity - tokens) * period / capacity
+            connection.execute(
+                "INSERT INTO rate_limit_buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at, "
+                "full_at = excluded.full_at",
+                (key, tokens, now, full_at)
+            )
+
+            self._operations += 1
+            if self._operations % self._purge_interval == 0:
+                connection.execute("DELETE FROM rate_limit_buckets WHERE full_at < ?", (now,))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return allowed, retry_after, tokens
+
+def create_rate_limit_backend(name, path=None):
+    """Crea el backend configurado: 'memory' (por defecto) o 'sqlite' (compartido entre workers)"""
+    if name == 'sqlite':
+        return SQLiteRateLimitBackend(path or os.path.join(tempfile.gettempdir(), 'xlerion-rate-limit.db'))
+    if name == 'memory':
+        return MemoryRateLimitBackend()
+    raise ValueError(f'Backend de limitación de tasa desconocido: {name}')
+
+# =========================================================
+# LIMITADOR DE TASA
+# =========================================================
+
+def request_identity():
+    """Identidad del JWT de la solicitud o, sin JWT verificado, la dirección del cliente"""
+    try:
+        identity = get_jwt_identity()
+    except RuntimeError:
+        identity = None
+    return f'user:{identity}' if identity is not None else f'ip:{request.remote_addr}'
+
+class RateLimiter:
+    """Limita la tasa de las vistas con una cubeta por (alcance, identidad)
+
+    Las solicitudes que exceden su presupuesto reciben 429 con Retry-After. Si el backend falla,
+    la solicitud se atiende sin limitar: el limitador nunca debe hacer fallar una solicitud.
+    """
+
+    def __init__(self, backend, enabled=True, identity=request_identity):
+        self.backend = backend
+        self.enabled = enabled
+        self._identity = identity
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def limit(self, rate, scope=None, cost=1):
+        """Decorador de vistas; debe aplicarse debajo de jwt_required() para limitar por usuario
+
+        Las vistas con el mismo scope comparten presupuesto (por defecto, el nombre de la vista).
+        """
+        def decorator(view):
+            scope_name = scope or view.__name__
+
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+
+                key = f'{scope_name}:{self._identity()}'
+                try:
+                    allowed, retry_after, remaining = self.backend.take(key, rate.capacity, rate.period, cost)
+                except Exception:
+                    self._count(scope_name, 'backend_errors')
+                    return view(*args, **kwargs)
+
+                if not allowed:
+                    self._count(scope_name, 'rejected')
+                    response = make_response(jsonify({
+                        'error': 'Demasiadas solicitudes, intente nuevamente más tarde',
+                        'retry_after': round(retry_after, 3)
+                    }), 429)
+                    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+                else:
+                    self._count(scope_name, 'allowed')
+                    response = make_response(view(*args, **kwargs))
+
+                response.headers['X-RateLimit-Limit'] = f'{rate.capacity};w={rate.period:g}'
+                response.headers['X-RateLimit-Remaining'] = str(int(remaining))
+                return response
+
+            return wrapper
+
+        return decorator
+
+    def stats(self):
+        """Solicitudes permitidas, rechazadas y fallas del backend por alcance"""
+        with self._lock:
+            return {scope: dict(counters) for scope, counters in self._counters.items()}
+
+    def _count(self, scope, name):
+        with self._lock:
+            counters = self._counters.setdefault(scope, {'allowed': 0, 'rejected': 0, 'backend_errors': 0})
+            counters[name] += 1
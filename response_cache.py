@@ -0,0 +1,236 @@
+# Archivo: response_cache.py
+# Caché de respuestas para endpoints de solo lectura: las entradas se indexan por endpoint,
+# argumentos de la consulta y versión de la cadena (hash de la cabeza), de modo que anexar
+# un bloque invalida todas las respuestas sin recorrer la caché.
+
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from flask import request, make_response
+
+# Claves reservadas en el backend para la versión de la cadena y la generación de la caché
+HEAD_KEY = 'response-cache:chain-head'
+GENERATION_KEY = 'response-cache:generation'
+
+# =========================================================
+# BACKENDS DE ALMACENAMIENTO
+# =========================================================
+
+class CacheBackend:
+    """Interfaz de almacenamiento de la caché: valores arbitrarios con expiración en segundos
+
+    Los backends deben tolerar fallas (get retorna None, set no lanza excepciones): la caché
+    nunca debe hacer fallar una solicitud.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+class MemoryCacheBackend(CacheBackend):
+    """Backend en memoria del proceso con expulsión LRU (por defecto)"""
+
+    def __init__(self, max_entries=1024):
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class FileCacheBackend(CacheBackend):
+    """Backend en un directorio local compartido por todos los workers del mismo servidor
+
+    Cada entrada es un archivo cuyo nombre es el sha256 de la clave; las escrituras son
+    atómicas (archivo temporal + os.replace). Las entradas vencidas se eliminan al leerlas y
+    en un barrido periódico cada purge_interval escrituras.
+    """
+
+    def __init__(self, directory, purge_interval=256):
+        self._directory = directory
+        self._purge_interval = purge_interval
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self._directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as entry_file:
+                expires_at, value = pickle.load(entry_file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        if expires_at < time.time():
+            self._remove(path)
+            return None
+        return value
+
+    def set(self, key, value, ttl):
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as entry_file:
+                pickle.dump((time.time() + ttl, value), entry_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self._path(key))
+        except OSError:
+            return
+
+        self._writes += 1
+        if self._writes % self._purge_interval == 0:
+            self.purge_expired()
+
+    def purge_expired(self):
+        """Elimina las entradas vencidas del directorio"""
+        now = time.time()
+        for name in os.listdir(self._directory):
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(self._directory, name)
+            try:
+                with open(path, 'rb') as entry_file:
+                    expires_at, _ = pickle.load(entry_file)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                continue
+            if expires_at < now:
+                self._remove(path)
+
+    def clear(self):
+        for name in os.listdir(self._directory):
+            self._remove(os.path.join(self._directory, name))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def create_backend(name, directory=None):
+    """Crea el backend configurado: 'memory' (por defecto) o 'file'"""
+    if name == 'file':
+        return FileCacheBackend(directory or os.path.join(tempfile.gettempdir(), 'xlerion-response-cache'))
+    if name == 'memory':
+        return MemoryCacheBackend()
+    raise ValueError(f'Backend de caché desconocido: {name}')
+
+# =========================================================
+# CACHÉ DE RESPUESTAS
+# =========================================================
+
+class ResponseCache:
+    """Caché de respuestas HTTP versionada por la cabeza de la cadena
+
+    load_version() lee el hash de la cabeza desde la base de datos; el valor se guarda en el
+    backend durante version_ttl segundos, de modo que una solicitud atendida desde la caché (o
+    respondida con 304) no toca la base de datos. Los anexados publican la nueva cabeza con
+    set_version(); con un backend compartido todos los workers la ven de inmediato, y con el
+    backend en memoria los demás workers la ven a más tardar en version_ttl segundos.
+    """
+
+    def __init__(self, backend, load_version, default_ttl=30, version_ttl=2):
+        self.backend = backend
+        self._load_version = load_version
+        self._default_ttl = default_ttl
+        self._version_ttl = version_ttl
+
+    def set_version(self, block_hash):
+        """Publica la nueva cabeza de la cadena (invalida las respuestas de la versión anterior)"""
+        self.backend.set(HEAD_KEY, block_hash, self._version_ttl)
+
+    def invalidate(self):
+        """Invalida todas las respuestas, incluidas las que no dependen de la cabeza"""
+        self.backend.set(GENERATION_KEY, uuid.uuid4().hex, self._default_ttl * 1000)
+
+    def current_version(self):
+        """Retorna la versión vigente: hash de la cabeza y generación de la caché"""
+        head = self.backend.get(HEAD_KEY)
+        if head is None:
+            head = self._load_version()
+            self.set_version(head)
+        generation = self.backend.get(GENERATION_KEY) or ''
+        return f'{head}:{generation}'
+
+    def build_key(self, version):
+        """Clave de la solicitud actual: endpoint, argumentos ordenados y versión"""
+        args = '&'.join(f'{name}={value}' for name, value in sorted(request.args.items(multi=True)))
+        return f'{request.endpoint}?{args}#{version}'
+
+    def cached(self, ttl=None, when=None):
+        """Decorador de vistas GET: sirve la respuesta desde la caché y responde 304 con ETag
+
+        when(), si se indica, decide por solicitud si la respuesta se cachea. Solo se guardan
+        respuestas 200. Debe aplicarse debajo de jwt_required() para conservar la autenticación.
+        """
+        ttl = ttl or self._default_ttl
+
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if when is not None and not when():
+                    return view(*args, **kwargs)
+
+                key = self.build_key(self.current_version())
+                etag = hashlib.sha256(key.encode()).hexdigest()[:32]
+
+                # La clave determina el contenido: un ETag vigente no requiere leer la caché
+                if request.if_none_match.contains(etag):
+                    response = make_response('', 304)
+                else:
+                    entry = self.backend.get(key)
+                    if entry is None:
+                        response = make_response(view(*args, **kwargs))
+                        if response.status_code != 200:
+                            return response
+                        entry = (response.get_data(), response.mimetype)
+                        self.backend.set(key, entry, ttl)
+                        cache_status = 'MISS'
+                    else:
+                        cache_status = 'HIT'
+
+                    body, mimetype = entry
+                    response = make_response(body, 200)
+                    response.mimetype = mimetype
+                    response.headers['X-Cache'] = cache_status
+
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'private, no-cache'
+                return response
+
+            return wrapper
+
+        return decorator
@@ -0,0 +1,143 @@
+# Archivo: search_index.py
+# Índice de búsqueda por subcadena para facturas: FTS5 con tokenizador trigram en SQLite e
+# índices GIN pg_trgm en PostgreSQL. En otros motores la búsqueda usa ILIKE sin índice.
+
+from sqlalchemy import column, literal_column, select, table, text
+from sqlalchemy.exc import OperationalError
+
+# Columnas de la factura indexadas para búsqueda
+SEARCH_COLUMNS = ('invoice_number', 'company_name', 'company_nit')
+
+# Tabla FTS5 de contenido externo (las filas viven en invoices; el índice guarda los trigramas)
+FTS_TABLE = 'invoices_fts'
+
+# Los trigramas solo indexan términos de al menos tres caracteres
+MIN_TERM_LENGTH = 3
+
+# Máximo de coincidencias que se filtran por id; con más, el término es frecuente y un recorrido
+# ordenado con ILIKE completa la página antes que ordenar todas las coincidencias
+MAX_MATCHED_IDS = 1000
+
+SQLITE_DDL = (
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        invoice_number, company_name, company_nit,
+        content='invoices', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON invoices BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, invoice_number, company_name, company_nit)
+        VALUES (new.id, new.invoice_number, new.company_name, new.company_nit);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON invoices BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, invoice_number, company_name, company_nit)
+        VALUES ('delete', old.id, old.invoice_number, old.company_name, old.company_nit);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON invoices BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, invoice_number, company_name, company_nit)
+        VALUES ('delete', old.id, old.invoice_number, old.company_name, old.company_nit);
+        INSERT INTO {FTS_TABLE}(rowid, invoice_number, company_name, company_nit)
+        VALUES (new.id, new.invoice_number, new.company_name, new.company_nit);
+    END""",
+    # Indexa las facturas existentes al crear el índice
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+)
+
+POSTGRESQL_DDL = ('CREATE EXTENSION IF NOT EXISTS pg_trgm',) + tuple(
+    f'CREATE INDEX IF NOT EXISTS ix_invoices_{name}_trgm ON invoices USING gin ({name} gin_trgm_ops)'
+    for name in SEARCH_COLUMNS
+)
+
+class InvoiceSearchIndex:
+    """Construye los filtros de búsqueda por subcadena sobre la tabla invoices
+
+    ensure() crea el índice del motor actual (idempotente) y lo mantiene con triggers en SQLite;
+    en PostgreSQL los índices GIN se mantienen solos y ILIKE los usa directamente. En SQLite
+    también actualiza las estadísticas del planificador (ANALYZE) para que las consultas por id
+    no se resuelvan recorriendo el índice de usuario.
+    """
+
+    def __init__(self, invoices_table):
+        self._table = invoices_table
+        self._fts_available = None
+
+    def ensure(self, connection):
+        """Crea el índice de búsqueda si el motor lo soporta; retorna True si quedó disponible"""
+        dialect = connection.dialect.name
+
+        if dialect == 'sqlite':
+            if not self._has_fts_table(connection):
+                try:
+                    for statement in SQLITE_DDL:
+                        connection.execute(text(statement))
+                except OperationalError:
+                    # SQLite sin FTS5 o sin el tokenizador trigram (anterior a 3.34)
+                    connection.rollback()
+                    self._fts_available = False
+                    return False
+            connection.execute(text('ANALYZE invoices'))
+            self._fts_available = True
+            return True
+
+        if dialect == 'postgresql':
+            for statement in POSTGRESQL_DDL:
+                connection.execute(text(statement))
+            return True
+
+        return False
+
+    def rebuild(self, connection):
+        """Reconstruye el índice FTS5 desde la tabla invoices (solo SQLite)"""
+        if self._uses_fts(connection):
+            connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+            connection.execute(text('ANALYZE invoices'))
+
+    def filter(self, connection, criteria):
+        """Retorna las condiciones que restringen invoices a las filas que contienen cada término
+
+        criteria asocia columnas de SEARCH_COLUMNS con términos de búsqueda. Los términos vacíos
+        se ignoran; los de menos de MIN_TERM_LENGTH caracteres usan ILIKE porque los trigramas
+        no los indexan. En SQLite los términos indexables se resuelven primero contra FTS5: si
+        coinciden a lo sumo MAX_MATCHED_IDS facturas se filtra por esos ids, y si no se usa ILIKE.
+        """
+        conditions = []
+        fts_criteria = {}
+        use_fts = self._uses_fts(connection)
+
+        for name, term in criteria.items():
+            if not term:
+                continue
+            if use_fts and len(term) >= MIN_TERM_LENGTH:
+                fts_criteria[name] = term
+            else:
+                conditions.append(self._table.c[name].ilike(f'%{term}%'))
+
+        if fts_criteria:
+            query = ' AND '.join(
+                f'{name} : "{term.replace(chr(34), chr(34) * 2)}"' for name, term in fts_criteria.items()
+            )
+            matched_ids = connection.execute(
+                select(literal_column('rowid'))
+                  .select_from(table(FTS_TABLE))
+                  .where(column(FTS_TABLE).op('MATCH')(query))
+                  .limit(MAX_MATCHED_IDS + 1)
+            ).scalars().all()
+
+            if len(matched_ids) <= MAX_MATCHED_IDS:
+                conditions.append(self._table.c.id.in_(matched_ids))
+            else:
+                conditions.extend(self._table.c[name].ilike(f'%{term}%') for name, term in fts_criteria.items())
+
+        return conditions
+
+    def _uses_fts(self, connection):
+        if connection.dialect.name != 'sqlite':
+            return False
+        if self._fts_available is None:
+            self._fts_available = self._has_fts_table(connection)
+        return self._fts_available
+
+    @staticmethod
+    def _has_fts_table(connection):
+        return connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': FTS_TABLE}
+        ).first() is not None
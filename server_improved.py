@@ -1,10 +1,14 @@
 import os
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import pymysql.cursors
 from dotenv import load_dotenv
-import hashlib
 import json
+from datetime import datetime, timedelta
+from db_pool import ConnectionPool, PoolExhaustedError
+from chain_head import ChainHeadCache, ChainHeadConflictError
+from block_hashing import calculate_js_block_hash
+from password_policy import PasswordPolicy, PasswordHasher, PasswordHasherBusyError, DEFAULT_PASSWORD_HASH_METHOD
 
 # Cargar variables de entorno desde .env
 load_dotenv()
@@ -22,20 +26,173 @@ DB_CONFIG = {
     'cursorclass': pymysql.cursors.DictCursor # Para obtener resultados como diccionarios
 }
 
+# --- Pool de Conexiones ---
+# DB_POOL_SIZE=0 desactiva el pool (una conexión nueva por solicitud)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+DB_POOL_MAX_IDLE = int(os.getenv('DB_POOL_MAX_IDLE', 300)) # Segundos sin uso antes de reciclar una conexión
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 5)) # Segundos de espera cuando el pool está agotado
+
+db_pool = ConnectionPool(
+    lambda: pymysql.connect(**DB_CONFIG),
+    max_size=DB_POOL_SIZE,
+    max_idle=DB_POOL_MAX_IDLE,
+    timeout=DB_POOL_TIMEOUT
+)
+
+# --- Hash de Contraseñas ---
+# Los usuarios con el SHA-256 sin sal heredado migran a esta política en su próximo inicio de sesión
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', DEFAULT_PASSWORD_HASH_METHOD) # p. ej. pbkdf2:sha256:600000
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 32)) # Más allá de esto /api/login responde 503
+PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+
+password_hasher = PasswordHasher(
+    PasswordPolicy(PASSWORD_HASH_METHOD),
+    max_workers=PASSWORD_HASH_WORKERS,
+    max_pending=PASSWORD_HASH_MAX_PENDING,
+    timeout=PASSWORD_HASH_TIMEOUT
+)
+
+# --- Columnas de búsqueda de bloques ---
+
+# Columnas extraídas del JSON del bloque al insertarlo, indexadas para la búsqueda
+BLOCK_SEARCH_COLUMNS = {
+    'company_name': 'VARCHAR(200) NULL',
+    'company_nit': 'VARCHAR(50) NULL',
+    'invoice_number': 'VARCHAR(100) NULL',
+    'block_timestamp': 'DATETIME(3) NULL'
+}
+
+# Paginación y streaming de GET /api/blocks
+MAX_BLOCKS_PAGE_SIZE = 1000
+STREAM_FETCH_SIZE = 500
+
+# Columnas de un bloque en el orden en que las lee block_to_json()
+BLOCK_SELECT = "SELECT block_index, timestamp_iso, data, previous_hash, hash, traceability, created_by FROM blocks"
+
+# Tamaño de página de /api/blocks/search y de los lotes del backfill
+SEARCH_PAGE_SIZE = 50
+MAX_SEARCH_PAGE_SIZE = 200
+BACKFILL_BATCH_SIZE = 1000
+
+# --- Cabeza de la cadena ---
+
+# Índice y hash previo del primer bloque cuando la cadena está vacía (el génesis del frontend usa "0")
+EMPTY_CHAIN_HEAD = (-1, "0")
+
+# Índice único que hace fallar el INSERT cuando otro proceso ya anexó el mismo block_index
+BLOCK_INDEX_UNIQUE_INDEX = 'ux_blocks_block_index'
+
+class StaleChainError(Exception):
+    """El previousHash o el index enviados por el cliente no corresponden a la cabeza de la cadena."""
+
+    def __init__(self, head):
+        super().__init__('La cadena del cliente está desactualizada')
+        self.head = head
+
+class BlockHashMismatchError(Exception):
+    """El hash enviado por el cliente no coincide con el calculado en el servidor."""
+
+    def __init__(self, expected_hash):
+        super().__init__('El hash del bloque no coincide con su contenido')
+        self.expected_hash = expected_hash
+
 # --- Funciones de Utilidad ---
 
 def get_db_connection():
-    """Establece y devuelve una conexión a la base de datos."""
+    """Obtiene una conexión del pool; al cerrarla vuelve al pool en lugar de desconectarse."""
     try:
-        connection = pymysql.connect(**DB_CONFIG)
-        return connection
+        if DB_POOL_SIZE <= 0:
+            return pymysql.connect(**DB_CONFIG)
+        return db_pool.acquire()
+    except PoolExhaustedError as e:
+        print(f"Pool de conexiones agotado: {e}")
+        return None
     except Exception as e:
         print(f"Error al conectar a la base de datos: {e}")
         return None
 
-def hash_password(password):
-    """Hashea una contraseña usando SHA-256."""
-    return hashlib.sha256(password.encode('utf-8')).hexdigest()
+def parse_block_timestamp(timestamp_iso):
+    """Convierte el timestamp ISO del bloque (UTC, p. ej. 2024-01-01T12:00:00.000Z) a datetime sin zona."""
+    try:
+        parsed = datetime.fromisoformat(timestamp_iso.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    if parsed.tzinfo is not None:
+        parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+    return parsed
+
+def extract_search_columns(block_data, timestamp_iso):
+    """Extrae del bloque los valores de las columnas de búsqueda."""
+    block_data = block_data if isinstance(block_data, dict) else {}
+    return (
+        block_data.get('companyName'),
+        block_data.get('companyNit'),
+        block_data.get('number'),
+        parse_block_timestamp(timestamp_iso)
+    )
+
+def escape_like(term):
+    """Escapa los comodines de LIKE en un término de búsqueda."""
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def block_to_json(row):
+    """Serializa un bloque leído con BLOCK_SELECT insertando data y traceability tal como están
+    almacenados (ya son JSON), sin decodificarlos y volver a codificarlos."""
+    block_index, timestamp_iso, data, previous_hash, block_hash, traceability, created_by = row
+    return (
+        f'{{"index":{block_index},"timestamp":{json.dumps(timestamp_iso)},"data":{data},'
+        f'"previousHash":{json.dumps(previous_hash)},"hash":{json.dumps(block_hash)},'
+        f'"traceability":{traceability},"createdBy":{json.dumps(created_by)}}}'
+    )
+
+def js_iso_timestamp(moment):
+    """Formatea un datetime UTC como Date.prototype.toISOString() (p. ej. 2024-01-01T12:00:00.000Z)."""
+    return moment.isoformat(timespec='milliseconds') + 'Z'
+
+def load_block_head():
+    """Lee de la base de datos el índice y el hash del último bloque de la cadena."""
+    connection = get_db_connection()
+    if connection is None:
+        raise ConnectionError("No fue posible conectar a la base de datos para leer la cabeza de la cadena.")
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT block_index, hash FROM blocks ORDER BY block_index DESC LIMIT 1")
+            row = cursor.fetchone()
+        return (row['block_index'], row['hash']) if row else EMPTY_CHAIN_HEAD
+    finally:
+        connection.close()
+
+# Cabeza (block_index, hash) en memoria: solo se relee de la base de datos tras un conflicto
+block_head = ChainHeadCache(load_block_head)
+
+def upgrade_password_hash(user, password):
+    """Rehace con la política vigente el hash de un usuario recién autenticado si es heredado o usa
+    parámetros anteriores. Es de mejor esfuerzo: si falla, se reintenta en el próximo inicio de sesión."""
+    if not password_hasher.needs_rehash(user['password_hash']):
+        return
+    try:
+        new_hash = password_hasher.hash(password)
+    except PasswordHasherBusyError:
+        return
+
+    connection = get_db_connection()
+    if connection is None:
+        return
+    try:
+        with connection.cursor() as cursor:
+            # Solo si nadie cambió el hash entre la lectura y esta escritura
+            cursor.execute(
+                "UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s",
+                (new_hash, user['id'], user['password_hash'])
+            )
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        print(f"Error al actualizar el hash de la contraseña: {e}")
+    finally:
+        connection.close()
 
 # --- Rutas de la API ---
 
@@ -44,6 +201,16 @@ def home():
     """Ruta de prueba para verificar que el servidor está funcionando."""
     return "Servidor XlerionChainTaxs Backend funcionando!"
 
+@app.route('/api/pool/stats', methods=['GET'])
+def get_pool_stats():
+    """Devuelve el estado del pool de conexiones (en uso, inactivas, esperas y agotamientos)."""
+    return jsonify(db_pool.stats()), 200
+
+@app.route('/api/password-hash/stats', methods=['GET'])
+def get_password_hash_stats():
+    """Devuelve el estado del pool de hash de contraseñas (pendientes, rechazadas y método vigente)."""
+    return jsonify(password_hasher.stats()), 200
+
 @app.route('/api/register', methods=['POST'])
 def register_user():
     """Registra un nuevo usuario en la base de datos."""
@@ -58,7 +225,10 @@ def register_user():
     if len(password) < 8:
         return jsonify({"message": "La contraseña debe tener al menos 8 caracteres."}), 400
 
-    hashed_password = hash_password(password)
+    try:
+        hashed_password = password_hasher.hash(password)
+    except PasswordHasherBusyError:
+        return jsonify({"message": "Hay demasiados registros en curso, intente nuevamente."}), 503, {'Retry-After': '1'}
 
     connection = get_db_connection()
     if connection is None:
@@ -102,63 +272,117 @@ def login_user():
             sql = "SELECT id, fullname, username, password_hash FROM users WHERE username = %s"
             cursor.execute(sql, (username,))
             user = cursor.fetchone()
-
-            if user and user['password_hash'] == hash_password(password):
-                # No devolver el hash de la contraseña al frontend
-                return jsonify({
-                    "message": "Inicio de sesión exitoso.",
-                    "user": {"username": user['username'], "fullname": user['fullname']}
-                }), 200
-            else:
-                return jsonify({"message": "Usuario o contraseña incorrectos."}), 401
     except Exception as e:
         print(f"Error al iniciar sesión: {e}")
         return jsonify({"message": "Error interno del servidor al iniciar sesión."}), 500
     finally:
+        # La conexión vuelve al pool antes de verificar la contraseña
         connection.close()
 
+    try:
+        password_valid = user is not None and password_hasher.verify(user['password_hash'], password)
+    except PasswordHasherBusyError:
+        return jsonify({"message": "Hay demasiados inicios de sesión en curso, intente nuevamente."}), 503, {'Retry-After': '1'}
+    if not password_valid:
+        return jsonify({"message": "Usuario o contraseña incorrectos."}), 401
+
+    upgrade_password_hash(user, password)
+    # No devolver el hash de la contraseña al frontend
+    return jsonify({
+        "message": "Inicio de sesión exitoso.",
+        "user": {"username": user['username'], "fullname": user['fullname']}
+    }), 200
+
 @app.route('/api/blocks', methods=['POST'])
 def add_block():
-    """Añade un nuevo bloque a la cadena en la base de datos."""
+    """Añade un nuevo bloque a la cadena en la base de datos.
+
+    El servidor asigna el índice y el hash previo a partir de la cabeza de la cadena en memoria y
+    recalcula el hash del bloque. previousHash, index y hash son opcionales: si el cliente los
+    envía deben coincidir con los del servidor (409 si su cadena está desactualizada, 400 si el
+    hash no corresponde al contenido).
+    """
     data = request.json
     block_data = data.get('data')
     traceability = data.get('traceability')
-    previous_hash = data.get('previousHash')
-    block_index = data.get('index')
-    block_hash = data.get('hash')
-    timestamp_iso = data.get('timestamp')
+    client_previous_hash = data.get('previousHash')
+    client_index = data.get('index')
+    client_hash = data.get('hash')
+    timestamp_iso = data.get('timestamp') or js_iso_timestamp(datetime.utcnow())
     created_by = data.get('createdBy') # Asegúrate de enviar esto desde el frontend
 
-    if not all([block_data, traceability, previous_hash, block_index is not None, block_hash, timestamp_iso, created_by]):
+    if not all([block_data, traceability, created_by]):
         return jsonify({"message": "Datos de bloque incompletos."}), 400
+    if parse_block_timestamp(timestamp_iso) is None:
+        return jsonify({"message": "El timestamp del bloque no es una fecha ISO válida."}), 400
 
     connection = get_db_connection()
     if connection is None:
         return jsonify({"message": "Error interno del servidor."}), 500
 
+    attempt = {}
+
+    def write_block(head):
+        """Inserta el bloque sobre la cabeza dada; retorna la nueva cabeza o None si otro proceso se adelantó."""
+        head_index, head_hash = head
+        block_index = head_index + 1
+
+        if ((client_previous_hash is not None and client_previous_hash != head_hash)
+                or (client_index is not None and client_index != block_index)):
+            if attempt.get('head_reloaded'):
+                raise StaleChainError(head)
+            # La cabeza en caché puede estar desactualizada: se relee una vez antes de rechazar
+            attempt['head_reloaded'] = True
+            return None
+
+        block_hash = calculate_js_block_hash(block_index, head_hash, timestamp_iso, block_data)
+        if client_hash is not None and client_hash != block_hash:
+            raise BlockHashMismatchError(block_hash)
+
+        try:
+            with connection.cursor() as cursor:
+                sql = """
+                INSERT INTO blocks (block_index, timestamp_iso, data, previous_hash, hash, traceability, created_by,
+                                    company_name, company_nit, invoice_number, block_timestamp)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """
+                cursor.execute(sql, (
+                    block_index,
+                    timestamp_iso,
+                    json.dumps(block_data), # Convertir dict a JSON string
+                    head_hash,
+                    block_hash,
+                    json.dumps(traceability), # Convertir list a JSON string
+                    created_by,
+                    *extract_search_columns(block_data, timestamp_iso) # Columnas indexadas para la búsqueda
+                ))
+            connection.commit()
+        except pymysql.err.IntegrityError as e:
+            # block_index (o el hash) duplicado: otro proceso anexó primero, se relee la cabeza
+            connection.rollback()
+            print(f"Conflicto al anexar el bloque {block_index}: {e}")
+            return None
+        attempt['previous_hash'] = head_hash
+        return (block_index, block_hash)
+
     try:
-        with connection.cursor() as cursor:
-            sql = """
-            INSERT INTO blocks (block_index, timestamp_iso, data, previous_hash, hash, traceability, created_by)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """
-            cursor.execute(sql, (
-                block_index,
-                timestamp_iso,
-                json.dumps(block_data), # Convertir dict a JSON string
-                previous_hash,
-                block_hash,
-                json.dumps(traceability), # Convertir list a JSON string
-                created_by
-            ))
-        connection.commit()
-        return jsonify({"message": "Bloque añadido exitosamente.", "block_hash": block_hash}), 201
-    except pymysql.err.IntegrityError as e:
-        connection.rollback()
-        if "Duplicate entry" in str(e) and "for key 'hash'" in str(e):
-            return jsonify({"message": "Error: El hash del bloque ya existe."}), 409
-        print(f"Error de integridad al añadir bloque: {e}")
-        return jsonify({"message": "Error interno del servidor al añadir bloque (integridad).", "error": str(e)}), 500
+        block_index, block_hash = block_head.append(write_block)
+        return jsonify({
+            "message": "Bloque añadido exitosamente.",
+            "block_hash": block_hash,
+            "index": block_index,
+            "previousHash": attempt['previous_hash']
+        }), 201
+    except StaleChainError as e:
+        head_index, head_hash = e.head
+        return jsonify({
+            "message": "La cadena del cliente está desactualizada.",
+            "head": {"index": head_index, "hash": head_hash}
+        }), 409
+    except BlockHashMismatchError as e:
+        return jsonify({"message": "El hash del bloque no coincide con su contenido.", "expectedHash": e.expected_hash}), 400
+    except ChainHeadConflictError:
+        return jsonify({"message": "La cadena cambió durante el anexado; intente de nuevo."}), 409
     except Exception as e:
         connection.rollback()
         print(f"Error al añadir bloque: {e}")
@@ -168,23 +392,95 @@ def add_block():
 
 @app.route('/api/blocks', methods=['GET'])
 def get_blocks():
-    """Recupera todos los bloques de la base de datos."""
+    """Recupera los bloques de la cadena en orden de block_index.
+
+    Con ?limit= devuelve una página de hasta MAX_BLOCKS_PAGE_SIZE bloques posteriores a ?since_index=
+    junto con next_since_index para pedir la siguiente. Sin limit transmite la cadena completa como
+    un arreglo JSON (o NDJSON con ?format=ndjson) leyendo con un cursor sin buffer del servidor, de
+    modo que la memoria del worker no crece con el tamaño de la cadena. En ambos modos los campos
+    data y traceability se copian tal como están almacenados.
+    """
+    limit = request.args.get('limit', type=int)
+    since_index = request.args.get('since_index', type=int)
+    ndjson = request.args.get('format') == 'ndjson'
+
+    if limit is not None:
+        return get_blocks_page(since_index, min(max(limit, 1), MAX_BLOCKS_PAGE_SIZE))
+
+    connection = get_db_connection()
+    if connection is None:
+        return jsonify({"message": "Error interno del servidor."}), 500
+
+    def generate():
+        finished = False
+        cursor = connection.cursor(pymysql.cursors.SSCursor)
+        try:
+            sql = BLOCK_SELECT
+            params = ()
+            if since_index is not None:
+                sql += " WHERE block_index > %s"
+                params = (since_index,)
+            cursor.execute(sql + " ORDER BY block_index ASC", params)
+
+            separator = '\n' if ndjson else ','
+            first = True
+            if not ndjson:
+                yield '['
+            while True:
+                rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+                if not rows:
+                    break
+                chunk = separator.join(block_to_json(row) for row in rows)
+                if ndjson:
+                    yield chunk + '\n'
+                else:
+                    yield chunk if first else ',' + chunk
+                first = False
+            if not ndjson:
+                yield ']'
+            finished = True
+        except Exception as e:
+            # Los encabezados ya se enviaron: el cliente recibe una respuesta truncada
+            print(f"Error al transmitir bloques: {e}")
+        finally:
+            if finished:
+                cursor.close()
+                connection.close()
+            else:
+                # Un cursor sin buffer abandonado deja filas pendientes en la conexión
+                getattr(connection, 'discard', connection.close)()
+
+    mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype), 200
+
+def get_blocks_page(since_index, limit):
+    """Devuelve una página de bloques posteriores a since_index (todos si es None)."""
     connection = get_db_connection()
     if connection is None:
         return jsonify({"message": "Error interno del servidor."}), 500
 
     try:
-        with connection.cursor() as cursor:
-            sql = "SELECT block_index as `index`, timestamp_iso as timestamp, data, previous_hash as previousHash, hash, traceability, created_by as createdBy FROM blocks ORDER BY block_index ASC"
-            cursor.execute(sql)
-            blocks = cursor.fetchall()
-            
-            # Convertir campos JSON de vuelta a objetos Python
-            for block in blocks:
-                block['data'] = json.loads(block['data'])
-                block['traceability'] = json.loads(block['traceability'])
-            
-            return jsonify(blocks), 200
+        with connection.cursor(pymysql.cursors.Cursor) as cursor:
+            sql = BLOCK_SELECT
+            params = []
+            if since_index is not None:
+                sql += " WHERE block_index > %s"
+                params.append(since_index)
+
+            # Una fila extra indica si existe una página siguiente
+            cursor.execute(sql + " ORDER BY block_index ASC LIMIT %s", params + [limit + 1])
+            rows = cursor.fetchall()
+
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+        pagination = {
+            "since_index": since_index,
+            "limit": limit,
+            "has_next": has_next,
+            "next_since_index": rows[-1][0] if has_next else None
+        }
+        body = '{"blocks":[' + ','.join(block_to_json(row) for row in rows) + '],"pagination":' + json.dumps(pagination) + '}'
+        return Response(body, mimetype='application/json'), 200
     except Exception as e:
         print(f"Error al obtener bloques: {e}")
         return jsonify({"message": "Error interno del servidor al obtener bloques."}), 500
@@ -193,12 +489,53 @@ def get_blocks():
 
 @app.route('/api/blocks/search', methods=['GET'])
 def search_blocks():
-    """Busca bloques en la base de datos según los parámetros de consulta."""
-    company_name = request.args.get('companyName', '').lower()
-    nit = request.args.get('nit', '')
-    invoice_number = request.args.get('invoiceNumber', '')
+    """Busca bloques por empresa, NIT, número de factura y fechas, paginando del más reciente al más antiguo.
+
+    La búsqueda usa las columnas extraídas e indexadas (company_name, company_nit, invoice_number,
+    block_timestamp) en lugar de leer el JSON de cada fila. El NIT y el número de factura se buscan
+    por prefijo para aprovechar sus índices; el nombre de la empresa, por subcadena. La paginación es
+    por cursor: cada respuesta incluye next_cursor, que se envía como ?cursor= para la página siguiente.
+    """
+    company_name = request.args.get('companyName', '').strip()
+    nit = request.args.get('nit', '').strip()
+    invoice_number = request.args.get('invoiceNumber', '').strip()
     start_date = request.args.get('startDate', '')
     end_date = request.args.get('endDate', '')
+    cursor_index = request.args.get('cursor', type=int)
+    limit = min(max(request.args.get('limit', SEARCH_PAGE_SIZE, type=int), 1), MAX_SEARCH_PAGE_SIZE)
+
+    conditions = []
+    params = []
+
+    if company_name:
+        conditions.append("company_name LIKE %s")
+        params.append(f"%{escape_like(company_name)}%")
+    if nit:
+        conditions.append("company_nit LIKE %s")
+        params.append(f"{escape_like(nit)}%")
+    if invoice_number:
+        conditions.append("invoice_number LIKE %s")
+        params.append(f"{escape_like(invoice_number)}%")
+    if start_date:
+        start = parse_block_timestamp(start_date)
+        if start is None:
+            return jsonify({"message": "Formato de fecha inválido para startDate."}), 400
+        conditions.append("block_timestamp >= %s")
+        params.append(start)
+    if end_date:
+        end = parse_block_timestamp(end_date)
+        if end is None:
+            return jsonify({"message": "Formato de fecha inválido para endDate."}), 400
+        # Una fecha sin hora incluye el día completo
+        if len(end_date) == 10:
+            conditions.append("block_timestamp < %s")
+            params.append(end + timedelta(days=1))
+        else:
+            conditions.append("block_timestamp <= %s")
+            params.append(end)
+    if cursor_index is not None:
+        conditions.append("block_index < %s")
+        params.append(cursor_index)
 
     connection = get_db_connection()
     if connection is None:
@@ -206,52 +543,157 @@ def search_blocks():
 
     try:
         with connection.cursor() as cursor:
-            # La búsqueda en campos JSON es un poco más compleja en SQL puro.
-            # Podrías necesitar usar funciones JSON_EXTRACT o LIKE en el JSON string.
-            # Para simplificar, aquí se muestra una aproximación.
-            # Para búsquedas eficientes en JSON, MySQL 5.7+ tiene JSON_CONTAINS, JSON_EXTRACT.
-            # Para MariaDB, JSON_VALUE o JSON_EXTRACT.
-
-            conditions = []
-            params = []
-
-            if company_name:
-                conditions.append("JSON_EXTRACT(data, '$.companyName') LIKE %s")
-                params.append(f"%{company_name}%")
-            if nit:
-                conditions.append("JSON_EXTRACT(data, '$.companyNit') LIKE %s")
-                params.append(f"%{nit}%")
-            if invoice_number:
-                conditions.append("JSON_EXTRACT(data, '$.number') LIKE %s")
-                params.append(f"%{invoice_number}%")
-            if start_date:
-                conditions.append("timestamp_iso >= %s")
-                params.append(start_date)
-            if end_date:
-                conditions.append("timestamp_iso <= %s")
-                params.append(end_date)
-
             sql = "SELECT block_index as `index`, timestamp_iso as timestamp, data, previous_hash as previousHash, hash, traceability, created_by as createdBy FROM blocks"
             if conditions:
                 sql += " WHERE " + " AND ".join(conditions)
-            
-            sql += " ORDER BY block_index DESC" # Ordenar por índice descendente para los más recientes
+
+            # Una fila extra indica si existe una página siguiente
+            sql += " ORDER BY block_index DESC LIMIT %s"
+            params.append(limit + 1)
 
             cursor.execute(sql, params)
             results = cursor.fetchall()
 
+            has_next = len(results) > limit
+            results = results[:limit]
+
             # Convertir campos JSON de vuelta a objetos Python
             for block in results:
                 block['data'] = json.loads(block['data'])
                 block['traceability'] = json.loads(block['traceability'])
-            
-            return jsonify(results), 200
+
+            return jsonify({
+                "blocks": results,
+                "pagination": {
+                    "limit": limit,
+                    "cursor": cursor_index,
+                    "has_next": has_next,
+                    "next_cursor": results[-1]['index'] if has_next else None
+                }
+            }), 200
     except Exception as e:
         print(f"Error al buscar bloques: {e}")
         return jsonify({"message": "Error interno del servidor al buscar bloques."}), 500
     finally:
         connection.close()
 
+# --- Migraciones ---
+
+@app.cli.command('migrate-block-search')
+def migrate_block_search():
+    """Agrega las columnas de búsqueda a la tabla blocks, sus índices, y las llena para los bloques existentes."""
+    connection = get_db_connection()
+    if connection is None:
+        raise SystemExit(1)
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'blocks'"
+            )
+            existing_columns = {row['COLUMN_NAME'] for row in cursor.fetchall()}
+            for column, definition in BLOCK_SEARCH_COLUMNS.items():
+                if column not in existing_columns:
+                    cursor.execute(f"ALTER TABLE blocks ADD COLUMN {column} {definition}")
+
+            cursor.execute(
+                "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'blocks'"
+            )
+            existing_indexes = {row['INDEX_NAME'] for row in cursor.fetchall()}
+            for column in BLOCK_SEARCH_COLUMNS:
+                if f"ix_blocks_{column}" not in existing_indexes:
+                    cursor.execute(f"CREATE INDEX ix_blocks_{column} ON blocks ({column})")
+        connection.commit()
+
+        # Backfill por lotes en orden de block_index: cada lote es una transacción corta
+        backfilled = 0
+        last_index = -1
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT block_index, data, timestamp_iso FROM blocks "
+                    "WHERE block_index > %s AND block_timestamp IS NULL ORDER BY block_index ASC LIMIT %s",
+                    (last_index, BACKFILL_BATCH_SIZE)
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+
+                cursor.executemany(
+                    "UPDATE blocks SET company_name = %s, company_nit = %s, invoice_number = %s, block_timestamp = %s "
+                    "WHERE block_index = %s",
+                    [(*extract_search_columns(json.loads(row['data']), row['timestamp_iso']), row['block_index']) for row in rows]
+                )
+            connection.commit()
+            backfilled += len(rows)
+            last_index = rows[-1]['block_index']
+
+        print(f"Columnas de búsqueda listas; bloques actualizados: {backfilled}")
+    except Exception as e:
+        connection.rollback()
+        print(f"Error al migrar la tabla de bloques: {e}")
+        raise SystemExit(1)
+    finally:
+        connection.close()
+
+@app.cli.command('migrate-chain-constraints')
+def migrate_chain_constraints():
+    """Crea el índice único sobre blocks.block_index para que dos procesos no anexen el mismo índice."""
+    connection = get_db_connection()
+    if connection is None:
+        raise SystemExit(1)
+
+    try:
+        with connection.cursor() as cursor:
+            # Basta cualquier índice único (o la clave primaria) que tenga solo block_index
+            cursor.execute(
+                "SELECT INDEX_NAME FROM information_schema.STATISTICS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'blocks' AND NON_UNIQUE = 0 "
+                "GROUP BY INDEX_NAME HAVING COUNT(*) = 1 AND MAX(COLUMN_NAME) = 'block_index'"
+            )
+            if cursor.fetchone() is None:
+                cursor.execute(f"CREATE UNIQUE INDEX {BLOCK_INDEX_UNIQUE_INDEX} ON blocks (block_index)")
+                print(f"Índice único {BLOCK_INDEX_UNIQUE_INDEX} creado.")
+            else:
+                print("La tabla blocks ya tiene un índice único sobre block_index.")
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        print(f"Error al migrar las restricciones de la cadena: {e}")
+        raise SystemExit(1)
+    finally:
+        connection.close()
+
+@app.cli.command('migrate-password-hashes')
+def migrate_password_hashes():
+    """Amplía users.password_hash para los hashes con sal y parámetros (los SHA-256 heredados ocupan 64)."""
+    connection = get_db_connection()
+    if connection is None:
+        raise SystemExit(1)
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT CHARACTER_MAXIMUM_LENGTH AS max_length FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'users' AND COLUMN_NAME = 'password_hash'"
+            )
+            column = cursor.fetchone()
+            if column is not None and (column['max_length'] or 0) < 255:
+                cursor.execute("ALTER TABLE users MODIFY password_hash VARCHAR(255) NOT NULL")
+                print("Columna users.password_hash ampliada a VARCHAR(255).")
+            else:
+                print("La columna users.password_hash ya admite los hashes de la política vigente.")
+
+            cursor.execute("SELECT COUNT(*) AS legacy FROM users WHERE password_hash REGEXP '^[0-9a-f]{64}$'")
+            print(f"Usuarios con SHA-256 heredado (migran en su próximo inicio de sesión): {cursor.fetchone()['legacy']}")
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        print(f"Error al migrar los hashes de contraseñas: {e}")
+        raise SystemExit(1)
+    finally:
+        connection.close()
+
 # Para ejecutar la aplicación Flask
 if __name__ == '__main__':
     # Usar puerto 5000 por defecto para desarrollo
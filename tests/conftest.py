@@ -0,0 +1,57 @@
+# Archivo: tests/conftest.py
+# Configuración común de las pruebas: base de datos SQLite temporal y cliente autenticado.
+
+import os
+import sys
+import tempfile
+
+import pytest
+from sqlalchemy import event
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+# La base de datos debe configurarse antes de importar la aplicación
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='xlerion-tests-'), 'tests.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+os.environ['RATE_LIMIT_ENABLED'] = 'false'
+
+import blockchain_api  # noqa: E402,F401  (registra las rutas de facturas sobre la aplicación)
+from app import app, db, init_database  # noqa: E402
+
+@pytest.fixture(scope='session')
+def client():
+    with app.app_context():
+        init_database()
+    return app.test_client()
+
+@pytest.fixture(scope='session')
+def auth_headers(client):
+    response = client.post('/login', json={'username': 'admin', 'password': 'Admin123!'})
+    assert response.status_code == 200, response.get_json()
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+@pytest.fixture
+def count_queries():
+    """Cuenta las sentencias SQL que ejecuta el bloque: with count_queries() as queries: ..."""
+    with app.app_context():
+        engine = db.engine
+
+    class QueryCounter:
+        def __init__(self):
+            self.statements = []
+
+        def __len__(self):
+            return len(self.statements)
+
+        def _record(self, conn, cursor, statement, parameters, context, executemany):
+            self.statements.append(statement)
+
+        def __enter__(self):
+            event.listen(engine, 'before_cursor_execute', self._record)
+            return self
+
+        def __exit__(self, *exc_info):
+            event.remove(engine, 'before_cursor_execute', self._record)
+
+    return QueryCounter
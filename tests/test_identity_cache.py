@@ -0,0 +1,31 @@
+# Archivo: tests/test_identity_cache.py
+# La identidad en caché se invalida al confirmar el commit que cambia al usuario, no durante el
+# flush, y un rollback no la invalida.
+
+from app import app, db, User, identity_cache
+
+def invalidations():
+    return identity_cache.stats()['invalidations']
+
+def test_identity_is_invalidated_on_commit_not_on_flush(client):
+    with app.app_context():
+        user = User.query.filter_by(username='admin').first()
+        before = invalidations()
+
+        user.full_name = 'Administrador (flush)'
+        db.session.flush()
+        assert invalidations() == before
+
+        db.session.commit()
+        assert invalidations() == before + 1
+
+def test_rolled_back_change_does_not_invalidate(client):
+    with app.app_context():
+        user = User.query.filter_by(username='admin').first()
+        before = invalidations()
+
+        user.full_name = 'Administrador (rollback)'
+        db.session.flush()
+        db.session.rollback()
+        db.session.commit()
+        assert invalidations() == before
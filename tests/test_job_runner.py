@@ -0,0 +1,77 @@
+# Archivo: tests/test_job_runner.py
+# Tope de trabajos por limit_group: admisiones concurrentes desde varios runners (uno por proceso)
+# sobre la misma base de datos y el lock por grupo de cada motor.
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+
+from job_runner import JobLimitError, JobRunner, lock_limit_group, unlock_limit_group
+
+def test_max_active_holds_across_runners(tmp_path):
+    url = f"sqlite:///{tmp_path / 'jobs.db'}"
+    runners = []
+    for _ in range(8):
+        engine = create_engine(url, connect_args={'timeout': 30})
+        runners.append(JobRunner(lambda engine=engine: engine, max_workers=1))
+    runners[0].ensure_table()
+
+    start = threading.Barrier(len(runners))
+    admitted, rejected = [], []
+
+    def admit(runner):
+        start.wait()
+        try:
+            admitted.append(runner.track('audit', limit_group='audit', max_active=2))
+        except JobLimitError:
+            rejected.append(runner)
+
+    threads = [threading.Thread(target=admit, args=(runner,)) for runner in runners]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(admitted) == 2
+    assert len(rejected) == len(runners) - 2
+    assert runners[0].count_active('audit') == 2
+
+class RecordingConnection:
+    """Conexión falsa que registra las sentencias que recibe"""
+
+    def __init__(self, dialect, scalar=1):
+        self.dialect = SimpleNamespace(name=dialect)
+        self.statements = []
+        self.commits = 0
+        self._scalar = scalar
+
+    def execute(self, statement, params=None):
+        self.statements.append((str(statement), params))
+        return SimpleNamespace(scalar=lambda: self._scalar)
+
+    def commit(self):
+        self.commits += 1
+
+def test_postgresql_takes_transaction_advisory_lock():
+    connection = RecordingConnection('postgresql')
+    lock_limit_group(connection, 'audit')
+    unlock_limit_group(connection, 'audit')
+
+    assert [sql for sql, _ in connection.statements] == ['SELECT pg_advisory_xact_lock(:key)']
+    assert connection.commits == 0
+
+def test_mysql_takes_named_lock_and_releases_it_after_commit():
+    connection = RecordingConnection('mysql')
+    lock_limit_group(connection, 'audit')
+    unlock_limit_group(connection, 'audit')
+
+    assert [sql for sql, _ in connection.statements] == [
+        'SELECT GET_LOCK(:name, :timeout)', 'SELECT RELEASE_LOCK(:name)'
+    ]
+    assert connection.commits == 1
+
+def test_mysql_lock_timeout_is_a_limit_error():
+    with pytest.raises(JobLimitError):
+        lock_limit_group(RecordingConnection('mysql', scalar=0), 'audit')
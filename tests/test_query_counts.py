@@ -0,0 +1,78 @@
+# Archivo: tests/test_query_counts.py
+# Regresión del número de consultas de los listados: una página cuesta las mismas consultas sin
+# importar cuántas facturas contiene (sin una consulta perezosa por factura).
+
+import pytest
+from app import response_cache
+
+def create_invoices(client, auth_headers, prefix, count):
+    response = client.post('/invoices/batch', headers=auth_headers, json=[
+        {
+            'invoice_number': f'{prefix}-{number}',
+            'company_name': 'Empresa de prueba',
+            'company_nit': '900123456',
+            'subtotal': 100 + number
+        }
+        for number in range(count)
+    ])
+    assert response.status_code == 201, response.get_json()
+    return [item['invoice_id'] for item in response.get_json()['created']]
+
+def queries_for(client, auth_headers, count_queries, path):
+    """Sentencias de una solicitud GET a path (sin la caché de respuestas) y su respuesta"""
+    client.get(path, headers=auth_headers)  # Calienta la caché de identidades
+    response_cache.invalidate()
+    with count_queries() as queries:
+        response = client.get(path, headers=auth_headers)
+    assert response.status_code == 200, response.get_json()
+    return queries, response.get_json()
+
+# Tamaño de las páginas grandes; el lote de prueba alcanza para una segunda página completa
+LARGE_PAGE = 20
+
+@pytest.fixture(scope='module')
+def invoice_ids(client, auth_headers):
+    return create_invoices(client, auth_headers, 'QUERIES', LARGE_PAGE + 10)
+
+def second_page_cursor(client, auth_headers, path):
+    """Cursor de la segunda página keyset (después de la factura más reciente)"""
+    response = client.get(path.format(1), headers=auth_headers)
+    return response.get_json()['pagination']['next_cursor']
+
+@pytest.mark.parametrize('mode', ['keyset', 'cursor', 'page'])
+@pytest.mark.parametrize('path, items_key', [
+    ('/invoices?per_page={}', 'invoices'),
+    ('/blockchain/ledger?per_page={}', 'ledger'),
+    ('/invoices/search?company_name=Empresa&per_page={}', 'invoices')
+])
+def test_list_query_count_is_constant(client, auth_headers, count_queries, invoice_ids, path, items_key, mode):
+    if mode == 'cursor':
+        path += f'&cursor={second_page_cursor(client, auth_headers, path)}'
+    elif mode == 'page':
+        path += '&page=1'
+
+    small_queries, small_page = queries_for(client, auth_headers, count_queries, path.format(1))
+    large_queries, large_page = queries_for(client, auth_headers, count_queries, path.format(LARGE_PAGE))
+
+    assert len(small_page[items_key]) == 1
+    assert len(large_page[items_key]) == LARGE_PAGE
+    assert all(item['distribution'] for item in large_page[items_key])
+    assert len(large_queries) == len(small_queries)
+    assert len(large_queries) <= 4
+
+def test_stats_recent_transactions_load_distributions_once(client, auth_headers, count_queries, invoice_ids):
+    queries, stats = queries_for(client, auth_headers, count_queries, '/blockchain/stats')
+    distribution_queries = [statement for statement in queries.statements if 'FROM iva_distributions' in statement]
+
+    assert len(stats['recent_transactions']) == 5
+    assert all(item['distribution'] for item in stats['recent_transactions'])
+    assert len(distribution_queries) == 1
+    assert len(queries) <= 4
+
+def test_invoice_detail_query_count_is_constant(client, auth_headers, count_queries, invoice_ids):
+    first_queries, first = queries_for(client, auth_headers, count_queries, f'/invoices/{invoice_ids[0]}')
+    last_queries, last = queries_for(client, auth_headers, count_queries, f'/invoices/{invoice_ids[-1]}')
+
+    assert first['distribution'] and last['distribution']
+    assert len(first_queries) == len(last_queries)
+    assert len(last_queries) <= 3